@@ -0,0 +1,96 @@
+"""Compares memory allocated per captcha by the ways of decoding one
+
+Starting from the raw body of a generate response, each path ends with the
+`BytesIO` handed to `discord.File`:
+
+    legacy  JSON body, `[22:]` slice, `b64decode`, `BytesIO(bytes)`
+    uri     JSON body, `decode_data_uri` (freeing the URI), `BytesIO(bytes)`
+    binary  raw image body, `BytesIO(bytes)`
+
+Run from `src/`:
+    python -m benchmarks.captcha_decoding --size 12000 --captchas 2000
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import time
+import tracemalloc
+import uuid
+from io import BytesIO
+
+from captcha.base import decode_data_uri
+
+
+def legacy(body: bytes) -> BytesIO:
+    captcha_json = json.loads(body)
+    captcha_base64 = captcha_json["captcha"][22:]
+    captcha_bytes = base64.b64decode(captcha_base64)
+
+    return BytesIO(captcha_bytes)
+
+
+def uri(body: bytes) -> BytesIO:
+    data = json.loads(body)
+    _, captcha_bytes = decode_data_uri(data.pop("captcha"))
+
+    return BytesIO(captcha_bytes)
+
+
+def binary(body: bytes) -> BytesIO:
+    return BytesIO(body)
+
+
+def measure(path, body: bytes, captchas: int):
+    """Returns the peak bytes allocated and the µs taken per captcha"""
+
+    peaks = []
+    timings = []
+    for _ in range(captchas):
+        tracemalloc.start()
+        started_at = time.perf_counter()
+
+        buffer = path(body)
+
+        timings.append((time.perf_counter() - started_at) * 1_000_000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        del buffer
+
+    return statistics.mean(peaks), statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=12000, help="image bytes")
+    parser.add_argument("--captchas", type=int, default=2000)
+    args = parser.parse_args()
+
+    image = os.urandom(args.size)
+    json_body = json.dumps(
+        {
+            "uuid": str(uuid.uuid4()),
+            "captcha": "data:image/png;base64," + base64.b64encode(image).decode(),
+        }
+    ).encode()
+
+    # every path has to end up with the same image
+    for path, body in ((legacy, json_body), (uri, json_body), (binary, image)):
+        assert path(body).getvalue() == image
+
+    print(f"image: {args.size} bytes, JSON body: {len(json_body)} bytes")
+
+    for path, body in ((legacy, json_body), (uri, json_body), (binary, image)):
+        peak, timing = measure(path, body, args.captchas)
+
+        print(
+            f"{path.__name__:<6} peak allocated: {peak:>9.0f} bytes "
+            f"({peak / args.size:.2f}x image)  time: {timing:.1f}µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
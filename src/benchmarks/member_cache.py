@@ -0,0 +1,130 @@
+"""Compares the resident memory of the member cache policies
+
+Builds synthetic guilds inside a discord.py `ConnectionState`, configured the
+way `get_member_cache_settings` configures the bot, and feeds them members the
+way startup chunking would. Every policy runs in a fresh process, the RSS
+growth from loading the guilds is reported.
+
+Run from `src/`:
+    python -m benchmarks.member_cache --guilds 200 --members 2000
+
+LAZY ends up like FULL for every guild which had a verification, so only the
+two ends are measured.
+"""
+
+import argparse
+import asyncio
+import gc
+import multiprocessing
+
+import discord
+from discord.state import ConnectionState
+
+from utils.members import MemberCachePolicy, get_member_cache_settings
+
+
+def get_rss() -> int:
+    """Returns the resident set size of this process, in bytes"""
+
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+
+    return 0
+
+
+def build_state(policy: MemberCachePolicy) -> ConnectionState:
+    intents = discord.Intents.default()
+    intents.members = True
+
+    settings = get_member_cache_settings(policy, intents)
+
+    return ConnectionState(
+        dispatch=lambda *args, **kwargs: None,
+        handlers={},
+        hooks={},
+        syncer=None,
+        http=None,
+        loop=asyncio.new_event_loop(),
+        intents=intents,
+        member_cache_flags=settings["member_cache_flags"],
+        chunk_guilds_at_startup=settings["chunk_guilds_at_startup"],
+    )
+
+
+def member_payload(user_id: int) -> dict:
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"member-{user_id}",
+            "discriminator": f"{user_id % 10000:04d}",
+            "avatar": "a" * 32,
+            "bot": user_id % 50 == 0,
+        },
+        "roles": [],
+        "joined_at": "2021-01-01T00:00:00.000000+00:00",
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def load_guilds(policy: MemberCachePolicy, guild_count: int, member_count: int):
+    """Loads the guilds, in a fresh process, and reports the RSS growth"""
+
+    state = build_state(policy)
+    gc.collect()
+    rss_before = get_rss()
+
+    user_ids = iter(range(10**17, 10**18))
+    for guild_id in range(1, guild_count + 1):
+        guild = discord.Guild(
+            data={
+                "id": str(guild_id),
+                "name": f"guild-{guild_id}",
+                "member_count": member_count,
+                "roles": [
+                    {"id": str(guild_id), "name": "@everyone", "permissions": "0"}
+                ],
+            },
+            state=state,
+        )
+        state._add_guild(guild)
+
+        # what a member chunk does: members are built either way, but only
+        # kept when the cache flags ask for it
+        for _ in range(member_count):
+            member = discord.Member(
+                data=member_payload(next(user_ids)), guild=guild, state=state
+            )
+
+            if state.member_cache_flags.joined:
+                guild._add_member(member)
+
+    gc.collect()
+    rss_after = get_rss()
+
+    cached = sum(len(guild._members) for guild in state.guilds)
+    print(
+        f"{policy.value:<8} cached members: {cached:>8}  "
+        f"RSS growth: {(rss_after - rss_before) / 1024 ** 2:8.1f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--members", type=int, default=2000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for policy in (MemberCachePolicy.FULL, MemberCachePolicy.MINIMAL):
+        process = context.Process(
+            target=load_guilds, args=(policy, args.guilds, args.members)
+        )
+        process.start()
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
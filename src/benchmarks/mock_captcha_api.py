@@ -0,0 +1,192 @@
+"""Stand-in for the captcha API, serving `generate` and `verify` offline
+
+Every captcha has the same answer (`--answer`), so simulated members know what
+to reply. Responses can be slowed down (`--latency`, `--jitter`), made to fail
+(`--error-rate`) and sized (`--payload-size`). Clients sending
+`Accept: image/*` get raw image bytes with the UUID in a header (binary mode),
+everyone else gets JSON with a data URI.
+
+Run from `src/`:
+    python -m benchmarks.mock_captcha_api --port 8080 --latency 0.05
+
+then point `SOTERIA_CAPTCHA_API_URL` at `http://127.0.0.1:8080/`.
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import random
+import time
+import typing
+import uuid
+
+from aiohttp import web
+
+# Signature of a PNG, so the payload at least looks like one
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class MockCaptchaApi:
+    """State and handlers of the mock captcha API
+
+    Parameters
+    ----------
+    answer : str
+        Answer to every captcha
+    latency : float
+        Seconds every request takes at least
+    jitter : float
+        Random extra seconds, up to this much
+    error_rate : float
+        Share of requests answered with a 500, 0 to 1
+    payload_size : int
+        Bytes of every captcha image
+    ttl : float
+        Seconds a UUID can be verified in
+    uuid_header : str
+        Header carrying the UUID of binary responses
+    """
+
+    def __init__(
+        self,
+        answer: str = "soteria",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        payload_size: int = 12000,
+        ttl: float = 300.0,
+        uuid_header: str = "X-Captcha-UUID",
+    ):
+        self.answer = answer
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.ttl = ttl
+        self.uuid_header = uuid_header
+
+        # generated once, the contents don't matter to anyone
+        self.image = PNG_SIGNATURE + os.urandom(max(payload_size - 8, 0))
+        self.data_uri = "data:image/png;base64," + base64.b64encode(self.image).decode()
+
+        # UUID -> monotonic time it expires at
+        self._pending: typing.Dict[str, float] = {}
+
+        self.generated = 0
+        self.verified = 0
+        self.errors = 0
+
+    async def _delay(self) -> bool:
+        """Waits out the configured latency, returns True if the request should fail"""
+
+        if delay := self.latency + random.uniform(0, self.jitter):
+            await asyncio.sleep(delay)
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return True
+
+        return False
+
+    async def generate(self, request: web.Request) -> web.Response:
+        if await self._delay():
+            return web.Response(status=500, text="Injected error")
+
+        captcha_uuid = str(uuid.uuid4())
+        self._pending[captcha_uuid] = time.monotonic() + self.ttl
+        self.generated += 1
+
+        if "image/" in request.headers.get("Accept", ""):
+            return web.Response(
+                body=self.image,
+                content_type="image/png",
+                headers={self.uuid_header: captcha_uuid},
+            )
+
+        return web.json_response({"uuid": captcha_uuid, "captcha": self.data_uri})
+
+    async def verify(self, request: web.Request) -> web.Response:
+        if await self._delay():
+            return web.Response(status=500, text="Injected error")
+
+        data = await request.json()
+        self.verified += 1
+
+        # UUIDs are single use, like the real API
+        expires_at = self._pending.pop(data.get("uuid"), 0)
+        if expires_at < time.monotonic() or data.get("captcha") != self.answer:
+            return web.Response(status=400, text="Invalid captcha")
+
+        return web.Response(text="OK")
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/generate", self.generate)
+        app.router.add_post("/verify", self.verify)
+
+        return app
+
+    def stats(self) -> dict:
+        return {
+            "generated": self.generated,
+            "verified": self.verified,
+            "errors": self.errors,
+            "pending": len(self._pending),
+        }
+
+
+async def start_server(
+    api: MockCaptchaApi, host: str = "127.0.0.1", port: int = 0
+) -> typing.Tuple[web.AppRunner, str]:
+    """Serves the mock API in the running loop, returns the runner and base URL
+
+    Port 0 picks a free port.
+    """
+
+    runner = web.AppRunner(api.create_app(), access_log=None)
+    await runner.setup()
+
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}/"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Adds the mock API's options to a parser, shared with the load harness"""
+
+    parser.add_argument("--answer", default="soteria")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="0 to 1")
+    parser.add_argument("--payload-size", type=int, default=12000, help="bytes")
+
+
+def from_arguments(args: argparse.Namespace) -> MockCaptchaApi:
+    return MockCaptchaApi(
+        answer=args.answer,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        payload_size=args.payload_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    web.run_app(
+        from_arguments(args).create_app(),
+        host=args.host,
+        port=args.port,
+        access_log=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Compares full settings fetch latency of the EAV and JSONB settings layouts
+
+Fills a database with guilds having every config set, stored in both layouts,
+then times fetching complete `GuildSettings` snapshots under each layout.
+
+Run from `src/`:
+    python -m benchmarks.settings_layout --guilds 2000 --fetches 5000
+
+Uses an in-memory sqlite database unless `--db-uri` (e.g. a scratch postgres
+database, tables get created there) is given.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from tortoise import Tortoise, run_async
+
+from models import (
+    Config,
+    ConfigType,
+    Guild,
+    GuildSettings,
+    migrate_configs_to_settings,
+)
+
+SAMPLE_VALUES = {
+    ConfigType.VERIFICATION_CHANNEL: {"value_int": 800000000000000001},
+    ConfigType.VERIFIED_ROLE: {"value_int": 800000000000000002},
+    ConfigType.VERIFICATION_MESSAGE_START: {"value_str": "Welcome to {guild_name}!"},
+    ConfigType.VERIFICATION_MESSAGE_SUCCESS: {"value_str": "You're in, {member_name}"},
+    ConfigType.REACTION_CHANNEL: {"value_int": 800000000000000003},
+    ConfigType.REACTION_MESSAGE: {"value_int": 800000000000000004},
+    ConfigType.REACTION_EMOJI: {"value_bool": True, "value_str": "✅"},
+}
+
+
+async def populate(guild_count: int):
+    """Creates guilds with every config set, in both layouts"""
+
+    await Guild.bulk_create(
+        [
+            Guild(id=guild_id, name=f"guild-{guild_id}", owner_id=1, bot_prefix="s!")
+            for guild_id in range(1, guild_count + 1)
+        ]
+    )
+
+    await Config.bulk_create(
+        [
+            Config(guild_id=guild_id, type_=type_, **values)
+            for guild_id in range(1, guild_count + 1)
+            for type_, values in SAMPLE_VALUES.items()
+        ]
+    )
+
+    await migrate_configs_to_settings()
+
+
+async def time_fetches(loader, guild_count: int, fetches: int) -> list:
+    """Returns the latencies in ms of fetching random guilds' settings"""
+
+    latencies = []
+    for _ in range(fetches):
+        guild_id = random.randint(1, guild_count)
+
+        started_at = time.perf_counter()
+        settings = await loader(guild_id)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+
+        assert len(settings.configs) == len(SAMPLE_VALUES)
+
+    return latencies
+
+
+def summarize(name: str, latencies: list):
+    latencies = sorted(latencies)
+
+    print(
+        f"{name:<6} mean: {statistics.mean(latencies):.3f}ms  "
+        f"p50: {latencies[len(latencies) // 2]:.3f}ms  "
+        f"p99: {latencies[int(len(latencies) * 0.99)]:.3f}ms"
+    )
+
+
+async def run(args: argparse.Namespace):
+    await Tortoise.init(db_url=args.db_uri, modules={"models": ["models"]})
+    await Tortoise.generate_schemas(safe=True)
+
+    await populate(args.guilds)
+
+    # warm up both paths, so connection setup isn't measured
+    await time_fetches(GuildSettings._load_from_configs, args.guilds, 50)
+    await time_fetches(GuildSettings._load_from_document, args.guilds, 50)
+
+    summarize(
+        "EAV",
+        await time_fetches(GuildSettings._load_from_configs, args.guilds, args.fetches),
+    )
+    summarize(
+        "JSONB",
+        await time_fetches(
+            GuildSettings._load_from_document, args.guilds, args.fetches
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-uri", default="sqlite://:memory:")
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument("--fetches", type=int, default=5000)
+
+    run_async(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""Drives concurrent verifications through the `Verify` cog, entirely offline
+
+Members join fake guilds (DM verification), get their captcha from a real
+`CaptchaPool` backed by the mock captcha API, reply after a think time and get
+verified, while events and stats are written to an in-memory sqlite database
+set up by the migrations. Reports throughput and join to verified latencies.
+
+Run from `src/`:
+    python -m benchmarks.verification_load --members 5000 --latency 0.05
+
+A share of members (`--fail-rate`) answers wrong once and then gives up.
+`--endpoints` mock APIs are started in-process, with requests routed over
+them. Pass `--api-url` to use already running (mock) captcha APIs instead.
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+import typing
+
+from tortoise import Tortoise, run_async
+
+from benchmarks import mock_captcha_api
+from captcha import (
+    CaptchaApiClient,
+    CaptchaApiRouter,
+    HttpCaptchaBackend,
+    RoutingPolicy,
+)
+from cogs.verify import Verify
+from migrations import migrate
+from models import (
+    Config,
+    ConfigType,
+    Guild,
+    VerificationEvent,
+    VerificationEventType,
+    VerificationMethod,
+)
+from utils.captcha_pool import CaptchaPool
+from utils.db import get_tortoise_config
+from utils.embeds import EmbedGen
+from utils.events import EventBuffer
+from utils.members import MemberCachePolicy, MemberCounter
+from utils.stats import StatsRecorder
+
+_ids = itertools.count(800000000000000000)
+
+
+class FakeClientUser:
+    avatar_url = ""
+
+
+class FakeRole:
+    def __init__(self, name: str):
+        self.id = next(_ids)
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+
+class FakeMessage:
+    def __init__(self, author, channel, content: str):
+        self.author = author
+        self.channel = channel
+        self.content = content
+
+
+class FakeDMChannel:
+    """DM channel of a simulated member, replying to whatever the bot sends"""
+
+    def __init__(self, member: "FakeMember"):
+        self.id = next(_ids)
+        self.member = member
+
+    async def send(self, content=None, embed=None, file=None):
+        self.member.on_bot_message(self, embed, file)
+
+
+class FakeMember:
+    """Simulated member, answering captchas like a human would (but faster)"""
+
+    bot = False
+    discriminator = "0001"
+    avatar_url = ""
+
+    def __init__(self, harness: "LoadHarness", guild: "FakeGuild", answer: str):
+        self.harness = harness
+        self.guild = guild
+        self.answer = answer
+
+        self.id = next(_ids)
+        self.name = f"member-{self.id}"
+        self.mention = f"<@{self.id}>"
+        self.roles = []
+        self.dm_channel = None
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+    async def create_dm(self) -> FakeDMChannel:
+        if self.dm_channel is None:
+            self.dm_channel = FakeDMChannel(self)
+
+        return self.dm_channel
+
+    async def add_roles(self, *roles, reason=None):
+        self.roles.extend(roles)
+
+    def on_bot_message(self, channel, embed, file):
+        if file is not None:
+            self.harness.received_bytes += len(file.fp.getbuffer())
+            self.reply(channel, self.answer)
+        elif embed is not None and embed.title.startswith("Verification Failed"):
+            self.reply(channel, "N")
+
+    def reply(self, channel, content: str):
+        asyncio.ensure_future(
+            self.harness.bot.dispatch_message(
+                FakeMessage(self, channel, content), self.harness.think_time
+            )
+        )
+
+
+class FakeGuild:
+    def __init__(self, verified_role: FakeRole):
+        self.id = next(_ids)
+        self.name = f"guild-{self.id}"
+        self.verified_role = verified_role
+        self.chunked = True
+
+        self._members: typing.Dict[int, FakeMember] = {}
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def add_member(self, member: FakeMember):
+        self._members[member.id] = member
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    def get_role(self, role_id: int):
+        return self.verified_role if role_id == self.verified_role.id else None
+
+
+class FakeBot:
+    """The parts of `Soteria` the `Verify` cog touches, with real captcha and
+    logging components and an in-process message dispatch"""
+
+    def __init__(self, captcha_backend, pool_size: int):
+        self.embed_gen = EmbedGen()
+        self.member_counter = MemberCounter(MemberCachePolicy.FULL)
+        self.user = FakeClientUser()
+
+        self.captcha_backend = captcha_backend
+        self.captcha_pool = CaptchaPool(
+            self._new_captcha,
+            low_watermark=pool_size // 5,
+            high_watermark=pool_size,
+        )
+        self.verification_events = EventBuffer(
+            VerificationEvent,
+            ["guild_id", "user_id", "type_", "method", "created_at"],
+        )
+        self.verification_stats = StatsRecorder()
+
+        # (check, future) of pending `wait_for("message")` calls
+        self._waiters: typing.List[tuple] = []
+
+    async def _new_captcha(self):
+        captcha = await self.captcha_backend.new()
+        captcha.decode()
+
+        return captcha
+
+    async def wait_for(self, event: str, check=None, timeout=None):
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append((check, future))
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters = [w for w in self._waiters if w[1] is not future]
+
+    async def dispatch_message(self, message: FakeMessage, delay: float = 0.0):
+        """Resolves the waiters a message passes the check of, like discord.py does"""
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        for check, future in self._waiters:
+            if not future.done() and (check is None or check(message)):
+                future.set_result(message)
+
+
+class LoadHarness:
+    def __init__(self, args: argparse.Namespace, bot: FakeBot):
+        self.args = args
+        self.bot = bot
+        self.cog = Verify(bot)
+        self.think_time = args.think_time
+
+        self.guilds: typing.List[FakeGuild] = []
+        self.latencies: typing.List[float] = []
+        self.errors = 0
+        self.received_bytes = 0
+
+    async def create_guilds(self):
+        for _ in range(self.args.guilds):
+            guild = FakeGuild(FakeRole("Verified"))
+            self.guilds.append(guild)
+
+            db_guild = await Guild.create(
+                id=guild.id,
+                name=guild.name,
+                owner_id=1,
+                bot_prefix="s!",
+                verification_method=VerificationMethod.DM,
+            )
+            await Config.set_value_int(
+                db_guild, ConfigType.VERIFIED_ROLE, guild.verified_role.id
+            )
+
+    async def join(self, semaphore: asyncio.Semaphore):
+        guild = random.choice(self.guilds)
+        wrong = random.random() < self.args.fail_rate
+        member = FakeMember(self, guild, "wrong" if wrong else self.args.answer)
+        guild.add_member(member)
+
+        async with semaphore:
+            started_at = time.perf_counter()
+
+            try:
+                await self.cog.handle_joins(member)
+            except Exception:
+                self.errors += 1
+                return
+
+            self.latencies.append((time.perf_counter() - started_at) * 1000)
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.args.concurrency or self.args.members)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(self.join(semaphore) for _ in range(self.args.members)))
+
+        return time.perf_counter() - started_at
+
+
+def summarize(harness: LoadHarness, elapsed: float):
+    latencies = sorted(harness.latencies)
+
+    print(
+        f"verifications: {len(latencies)} in {elapsed:.2f}s "
+        f"({len(latencies) / elapsed:.1f}/s), errors: {harness.errors}"
+    )
+
+    if latencies:
+        print(
+            f"latency mean: {statistics.mean(latencies):.1f}ms  "
+            f"p50: {latencies[len(latencies) // 2]:.1f}ms  "
+            f"p99: {latencies[int(len(latencies) * 0.99)]:.1f}ms  "
+            f"max: {latencies[-1]:.1f}ms"
+        )
+
+    print(f"captcha bytes uploaded: {harness.received_bytes}")
+
+
+async def run(args: argparse.Namespace):
+    await Tortoise.init(config=get_tortoise_config(args.db_uri))
+    await migrate()
+
+    runners = []
+    apis = []
+    if args.api_url:
+        api_urls = args.api_url.split(",")
+    else:
+        api_urls = []
+        for _ in range(args.endpoints):
+            apis.append(api := mock_captcha_api.from_arguments(args))
+            runner, api_url = await mock_captcha_api.start_server(api)
+
+            runners.append(runner)
+            api_urls.append(api_url)
+
+    bot = FakeBot(
+        HttpCaptchaBackend(
+            CaptchaApiRouter(
+                [
+                    CaptchaApiClient(
+                        api_url,
+                        max_connections=args.max_connections,
+                        binary=args.binary,
+                    )
+                    for api_url in api_urls
+                ],
+                policy=RoutingPolicy(args.routing.upper()),
+            )
+        ),
+        pool_size=args.pool_size,
+    )
+    harness = LoadHarness(args, bot)
+
+    try:
+        await harness.create_guilds()
+
+        bot.verification_events.start()
+        bot.verification_stats.start()
+        if args.pool_size:
+            # start with a full pool, like a bot which has been up for a while
+            await bot.captcha_pool.refill()
+            bot.captcha_pool.start()
+
+        elapsed = await harness.run()
+    finally:
+        await bot.captcha_pool.close()
+        await bot.verification_events.close()
+        await bot.verification_stats.close()
+        await bot.captcha_backend.close()
+
+        for runner in runners:
+            await runner.cleanup()
+
+    summarize(harness, elapsed)
+
+    passed = await VerificationEvent.filter(type_=VerificationEventType.PASSED).count()
+    failed = await VerificationEvent.filter(type_=VerificationEventType.FAILED).count()
+    print(
+        f"events logged: {await VerificationEvent.all().count()} "
+        f"(passed: {passed}, failed: {failed})"
+    )
+
+    for name, stats in (
+        ("pool", bot.captcha_pool.stats()),
+        ("router", bot.captcha_backend.stats()),
+        *bot.captcha_backend.endpoint_stats().items(),
+        *((f"mock api {i}", api.stats()) for i, api in enumerate(apis)),
+    ):
+        print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-uri", default="sqlite://:memory:")
+    parser.add_argument(
+        "--api-url", help="comma separated captcha APIs to use, mocks by default"
+    )
+    parser.add_argument("--endpoints", type=int, default=1, help="mock APIs to start")
+    parser.add_argument(
+        "--routing",
+        default=RoutingPolicy.LEAST_OUTSTANDING.value,
+        choices=[policy.value.lower() for policy in RoutingPolicy],
+        type=str.lower,
+    )
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument(
+        "--concurrency", type=int, default=0, help="verifications in flight, 0 for all"
+    )
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="0 to 1")
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--max-connections", type=int, default=20)
+    parser.add_argument("--binary", action="store_true")
+    mock_captcha_api.add_arguments(parser)
+
+    run_async(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import typing
+from enum import Enum
+
+from captcha.base import Captcha, CaptchaBackend
+from captcha.client import CaptchaApiClient, CircuitBreaker, CircuitOpenError
+from captcha.http import HttpCaptchaBackend
+from captcha.local import LocalCaptchaBackend
+from captcha.optimize import ImageFormat, ImageOptimizer
+from captcha.router import CaptchaApiRouter, RoutingPolicy
+
+
+class CaptchaBackendType(str, Enum):
+    """An `Enum` storing the available captcha backends
+
+    HTTP: Generate and verify through the captcha API
+    LOCAL: Render captchas in-process, verify against an in-memory store
+    """
+
+    HTTP = "HTTP"
+    LOCAL = "LOCAL"
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Creates a circuit breaker, tuned through environment variables"""
+
+    return CircuitBreaker(
+        failure_threshold=int(
+            os.getenv("SOTERIA_CAPTCHA_BREAKER_THRESHOLD", default="5")
+        ),
+        reset_timeout=float(os.getenv("SOTERIA_CAPTCHA_BREAKER_TIMEOUT", default="30")),
+    )
+
+
+def get_captcha_api_client(base_url: str) -> CaptchaApiClient:
+    """Creates a captcha API client, tuned through environment variables"""
+
+    hedge_delay = os.getenv("SOTERIA_CAPTCHA_HEDGE_DELAY")
+
+    return CaptchaApiClient(
+        base_url,
+        connect_timeout=float(
+            os.getenv("SOTERIA_CAPTCHA_CONNECT_TIMEOUT", default="2")
+        ),
+        read_timeout=float(os.getenv("SOTERIA_CAPTCHA_READ_TIMEOUT", default="5")),
+        max_connections=int(os.getenv("SOTERIA_CAPTCHA_MAX_CONNECTIONS", default="20")),
+        retries=int(os.getenv("SOTERIA_CAPTCHA_RETRIES", default="2")),
+        hedge_delay=float(hedge_delay) if hedge_delay else None,
+        binary=os.getenv("SOTERIA_CAPTCHA_BINARY") == "1",
+        uuid_header=os.getenv("SOTERIA_CAPTCHA_UUID_HEADER", default="X-Captcha-UUID"),
+        breaker=get_circuit_breaker(),
+        verify_breaker=get_circuit_breaker(),
+    )
+
+
+def get_captcha_backend_type() -> CaptchaBackendType:
+    """Returns the captcha backend picked by `SOTERIA_CAPTCHA_BACKEND`, HTTP by default"""
+
+    return CaptchaBackendType(
+        os.getenv("SOTERIA_CAPTCHA_BACKEND", default=CaptchaBackendType.HTTP).upper()
+    )
+
+
+def get_captcha_api_urls() -> typing.List[str]:
+    """Returns the captcha API URLs from `SOTERIA_CAPTCHA_API_URL`
+
+    Several comma separated instances get requests spread over them.
+    """
+
+    urls = os.getenv("SOTERIA_CAPTCHA_API_URL", default="").split(",")
+    return [url.strip() for url in urls if url.strip()]
+
+
+def get_captcha_backend(
+    ttl: float, backend_type: typing.Optional[CaptchaBackendType] = None
+) -> CaptchaBackend:
+    """Creates the captcha backend configured through environment variables
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds a captcha can be answered in (local backend)
+    backend_type : Optional[CaptchaBackendType]
+        Overrides `SOTERIA_CAPTCHA_BACKEND`
+
+    Raises `ValueError` if the HTTP backend is picked without any captcha API URL.
+    """
+
+    backend_type = backend_type or get_captcha_backend_type()
+
+    if backend_type == CaptchaBackendType.LOCAL:
+        max_workers = os.getenv("SOTERIA_CAPTCHA_WORKERS")
+
+        return LocalCaptchaBackend(
+            ttl=ttl,
+            max_workers=int(max_workers) if max_workers else None,
+            font_path=os.getenv("SOTERIA_CAPTCHA_FONT"),
+        )
+
+    if not (urls := get_captcha_api_urls()):
+        raise ValueError(
+            "SOTERIA_CAPTCHA_API_URL is not set, the HTTP captcha backend needs "
+            "the captcha API's URL (or use SOTERIA_CAPTCHA_BACKEND=LOCAL)"
+        )
+
+    return HttpCaptchaBackend(
+        CaptchaApiRouter(
+            [get_captcha_api_client(url) for url in urls],
+            policy=RoutingPolicy(
+                os.getenv(
+                    "SOTERIA_CAPTCHA_ROUTING", default=RoutingPolicy.LEAST_OUTSTANDING
+                ).upper()
+            ),
+        )
+    )
+
+
+def get_captcha_optimizer() -> typing.Optional[ImageOptimizer]:
+    """Creates the image optimizer configured through environment variables
+
+    Returns `None` unless `SOTERIA_CAPTCHA_OPTIMIZE` names a format.
+    """
+
+    if not (image_format := os.getenv("SOTERIA_CAPTCHA_OPTIMIZE")):
+        return
+
+    return ImageOptimizer(
+        image_format=ImageFormat(image_format.upper()),
+        colors=int(os.getenv("SOTERIA_CAPTCHA_OPTIMIZE_COLORS", default="32")),
+        quality=int(os.getenv("SOTERIA_CAPTCHA_OPTIMIZE_QUALITY", default="70")),
+    )
+
+
+__all__ = (
+    "Captcha",
+    "CaptchaApiClient",
+    "CaptchaApiRouter",
+    "CaptchaBackend",
+    "CaptchaBackendType",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "HttpCaptchaBackend",
+    "ImageFormat",
+    "ImageOptimizer",
+    "LocalCaptchaBackend",
+    "RoutingPolicy",
+    "get_captcha_api_client",
+    "get_captcha_api_urls",
+    "get_captcha_backend",
+    "get_captcha_backend_type",
+    "get_captcha_optimizer",
+)
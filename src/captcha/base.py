@@ -0,0 +1,133 @@
+import binascii
+import mimetypes
+import typing
+
+from io import BytesIO
+
+import discord
+
+# MIME type -> file extension, `mimetypes` guesses anything else
+IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+
+
+def get_image_extension(mime_type: str) -> str:
+    """Returns the file extension (without the dot) for an image MIME type"""
+
+    if mime_type in IMAGE_EXTENSIONS:
+        return IMAGE_EXTENSIONS[mime_type]
+
+    extension = mimetypes.guess_extension(mime_type)
+    return extension[1:] if extension else "png"
+
+
+def decode_data_uri(data_uri: str) -> typing.Tuple[str, bytes]:
+    """Decodes a base64 data URI, returns its MIME type and the decoded bytes
+
+    `binascii.a2b_base64` reads an ASCII string in place, but slicing the
+    payload off the header copies it once (as would encoding it to bytes for a
+    `memoryview`). That copy is freed as soon as it's decoded.
+
+    Raises `ValueError` if `data_uri` isn't a base64 data URI.
+    """
+
+    if not data_uri.startswith("data:"):
+        raise ValueError("Not a data URI")
+
+    comma = data_uri.find(",", 5)
+    if comma == -1:
+        raise ValueError("Data URI without data")
+
+    mime_type, _, encoding = data_uri[5:comma].rpartition(";")
+    if encoding != "base64":
+        raise ValueError("Data URI isn't base64 encoded")
+
+    try:
+        return mime_type or "text/plain", binascii.a2b_base64(data_uri[comma + 1 :])
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 in data URI: {e}") from None
+
+
+class Captcha:
+    """Encapsulates all the captcha logic
+
+    Instances are created by a `CaptchaBackend`, which they go back to when
+    verifying an answer. Backends either set the image as `captcha_bytes` with
+    its `mime_type`, or as a `captcha_data_uri` for `decode` to turn into bytes.
+    """
+
+    # Constants
+    captcha_gen_endpoint = "generate"
+    captcha_verify_endpoint = "verify"
+    headers = {
+        "User-Agent": "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; Googlebot/2.1; +http://www.google.com/bot.html) Safari/537.36"
+    }
+
+    def __init__(self, backend: "CaptchaBackend" = None):
+        # Bind attributes
+        self.backend = backend
+        self.captcha_data_uri = None
+        self.captcha_uuid = None
+        self.captcha_bytes = None
+        # URL of the captcha API instance which generated it, if any
+        self.endpoint = None
+        self.mime_type = "image/png"
+
+    async def verify(self, user_response: str) -> bool:
+        """Verifies the instance with user response"""
+        return await self.backend.verify(self, user_response)
+
+    def decode(self) -> bytes:
+        """Decodes the captcha into bytes, dropping the data URI afterwards"""
+
+        if self.captcha_bytes is None:
+            self.mime_type, self.captcha_bytes = decode_data_uri(self.captcha_data_uri)
+            self.captcha_data_uri = None
+
+        return self.captcha_bytes
+
+    @property
+    def file_name(self) -> str:
+        """File name to upload the captcha as, with the extension of its type"""
+        return f"captcha.{get_image_extension(self.mime_type)}"
+
+    def get_discord_file(self, file_name: str = None) -> discord.File:
+        """Returns a `discord.File` object, named `file_name` by default
+
+        A `BytesIO` over `bytes` shares their buffer until written to, so this
+        doesn't copy the image.
+        """
+
+        return discord.File(
+            BytesIO(self.decode()), filename=file_name or self.file_name
+        )
+
+
+class CaptchaBackend:
+    """Base class of the ways captchas can be generated and verified
+
+    Subclasses implement `new` and `verify`.
+    """
+
+    async def new(self) -> Captcha:
+        """Generates a new captcha"""
+        raise NotImplementedError
+
+    async def verify(self, captcha: Captcha, user_response: str) -> bool:
+        """Checks a user's answer to a captcha generated by this backend"""
+        raise NotImplementedError
+
+    async def close(self):
+        """Releases whatever the backend holds on to"""
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        """Returns a dict of backend counters"""
+        return {}
+
+    def endpoint_stats(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Returns a dict of counters per captcha API endpoint, if there are any"""
+        return {}
@@ -0,0 +1,374 @@
+import asyncio
+import random
+import time
+import typing
+
+import aiohttp
+
+from captcha.base import Captcha
+from utils.metrics import LatencySamples
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request, while the captcha API is considered down"""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated failures, until a trial request succeeds again
+
+    After `failure_threshold` consecutive failures the circuit opens and every
+    request is refused for `reset_timeout` seconds. Then a single trial request
+    is let through (half-open), closing the circuit again if it succeeds. A
+    trial that doesn't end within `reset_timeout` seconds, or ends without an
+    answer (e.g. cancelled), doesn't keep the circuit half-open for good.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        Consecutive failures opening the circuit
+    reset_timeout : float
+        Seconds to stay open before a trial request
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = 0.0
+        self.times_opened = 0
+
+    def is_trial_due(self) -> bool:
+        """Returns a boolean signifying if a trial request may be let through
+
+        Either the circuit was open for `reset_timeout` seconds, or the last
+        trial request is still pending after as long.
+        """
+
+        if self.state == self.OPEN:
+            since = self.opened_at
+        elif self.state == self.HALF_OPEN:
+            since = self.trial_started_at
+        else:
+            return False
+
+        return time.monotonic() - since >= self.reset_timeout
+
+    def allow(self) -> bool:
+        """Returns a boolean signifying if a request may be made now"""
+
+        if self.state == self.CLOSED:
+            return True
+
+        if self.is_trial_due():
+            # let exactly one trial request through
+            self.state = self.HALF_OPEN
+            self.trial_started_at = time.monotonic()
+            return True
+
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_aborted(self):
+        """Reopens the circuit if the trial request ended without an answer
+
+        Other requests ending like this, e.g. cancelled ones, aren't counted.
+        """
+
+        if self.state == self.HALF_OPEN:
+            self.record_failure()
+
+
+class CaptchaApiClient:
+    """HTTP client dedicated to the captcha API
+
+    Has its own connection pool kept alive to the captcha host, strict connect
+    and read timeouts, jittered retries and optional hedging for (idempotent)
+    generate requests. Generate and verify requests each have their own
+    circuit breaker, which counts a failure once per call, not per attempt.
+
+    Parameters
+    ----------
+    base_url : str
+        Base URL of the captcha API, ending with a slash
+    connect_timeout : float
+        Seconds to wait for a connection
+    read_timeout : float
+        Seconds to wait for response data
+    max_connections : int
+        Connections kept to the captcha host
+    retries : int
+        Extra attempts of a failed generate request
+    hedge_delay : Optional[float]
+        Seconds after which a slow generate request is raced by a second one,
+        `None` disables hedging
+    breaker : Optional[CircuitBreaker]
+        Circuit breaker of generate requests, a default one if not given
+    verify_breaker : Optional[CircuitBreaker]
+        Circuit breaker of verify requests, a default one if not given
+    binary : bool
+        Asks the API for raw image bytes instead of JSON, JSON responses are
+        still understood
+    uuid_header : str
+        Response header carrying the UUID in binary mode
+    session : Optional[aiohttp.ClientSession]
+        Session to use instead of an own one, it won't be closed by `close`
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 5.0,
+        max_connections: int = 20,
+        retries: int = 2,
+        hedge_delay: typing.Optional[float] = None,
+        breaker: typing.Optional[CircuitBreaker] = None,
+        verify_breaker: typing.Optional[CircuitBreaker] = None,
+        binary: bool = False,
+        uuid_header: str = "X-Captcha-UUID",
+        session: typing.Optional[aiohttp.ClientSession] = None,
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.retries = retries
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.verify_breaker = verify_breaker or CircuitBreaker()
+        self.binary = binary
+        self.uuid_header = uuid_header
+
+        self.timeout = aiohttp.ClientTimeout(
+            total=connect_timeout + read_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+
+        self._session = session
+        self._owns_session = session is None
+
+        # route -> latency samples and counters
+        self.latencies: typing.Dict[str, LatencySamples] = {}
+        self.errors: typing.Dict[str, int] = {}
+        self.retried = 0
+        self.hedged = 0
+        self.rejected = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.max_connections,
+                    keepalive_timeout=60,
+                    ttl_dns_cache=300,
+                ),
+                headers=Captcha.headers,
+            )
+
+        return self._session
+
+    async def _request(
+        self,
+        method: str,
+        route: str,
+        parser: typing.Optional[
+            typing.Callable[[aiohttp.ClientResponse], typing.Awaitable]
+        ] = None,
+        **kwargs,
+    ) -> typing.Tuple[int, typing.Any]:
+        """Makes a single request, returns the status and body
+
+        The body of 200 responses is parsed by `parser` if given, otherwise
+        it's the raw bytes.
+
+        Connection errors, timeouts and 5xx responses are raised.
+        """
+
+        started_at = time.perf_counter()
+
+        try:
+            async with self._get_session().request(
+                method, self.base_url + route, timeout=self.timeout, **kwargs
+            ) as resp:
+                if resp.status >= 500:
+                    resp.raise_for_status()
+
+                if parser and resp.status == 200:
+                    data = await parser(resp)
+                else:
+                    data = await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.errors[route] = self.errors.get(route, 0) + 1
+            raise
+
+        self.latencies.setdefault(route, LatencySamples()).record(
+            (time.perf_counter() - started_at) * 1000
+        )
+
+        return status, data
+
+    async def _hedged_request(
+        self, method: str, route: str, **kwargs
+    ) -> typing.Tuple[int, typing.Any]:
+        """Races a second request against a slow first one, returns the first success"""
+
+        tasks = {asyncio.ensure_future(self._request(method, route, **kwargs))}
+
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+        if not done:
+            self.hedged += 1
+            tasks.add(asyncio.ensure_future(self._request(method, route, **kwargs)))
+
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    if not (error := task.exception()):
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise error
+
+    async def _parse_generated(self, resp: aiohttp.ClientResponse) -> dict:
+        """Parses a generate response
+
+        JSON responses carry the image as a data URI. Binary responses are the
+        image itself, with the UUID in a header; their body is kept as is.
+        """
+
+        if resp.content_type.startswith("image/"):
+            if not (captcha_uuid := resp.headers.get(self.uuid_header)):
+                raise ValueError(
+                    f"Binary captcha response is missing the {self.uuid_header} header"
+                )
+
+            return {
+                "uuid": captcha_uuid,
+                "mime_type": resp.content_type,
+                "image": await resp.read(),
+            }
+
+        return await resp.json()
+
+    def _check_circuit(self, breaker: CircuitBreaker, route: str):
+        if not breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(
+                f"Captcha API circuit is open, not requesting {route}"
+            )
+
+    async def generate(self) -> dict:
+        """Requests a new captcha, retrying with jittered backoff
+
+        Returns a dict with the `uuid`, and either the `captcha` data URI or the
+        raw `image` bytes and their `mime_type` (binary mode).
+
+        Raises the last error when every attempt failed, or `CircuitOpenError`.
+        """
+
+        self._check_circuit(self.breaker, "generate")
+
+        kwargs = {"parser": self._parse_generated}
+        if self.binary:
+            kwargs["headers"] = {"Accept": "image/*, application/json;q=0.5"}
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    if self.hedge_delay is not None:
+                        status, data = await self._hedged_request(
+                            "GET", "generate", **kwargs
+                        )
+                    else:
+                        status, data = await self._request("GET", "generate", **kwargs)
+
+                    if status != 200:
+                        raise aiohttp.ClientError(
+                            f"Captcha API returned {status} on generate"
+                        )
+
+                    self.breaker.record_success()
+                    return data
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    if attempt == self.retries:
+                        self.breaker.record_failure()
+                        raise
+
+                # full jitter, so retries of concurrent joins don't line up
+                self.retried += 1
+                await asyncio.sleep(random.uniform(0, 0.2 * 2**attempt))
+        except BaseException:
+            self.breaker.record_aborted()
+            raise
+
+    async def verify(self, captcha_uuid: str, user_response: str) -> bool:
+        """Checks an answer, never retried since the API consumes the UUID"""
+
+        self._check_circuit(self.verify_breaker, "verify")
+
+        try:
+            status, _ = await self._request(
+                "POST",
+                "verify",
+                json={"uuid": captcha_uuid, "captcha": user_response},
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.verify_breaker.record_failure()
+            raise
+        except BaseException:
+            self.verify_breaker.record_aborted()
+            raise
+
+        self.verify_breaker.record_success()
+        return status == 200
+
+    async def close(self):
+        if self._owns_session and self._session and not self._session.closed:
+            await self._session.close()
+
+    def stats(self) -> dict:
+        """Returns a dict of client counters, with latencies per route"""
+
+        stats = {
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "verify_circuit": self.verify_breaker.state,
+            "verify_circuit_opened": self.verify_breaker.times_opened,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "hedged": self.hedged,
+        }
+
+        for route in sorted(self.latencies.keys() | self.errors.keys()):
+            stats.update(
+                self.latencies.get(route, LatencySamples()).stats(prefix=route)
+            )
+            stats[f"{route}_errors"] = self.errors.get(route, 0)
+
+        return stats
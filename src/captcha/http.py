@@ -0,0 +1,54 @@
+import typing
+
+from captcha.base import Captcha, CaptchaBackend
+from captcha.client import CaptchaApiClient
+from captcha.router import CaptchaApiRouter
+
+
+class HttpCaptchaBackend(CaptchaBackend):
+    """Generates and verifies captchas through the captcha API
+
+    Captchas remember the endpoint they came from, so their answer gets checked
+    by the same instance.
+
+    Parameters
+    ----------
+    client : Union[CaptchaApiClient, CaptchaApiRouter]
+        Client making the requests to the captcha API, or a router spreading
+        them over several instances of it
+    """
+
+    def __init__(self, client: typing.Union[CaptchaApiClient, CaptchaApiRouter]):
+        if isinstance(client, CaptchaApiClient):
+            client = CaptchaApiRouter([client])
+
+        self.router = client
+
+    async def new(self) -> Captcha:
+        new_captcha = Captcha(self)
+
+        new_captcha.endpoint, data = await self.router.generate()
+
+        new_captcha.captcha_uuid = data["uuid"]
+        if "image" in data:
+            # binary mode, the image comes as is
+            new_captcha.captcha_bytes = data["image"]
+            new_captcha.mime_type = data["mime_type"]
+        else:
+            new_captcha.captcha_data_uri = data["captcha"]
+
+        return new_captcha
+
+    async def verify(self, captcha: Captcha, user_response: str) -> bool:
+        return await self.router.verify(
+            captcha.endpoint, captcha.captcha_uuid, user_response
+        )
+
+    async def close(self):
+        await self.router.close()
+
+    def stats(self) -> dict:
+        return {"backend": "http", **self.router.stats()}
+
+    def endpoint_stats(self) -> typing.Dict[str, dict]:
+        return self.router.endpoint_stats()
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import secrets
+import time
+import typing
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from captcha.base import Captcha, CaptchaBackend
+
+# Characters which can't be told apart from others (0/O, 1/l/I) are left out
+CAPTCHA_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz23456789"
+
+# Loaded once per worker process
+_font = None
+
+
+def _get_font(font_path: typing.Optional[str], size: int):
+    global _font
+
+    from PIL import ImageFont
+
+    if _font is None:
+        try:
+            _font = ImageFont.truetype(font_path or "DejaVuSans-Bold.ttf", size)
+        except OSError:
+            # a scalable built-in font, or the bitmap one without FreeType
+            _font = ImageFont.load_default(size)
+
+    return _font
+
+
+def render_captcha(
+    text: str,
+    seed: int,
+    width: int = 240,
+    height: int = 80,
+    font_path: typing.Optional[str] = None,
+) -> bytes:
+    """Renders captcha text into a PNG, with jittered characters and noise
+
+    Runs inside worker processes, so it only takes and returns picklable values.
+    """
+
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    font = _get_font(font_path, size=int(height * 0.55))
+
+    image = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+
+    # noise lines behind the text
+    for _ in range(6):
+        draw.line(
+            [
+                (rng.randint(0, width), rng.randint(0, height)),
+                (rng.randint(0, width), rng.randint(0, height)),
+            ],
+            fill=tuple(rng.randint(120, 200) for _ in range(3)),
+            width=2,
+        )
+
+    # every character on its own layer, so it can be rotated
+    step = width / (len(text) + 1)
+    for i, char in enumerate(text):
+        left, top, right, bottom = draw.textbbox((0, 0), char, font=font)
+        char_image = Image.new("RGBA", (right + 8, bottom + 8), (0, 0, 0, 0))
+        ImageDraw.Draw(char_image).text(
+            (4, 4),
+            char,
+            font=font,
+            fill=tuple(rng.randint(0, 110) for _ in range(3)),
+        )
+        char_image = char_image.rotate(rng.uniform(-25, 25), expand=True)
+
+        x = int(step * (i + 0.5) + rng.uniform(-4, 4))
+        y = int((height - char_image.height) / 2 + rng.uniform(-6, 6))
+        image.paste(char_image, (x, y), char_image)
+
+    # noise dots over the text
+    for _ in range(width * height // 60):
+        draw.point(
+            (rng.randrange(width), rng.randrange(height)),
+            fill=tuple(rng.randint(0, 255) for _ in range(3)),
+        )
+
+    image = image.filter(ImageFilter.SMOOTH)
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+
+    return buffer.getvalue()
+
+
+class AnswerStore:
+    """In-memory store of salted captcha answer hashes, expiring after `ttl`
+
+    Answers are never kept in plain text. Every entry can be checked once.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds an answer stays valid
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+
+        # UUID -> (expires at, salt, digest)
+        self._answers: typing.Dict[str, typing.Tuple[float, bytes, bytes]] = {}
+
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._answers)
+
+    @staticmethod
+    def _hash(salt: bytes, answer: str) -> bytes:
+        return hashlib.sha256(salt + answer.encode()).digest()
+
+    def add(self, answer: str) -> str:
+        """Stores an answer, returns the UUID to check it by"""
+
+        self.prune()
+
+        captcha_uuid = str(uuid.uuid4())
+        salt = os.urandom(16)
+
+        self._answers[captcha_uuid] = (
+            time.monotonic() + self.ttl,
+            salt,
+            self._hash(salt, answer),
+        )
+
+        return captcha_uuid
+
+    def check(self, captcha_uuid: str, answer: str) -> bool:
+        """Checks an answer, consuming the entry whether it's correct or not"""
+
+        if not (entry := self._answers.pop(captcha_uuid, None)):
+            return False
+
+        expires_at, salt, digest = entry
+        if expires_at < time.monotonic():
+            self.expired += 1
+            return False
+
+        return hmac.compare_digest(digest, self._hash(salt, answer.strip()))
+
+    def prune(self):
+        """Removes expired entries"""
+
+        now = time.monotonic()
+
+        # insertion ordered, and every entry has the same ttl
+        for captcha_uuid, (expires_at, _, _) in list(self._answers.items()):
+            if expires_at >= now:
+                break
+
+            del self._answers[captcha_uuid]
+            self.expired += 1
+
+
+class LocalCaptchaBackend(CaptchaBackend):
+    """Renders captchas in-process and verifies them against an `AnswerStore`
+
+    Rendering is CPU bound, so it's done in a `ProcessPoolExecutor` and never
+    blocks the event loop.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds a captcha can be answered in
+    length : int
+        Characters per captcha
+    max_workers : Optional[int]
+        Rendering processes, defaults to the CPU count
+    font_path : Optional[str]
+        TrueType font to render with
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        length: int = 6,
+        max_workers: typing.Optional[int] = None,
+        font_path: typing.Optional[str] = None,
+    ):
+        self.length = length
+        self.max_workers = max_workers
+        self.font_path = font_path
+
+        self.answers = AnswerStore(ttl)
+        self._executor: typing.Optional[ProcessPoolExecutor] = None
+
+        self.rendered = 0
+        self.render_ms_total = 0.0
+        self.passed = 0
+        self.failed = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        return self._executor
+
+    async def new(self) -> Captcha:
+        text = "".join(secrets.choice(CAPTCHA_ALPHABET) for _ in range(self.length))
+
+        started_at = time.perf_counter()
+        image_bytes = await asyncio.get_event_loop().run_in_executor(
+            self._get_executor(),
+            render_captcha,
+            text,
+            secrets.randbits(32),
+            240,
+            80,
+            self.font_path,
+        )
+        self.render_ms_total += (time.perf_counter() - started_at) * 1000
+        self.rendered += 1
+
+        new_captcha = Captcha(self)
+        new_captcha.captcha_uuid = self.answers.add(text)
+        new_captcha.captcha_bytes = image_bytes
+        new_captcha.mime_type = "image/png"
+
+        return new_captcha
+
+    async def verify(self, captcha: Captcha, user_response: str) -> bool:
+        if self.answers.check(captcha.captcha_uuid, user_response):
+            self.passed += 1
+            return True
+
+        self.failed += 1
+        return False
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "local",
+            "pending_answers": len(self.answers),
+            "expired_answers": self.answers.expired,
+            "rendered": self.rendered,
+            "render_avg_ms": (
+                (self.render_ms_total / self.rendered) if self.rendered else 0.0
+            ),
+            "passed": self.passed,
+            "failed": self.failed,
+        }
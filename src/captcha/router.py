@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+import typing
+from enum import Enum
+
+import aiohttp
+
+from captcha.client import CaptchaApiClient, CircuitBreaker, CircuitOpenError
+
+
+class RoutingPolicy(str, Enum):
+    """An `Enum` storing the ways generate requests are spread over endpoints
+
+    LEAST_OUTSTANDING: Pick the endpoint with the fewest requests in flight
+    LATENCY_WEIGHTED: Pick randomly, weighted by inverse average latency
+    """
+
+    LEAST_OUTSTANDING = "LEAST_OUTSTANDING"
+    LATENCY_WEIGHTED = "LATENCY_WEIGHTED"
+
+
+class Endpoint:
+    """A captcha API instance behind a `CaptchaApiRouter`, with its routing state
+
+    Its client's circuit breaker decides its health: an open circuit ejects
+    it, and once the breaker's reset timeout passed a single request probes it.
+
+    Parameters
+    ----------
+    client : CaptchaApiClient
+        Client of the instance
+    """
+
+    def __init__(self, client: CaptchaApiClient):
+        self.client = client
+
+        self.outstanding = 0
+        self.latency_ms: typing.Optional[float] = None
+
+        self.generated = 0
+        self.verify_requests = 0
+        self.failures = 0
+
+    @property
+    def url(self) -> str:
+        return self.client.base_url
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.client.breaker
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.state == CircuitBreaker.CLOSED
+
+    def is_probe_due(self) -> bool:
+        """Returns a boolean signifying if the ejected endpoint may be tried again"""
+
+        return self.breaker.is_trial_due()
+
+    def record_latency(self, latency_ms: float, alpha: float):
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += alpha * (latency_ms - self.latency_ms)
+
+    def stats(self) -> dict:
+        if self.healthy:
+            state = "healthy"
+        elif self.breaker.state == CircuitBreaker.HALF_OPEN:
+            state = "probing"
+        else:
+            state = "ejected"
+
+        return {
+            "state": state,
+            "outstanding": self.outstanding,
+            "latency_avg_ms": self.latency_ms or 0.0,
+            "generated": self.generated,
+            "verify_requests": self.verify_requests,
+            "failures": self.failures,
+            **self.client.stats(),
+        }
+
+
+class CaptchaApiRouter:
+    """Spreads captcha API requests over several instances of it
+
+    Generate requests go to a healthy endpoint picked by `policy`, failing over
+    to the others. Verify requests always go to the endpoint which generated
+    the captcha, no other instance knows its UUID.
+
+    Parameters
+    ----------
+    clients : List[CaptchaApiClient]
+        One client per instance, each with its own circuit breaker
+    policy : RoutingPolicy
+        How generate requests pick an endpoint
+    latency_alpha : float
+        Weight of a new sample in the moving latency average, 0 to 1
+    """
+
+    def __init__(
+        self,
+        clients: typing.List[CaptchaApiClient],
+        policy: RoutingPolicy = RoutingPolicy.LEAST_OUTSTANDING,
+        latency_alpha: float = 0.2,
+    ):
+        if not clients:
+            raise ValueError("A router needs at least one captcha API client")
+
+        self.endpoints = [Endpoint(client) for client in clients]
+        self.policy = policy
+        self.latency_alpha = latency_alpha
+
+        self._endpoints_by_url = {endpoint.url: endpoint for endpoint in self.endpoints}
+
+        self.probes = 0
+        self.failovers = 0
+
+    def _pick(self, exclude: typing.Set[Endpoint]) -> typing.Optional[Endpoint]:
+        candidates = [
+            endpoint for endpoint in self.endpoints if endpoint not in exclude
+        ]
+
+        # a real request is the probe, the breaker lets only this one through
+        for endpoint in candidates:
+            if endpoint.is_probe_due():
+                self.probes += 1
+                return endpoint
+
+        if not (healthy := [endpoint for endpoint in candidates if endpoint.healthy]):
+            return
+
+        if self.policy == RoutingPolicy.LATENCY_WEIGHTED:
+            measured = [e.latency_ms for e in healthy if e.latency_ms is not None]
+            # unmeasured endpoints get the best weight, so they get measured soon
+            fastest = min(measured, default=1.0)
+
+            return random.choices(
+                healthy,
+                weights=[
+                    1 / max(endpoint.latency_ms or fastest, 0.001)
+                    for endpoint in healthy
+                ],
+            )[0]
+
+        least = min(endpoint.outstanding for endpoint in healthy)
+        return random.choice(
+            [endpoint for endpoint in healthy if endpoint.outstanding == least]
+        )
+
+    async def generate(self) -> typing.Tuple[str, dict]:
+        """Requests a new captcha, returns the URL of the endpoint and its response
+
+        Raises the last error when every endpoint failed, or `CircuitOpenError`
+        when all of them are ejected.
+        """
+
+        tried: typing.Set[Endpoint] = set()
+        error = None
+
+        while endpoint := self._pick(tried):
+            if tried:
+                self.failovers += 1
+
+            tried.add(endpoint)
+            endpoint.outstanding += 1
+            started_at = time.perf_counter()
+
+            try:
+                data = await endpoint.client.generate()
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                ValueError,
+                CircuitOpenError,
+            ) as e:
+                endpoint.failures += 1
+                error = e
+                continue
+            finally:
+                endpoint.outstanding -= 1
+
+            endpoint.record_latency(
+                (time.perf_counter() - started_at) * 1000, self.latency_alpha
+            )
+            endpoint.generated += 1
+
+            return endpoint.url, data
+
+        raise error or CircuitOpenError("Every captcha API endpoint is ejected")
+
+    async def verify(
+        self, endpoint_url: typing.Optional[str], captcha_uuid: str, user_response: str
+    ) -> bool:
+        """Checks an answer at the endpoint which generated the captcha"""
+
+        if not (endpoint := self._endpoints_by_url.get(endpoint_url)):
+            if len(self.endpoints) != 1:
+                raise ValueError(f"Unknown captcha API endpoint {endpoint_url}")
+
+            endpoint = self.endpoints[0]
+
+        endpoint.outstanding += 1
+        try:
+            return await endpoint.client.verify(captcha_uuid, user_response)
+        finally:
+            endpoint.outstanding -= 1
+            endpoint.verify_requests += 1
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    def stats(self) -> dict:
+        """Returns a dict of router counters"""
+
+        return {
+            "policy": self.policy.value,
+            "endpoints": len(self.endpoints),
+            "healthy_endpoints": sum(endpoint.healthy for endpoint in self.endpoints),
+            "probes": self.probes,
+            "failovers": self.failovers,
+        }
+
+    def endpoint_stats(self) -> typing.Dict[str, dict]:
+        """Returns a dict of counters per endpoint URL"""
+        return {endpoint.url: endpoint.stats() for endpoint in self.endpoints}
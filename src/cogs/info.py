@@ -1,10 +1,14 @@
+import asyncio
+import math
 import time
 import sys, platform
+import typing
 
 import discord
 from discord.ext import commands
 
-from models import Guild, Config, ConfigType, VerificationMethod
+from models import ConfigType, GuildSettings, StatsPeriod, VerificationMethod
+from utils.stats import get_guild_stats
 
 
 class Info(commands.Cog):
@@ -13,6 +17,56 @@ class Info(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    def _format_shards(self, shard_summaries: list, limit: int = 15) -> str:
+        """Formats per-shard summaries into one line per shard"""
+
+        lines = []
+        for shard in shard_summaries[:limit]:
+            latency = shard["latency"]
+            latency = f"{round(latency * 1000)}ms" if math.isfinite(latency) else "n/a"
+
+            lines.append(
+                f"- Shard {shard['id']}: `{latency}` | {shard['guilds']} guilds | {shard['event_rate']:.1f} events/s"
+            )
+
+        if len(shard_summaries) > limit:
+            lines.append(f"- ...and {len(shard_summaries) - limit} more")
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_verification_stats(stats: dict) -> str:
+        """Formats summed rollups into rates and the median solve time"""
+
+        total = stats["passed"] + stats["failed"] + stats["timed_out"]
+        if not total:
+            return "No verifications yet"
+
+        median = stats["median_solve_time"]
+
+        return (
+            f"- Passed: {stats['passed']} ({stats['passed'] / total:.0%})\n"
+            f"- Failed: {stats['failed']} ({stats['failed'] / total:.0%})\n"
+            f"- Timed Out: {stats['timed_out']} ({stats['timed_out'] / total:.0%})\n"
+            f"- Median Solve Time: {f'{median:.1f}s' if median is not None else 'n/a'}"
+        )
+
+    async def _resolve_channel(
+        self, guild: discord.Guild, channel_id: typing.Optional[int]
+    ) -> typing.Optional[discord.abc.GuildChannel]:
+        """Gets a channel from cache, fetching it only when it isn't cached"""
+
+        if not channel_id:
+            return
+
+        if channel := guild.get_channel(channel_id):
+            return channel
+
+        try:
+            return await self.bot.fetch_channel(channel_id)
+        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+            return
+
     @commands.command()
     async def ping(self, ctx: commands.Context):
         """Check the bot's latency"""
@@ -38,8 +92,11 @@ class Info(commands.Cog):
         for ms in pings:
             number += ms
         average = round(number / len(pings))
+        shards = ""
+        if self.bot.is_sharded:
+            shards = f"\n\n__**Shards:**__\n{self._format_shards(self.bot.get_shard_summaries())}"
         await ctx.send(
-            f"__**Ping Times:**__\nTyping: `{typingms}ms`  |  Latency: `{latencyms}ms`\nDiscord: `{discordms}`  |  Average: `{average}ms`"
+            f"__**Ping Times:**__\nTyping: `{typingms}ms`  |  Latency: `{latencyms}ms`\nDiscord: `{discordms}`  |  Average: `{average}ms`{shards}"
         )
 
     @commands.command()
@@ -85,6 +142,7 @@ class Info(commands.Cog):
             ------
             - Guilds: {len(self.bot.guilds)}
             - Users: {len(self.bot.users)}
+            - Shards: {self.bot.shard_count or 1}{f" (this server is on shard {ctx.guild.shard_id})" if ctx.guild else ""}
 
             **Host Environment**
             ----------------------
@@ -105,6 +163,11 @@ class Info(commands.Cog):
             Unfortunately, Распутин's busy life did not allow him to pursue the afforementioned challenge-- Hence, The bot in production currently is the one coded by Syed.
             """,
         )
+        embed.add_field(
+            name="Shards",
+            value=self._format_shards(self.bot.get_shard_summaries()),
+            inline=False,
+        )
         await ctx.send(embed=embed)
 
     @commands.command()
@@ -112,34 +175,37 @@ class Info(commands.Cog):
     async def status(self, ctx: commands.Context):
         """Check Bot status in your server"""
 
-        guild_obj = await Guild.get(id=ctx.guild.id)
+        started_at = time.perf_counter()
 
-        bot_prefix = guild_obj.get_bot_prefix()
-        verification_method = guild_obj.get_verification_method()
+        # every config of the guild, in one query
+        settings = await GuildSettings.load(ctx.guild.id)
+        if not settings:
+            return await ctx.send("This server isn't registered yet, try again later.")
 
-        verification_channel = ctx.guild.get_channel(
-            await Config.get_value_int(guild_obj, ConfigType.VERIFICATION_CHANNEL)
+        bot_prefix = settings.bot_prefix
+        verification_method = settings.verification_method
+
+        verification_channel, reaction_channel = await asyncio.gather(
+            self._resolve_channel(
+                ctx.guild, settings.get_value_int(ConfigType.VERIFICATION_CHANNEL)
+            ),
+            self._resolve_channel(
+                ctx.guild, settings.get_value_int(ConfigType.REACTION_CHANNEL)
+            ),
         )
         verified_role = ctx.guild.get_role(
-            await Config.get_value_int(guild_obj, ConfigType.VERIFIED_ROLE)
+            settings.get_value_int(ConfigType.VERIFIED_ROLE)
         )
 
-        is_verification_message_start_set = await Config.exists(
-            guild=guild_obj, type_=ConfigType.VERIFICATION_MESSAGE_START
+        is_verification_message_start_set = settings.is_set(
+            ConfigType.VERIFICATION_MESSAGE_START
         )
-        is_verification_message_success_set = await Config.exists(
-            guild=guild_obj, type_=ConfigType.VERIFICATION_MESSAGE_SUCCESS
+        is_verification_message_success_set = settings.is_set(
+            ConfigType.VERIFICATION_MESSAGE_SUCCESS
         )
 
-        reaction_channel = ctx.guild.get_channel(
-            await Config.get_value_int(guild_obj, ConfigType.REACTION_CHANNEL)
-        )
-        reaction_message = await Config.get_value_int(
-            guild_obj, ConfigType.REACTION_MESSAGE
-        )
-        reaction_emoji = await Config.get_value_str(
-            guild_obj, ConfigType.REACTION_EMOJI
-        )
+        reaction_message = settings.get_value_int(ConfigType.REACTION_MESSAGE)
+        reaction_emoji = settings.get_value_str(ConfigType.REACTION_EMOJI)
 
         embed = self.bot.embed_gen.get_normal_embed(
             title="Bot Status",
@@ -212,6 +278,46 @@ class Info(commands.Cog):
             inline=False,
         )
 
+        embed.set_footer(
+            text=f"Rendered in {(time.perf_counter() - started_at) * 1000:.1f}ms"
+        )
+
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.guild_only()
+    async def stats(self, ctx: commands.Context):
+        """Shows verification stats of your server
+
+        Rates are of all verification outcomes, a member failing once and then
+        passing counts towards both. Stats are updated every few seconds.
+        """
+
+        started_at = time.perf_counter()
+
+        last_day, last_month = await asyncio.gather(
+            get_guild_stats(ctx.guild.id, StatsPeriod.HOUR, 24),
+            get_guild_stats(ctx.guild.id, StatsPeriod.DAY, 30),
+        )
+
+        embed = self.bot.embed_gen.get_normal_embed(
+            title="Verification Stats",
+            description=f"Verification outcomes in **{ctx.guild}**",
+        )
+        embed.add_field(
+            name="Last 24 Hours",
+            value=self._format_verification_stats(last_day),
+            inline=True,
+        )
+        embed.add_field(
+            name="Last 30 Days",
+            value=self._format_verification_stats(last_month),
+            inline=True,
+        )
+        embed.set_footer(
+            text=f"Rendered in {(time.perf_counter() - started_at) * 1000:.1f}ms"
+        )
+
         await ctx.send(embed=embed)
 
 
@@ -0,0 +1,96 @@
+from discord.ext import commands
+
+from utils.cache import config_cache, prefix_cache, settings_cache
+
+
+class Owner(commands.Cog):
+    """Owner only commands for inspecting the bot internals"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_check(self, ctx: commands.Context):
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner()
+
+        return True
+
+    @staticmethod
+    def _format_stats(stats: dict) -> str:
+        """Formats a dict of counters into a code block"""
+
+        lines = []
+        for key, value in stats.items():
+            if isinstance(value, float):
+                value = f"{value:.4f}"
+
+            lines.append(f"{key}: {value}")
+
+        return "```\n" + "\n".join(lines) + "\n```"
+
+    @commands.group()
+    async def metrics(self, ctx: commands.Context):
+        """Group of commands to inspect internal metrics"""
+
+        if not ctx.invoked_subcommand:
+            await ctx.send_help(self.metrics)
+
+    @metrics.command(name="prefix")
+    async def metrics_prefix(self, ctx: commands.Context):
+        """Shows the prefix cache counters"""
+
+        await ctx.send(self._format_stats(prefix_cache.stats()))
+
+    @metrics.command(name="config")
+    async def metrics_config(self, ctx: commands.Context):
+        """Shows the config and guild settings cache counters"""
+
+        await ctx.send(self._format_stats(config_cache.stats()))
+        await ctx.send(self._format_stats(settings_cache.stats()))
+
+    @metrics.command(name="messages")
+    async def metrics_messages(self, ctx: commands.Context):
+        """Shows how many messages were short-circuited versus dispatched"""
+
+        await ctx.send(self._format_stats(self.bot.prefix_matcher.stats()))
+
+    @metrics.command(name="pool")
+    async def metrics_pool(self, ctx: commands.Context):
+        """Shows DB connection pool usage and acquire latency"""
+
+        await ctx.send(self._format_stats(self.bot.pool_metrics.stats()))
+
+    @metrics.command(name="events")
+    async def metrics_events(self, ctx: commands.Context):
+        """Shows the verification event log buffer counters"""
+
+        await ctx.send(self._format_stats(self.bot.verification_events.stats()))
+
+    @metrics.command(name="stats")
+    async def metrics_stats(self, ctx: commands.Context):
+        """Shows the verification stats recorder counters"""
+
+        await ctx.send(self._format_stats(self.bot.verification_stats.stats()))
+
+    @metrics.command(name="captcha")
+    async def metrics_captcha(self, ctx: commands.Context):
+        """Shows the captcha pool, backend and optimizer counters, then each API endpoint's"""
+
+        stats = {**self.bot.captcha_pool.stats(), **self.bot.captcha_backend.stats()}
+
+        if self.bot.captcha_optimizer:
+            stats.update(
+                {
+                    f"optimize_{key}": value
+                    for key, value in self.bot.captcha_optimizer.stats().items()
+                }
+            )
+
+        await ctx.send(self._format_stats(stats))
+
+        for url, endpoint_stats in self.bot.captcha_backend.endpoint_stats().items():
+            await ctx.send(f"**{url}**\n{self._format_stats(endpoint_stats)}")
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(Owner(bot))
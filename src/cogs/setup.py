@@ -57,6 +57,7 @@ class Setup(commands.Cog):
         """
 
         await (await Guild.get(id=ctx.guild.id)).set_verification_method(new_method)
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
 
         await ctx.send(f"Verification Method set to `{new_method}`")
 
@@ -208,6 +209,7 @@ class Setup(commands.Cog):
         guild_obj = await Guild.get(id=ctx.guild.id)
 
         await Config.set_value_int(guild_obj, ConfigType.REACTION_CHANNEL, channel.id)
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
         await ctx.send(f"Set `{channel}` as reaction channel.")
 
     @set.command(aliases=["reaction-message", "rm"])
@@ -231,6 +233,7 @@ class Setup(commands.Cog):
         guild_obj = await Guild.get(id=ctx.guild.id)
 
         await Config.set_value_int(guild_obj, ConfigType.REACTION_MESSAGE, message.id)
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
         await ctx.send(f"Set the reaction message to: ```\n{message.content}\n```")
 
         # try to react
@@ -275,16 +278,82 @@ class Setup(commands.Cog):
 
         guild_obj = await Guild.get(id=ctx.guild.id)
 
-        # stores is_unicode value
-        await Config.set_value_bool(guild_obj, ConfigType.REACTION_EMOJI, is_unicode)
-
-        if is_unicode:
-            await Config.set_value_str(guild_obj, ConfigType.REACTION_EMOJI, emoji)
-        else:
-            await Config.set_value_int(guild_obj, ConfigType.REACTION_EMOJI, emoji.id)
+        # stores is_unicode value along with the emoji, atomically
+        await Config.set_values(
+            guild_obj,
+            ConfigType.REACTION_EMOJI,
+            value_bool=is_unicode,
+            value_str=emoji if is_unicode else None,
+            value_int=None if is_unicode else emoji.id,
+        )
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
 
         await ctx.send(f"Set the reaction emoji as: ```\n{emoji}\n```")
 
+    @set.command(aliases=["reaction-panel-add", "rpa"])
+    async def reaction_panel_add(self, ctx: commands.Context, message: discord.Message):
+        """Adds an extra reaction message
+
+        Reactions with the reaction emoji on this message verify members too, just like on the reaction message.
+
+        **Arguments**
+        --------------
+        `message`: discord message
+            The message to add as an extra reaction message
+
+        **Accepts**
+        ------------
+        - message id
+        - channel id-message id
+        - message link
+        """
+
+        # message links can point anywhere the bot can read
+        if message.guild != ctx.guild:
+            return await ctx.send("That message is not in this server.")
+
+        guild_obj = await Guild.get(id=ctx.guild.id)
+
+        panels = (
+            await Config.get_value_json(guild_obj, ConfigType.REACTION_PANELS) or []
+        )
+        panels = [panel for panel in panels if panel["message_id"] != message.id]
+        panels.append({"channel_id": message.channel.id, "message_id": message.id})
+
+        await Config.set_value_json(guild_obj, ConfigType.REACTION_PANELS, panels)
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
+
+        await ctx.send(f"Added an extra reaction message in `{message.channel}`.")
+
+    @set.command(aliases=["reaction-panel-remove", "rpr"])
+    async def reaction_panel_remove(self, ctx: commands.Context, message_id: int):
+        """Removes an extra reaction message
+
+        **Arguments**
+        --------------
+        `message_id`: int
+            The ID of the extra reaction message to remove
+        """
+
+        guild_obj = await Guild.get(id=ctx.guild.id)
+
+        panels = (
+            await Config.get_value_json(guild_obj, ConfigType.REACTION_PANELS) or []
+        )
+        remaining_panels = [
+            panel for panel in panels if panel["message_id"] != message_id
+        ]
+
+        if len(remaining_panels) == len(panels):
+            return await ctx.send("That message is not an extra reaction message.")
+
+        await Config.set_value_json(
+            guild_obj, ConfigType.REACTION_PANELS, remaining_panels
+        )
+        await self.bot.reaction_panels.refresh_guild(ctx.guild.id)
+
+        await ctx.send("Removed the extra reaction message.")
+
 
 def setup(bot: commands.Bot):
     bot.add_cog(Setup(bot))
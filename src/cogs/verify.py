@@ -1,16 +1,31 @@
 import asyncio
+import logging
+import time
 import typing
 
+import aiohttp
 import discord
 from discord.ext import commands
-
-from captcha import Captcha
-from models import Config, ConfigType, Guild, VerificationMethod
+from tortoise import timezone
+
+from captcha import Captcha, CircuitOpenError
+from models import (
+    ConfigType,
+    GuildSettings,
+    VerificationEventType,
+    VerificationMethod,
+)
 from utils.extras import format_placeholders
+from utils.members import resolve_member
+from utils.reactions import ReactionPanel
 
-# TODO: verification logging
 # FIXME: role permssions check in verify command
 
+logger = logging.getLogger("bot.verify")
+
+# Raised when the captcha API is down or failing, verification is retried later
+CAPTCHA_ERRORS = (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError)
+
 
 class Verify(commands.Cog):
     """Main verification"""
@@ -19,10 +34,38 @@ class Verify(commands.Cog):
         self.bot = bot
         self.embed_gen = bot.embed_gen
 
-    async def is_verified_role_set(self, guild: discord.Guild):
-        guild_obj = await Guild.get(id=guild.id)
+    def is_verified_role_set(self, settings: GuildSettings):
+        return settings.is_set(ConfigType.VERIFIED_ROLE)
+
+    def log_event(
+        self,
+        guild: discord.Guild,
+        member_or_user: typing.Union[discord.Member, discord.User],
+        type_: VerificationEventType,
+        settings: GuildSettings = None,
+    ):
+        """Buffers a verification event, it gets written to the DB in the background"""
+
+        self.bot.verification_events.record(
+            guild.id,
+            member_or_user.id,
+            type_,
+            settings.verification_method if settings else None,
+            timezone.now(),
+        )
+
+    def record_outcome(
+        self,
+        guild: discord.Guild,
+        member_or_user: typing.Union[discord.Member, discord.User],
+        outcome: VerificationEventType,
+        settings: GuildSettings,
+        solve_time: float = None,
+    ):
+        """Logs a verification outcome and counts it into the guild's stats"""
 
-        return await Config.exists(guild=guild_obj, type_=ConfigType.VERIFIED_ROLE)
+        self.log_event(guild, member_or_user, outcome, settings)
+        self.bot.verification_stats.record(guild.id, outcome, solve_time)
 
     async def get_text_input(
         self,
@@ -44,15 +87,12 @@ class Verify(commands.Cog):
 
         return await captcha.verify(input_msg.content)
 
-    async def add_verified_role(self, member: discord.Member):
+    async def add_verified_role(self, member: discord.Member, settings: GuildSettings):
         """Adds the verified role to member verified"""
 
         guild = member.guild
 
-        guild_obj = await Guild.get(id=guild.id)
-        verified_role_id = await Config.get_value_int(
-            guild_obj, ConfigType.VERIFIED_ROLE
-        )
+        verified_role_id = settings.get_value_int(ConfigType.VERIFIED_ROLE)
 
         if not verified_role_id:  # ignore if not set
             return
@@ -68,28 +108,27 @@ class Verify(commands.Cog):
         channel: typing.Union[discord.TextChannel, discord.DMChannel],
         guild: discord.Guild,
         member: discord.member,
+        settings: GuildSettings,
         mention=None,
     ):
         """Displays the captcha in an embed"""
 
-        guild_obj = await Guild.get(id=guild.id)
-
         # fetch the verification message for start, if not set; use default
-        verification_message = await Config.get_value_str(
-            guild_obj, ConfigType.VERIFICATION_MESSAGE_START
+        verification_message = settings.get_value_str(
+            ConfigType.VERIFICATION_MESSAGE_START
         )
         if not verification_message:
             verification_message = "The server you just joined requires manual verification.\n\n**Just reply me with the characters displayed below. (case-sensitive)**"
 
+        guild_total_members, guild_humans = await self.bot.member_counter.get(guild)
+
         formatted_verification_message = format_placeholders(
             verification_message,
             {
                 "guild_name": guild.name,
                 "guild_id": guild.id,
-                "guild_total_members": len(guild.members),
-                "guild_humans": len(
-                    [member for member in guild.members if not member.bot]
-                ),
+                "guild_total_members": guild_total_members,
+                "guild_humans": guild_humans,
                 "member_name": member.name,
                 "member_id": member.id,
                 "member_mention": member.mention,
@@ -101,7 +140,7 @@ class Verify(commands.Cog):
         embed = self.embed_gen.get_normal_embed(
             title="Verification Required", description=formatted_verification_message
         )
-        embed.set_image(url="attachment://captcha.png")
+        embed.set_image(url=f"attachment://{captcha_file.filename}")
         embed.set_footer(
             text=f"This prompt will timeout in 60 secs | {guild}",
             icon_url=self.bot.user.avatar_url,
@@ -111,12 +150,18 @@ class Verify(commands.Cog):
 
     async def on_timeout(
         self,
+        member_or_user: typing.Union[discord.Member, discord.User],
         channel: typing.Union[discord.TextChannel, discord.DMChannel],
         guild: discord.Guild,
+        settings: GuildSettings,
         mention=None,
     ):
         """Executes after verification message was timed-out"""
 
+        self.record_outcome(
+            guild, member_or_user, VerificationEventType.TIMED_OUT, settings
+        )
+
         embed = self.embed_gen.get_error_embed(
             title="Verification Timed Out",
             description="Oops! Seems like you didn't respond in time.\n\nBut, It's fine! You can start the verification process again using the command `verify`",
@@ -125,14 +170,45 @@ class Verify(commands.Cog):
 
         await channel.send(f"{mention or ''}", embed=embed)
 
+    async def on_unavailable(
+        self,
+        channel: typing.Union[discord.TextChannel, discord.DMChannel],
+        mention=None,
+    ):
+        """Executes when no captcha could be generated or checked"""
+
+        embed = self.embed_gen.get_error_embed(
+            title="Verification Unavailable",
+            description="Sorry! Captchas can't be generated or checked at the moment.\n\nPlease try again in a few minutes using the command `verify`",
+        )
+        embed.set_footer(icon_url=self.bot.user.avatar_url, text="Notice me pls :c")
+
+        await channel.send(f"{mention or ''}", embed=embed)
+
     async def on_fail(
         self,
         member_or_user: typing.Union[discord.Member, discord.User],
         channel: typing.Union[discord.TextChannel, discord.DMChannel],
         guild: discord.Guild,
+        settings: GuildSettings,
         mention=None,
+        solve_time: float = None,
+        log_event=True,
     ):
-        """Executes after verification was failed"""
+        """Executes after verification was failed
+
+        `log_event` is False when re-asking after an invalid reply, so a single
+        failure isn't logged more than once.
+        """
+
+        if log_event:
+            self.record_outcome(
+                guild,
+                member_or_user,
+                VerificationEventType.FAILED,
+                settings,
+                solve_time=solve_time,
+            )
 
         embed = self.embed_gen.get_warn_embed(
             title="Verification Failed ",
@@ -151,53 +227,76 @@ class Verify(commands.Cog):
                 timeout=60,
             )
         except:
-            await self.on_timeout(channel, guild, mention=mention)
+            await self.on_timeout(
+                member_or_user, channel, guild, settings, mention=mention
+            )
             return
 
         # Dangerous recursion here
         if reply_msg.content.upper() == "Y":
-            await self.handle_text_verification_methods(member_or_user, guild)
+            await self.handle_text_verification_methods(
+                member_or_user, guild, settings=settings
+            )
 
         elif reply_msg.content.upper() == "N":
             await channel.send(
                 "Bye! You can start the verification process again using the command `verify`"
             )
         else:
-            await self.on_fail(member_or_user, channel, guild, mention=mention)
+            await self.on_fail(
+                member_or_user,
+                channel,
+                guild,
+                settings,
+                mention=mention,
+                log_event=False,
+            )
 
     async def on_success(
         self,
         member_or_user: typing.Union[discord.Member, discord.User],
         channel: typing.Union[discord.TextChannel, discord.DMChannel],
         guild: discord.Guild,
+        settings: GuildSettings,
         mention=None,
+        solve_time: float = None,
     ):
         """Executes after verification was successful"""
 
-        member = guild.get_member(
-            member_or_user.id
+        self.record_outcome(
+            guild,
+            member_or_user,
+            VerificationEventType.PASSED,
+            settings,
+            solve_time=solve_time,
+        )
+
+        member = await resolve_member(
+            guild, member_or_user.id
         )  # make sure we have a member object
 
-        role = await self.add_verified_role(member)
+        if not member:  # left the guild while solving, nobody to give the role to
+            logger.info(f"{member_or_user} left {guild} before getting verified")
+            return
 
-        guild_obj = await Guild.get(id=guild.id)
+        role = await self.add_verified_role(member, settings)
 
         # fetch the verification message for success, if not set; use default
-        verification_message = await Config.get_value_str(
-            guild_obj, ConfigType.VERIFICATION_MESSAGE_SUCCESS
+        verification_message = settings.get_value_str(
+            ConfigType.VERIFICATION_MESSAGE_SUCCESS
         )
         if not verification_message:
             verification_message = "Good Job! You have been verified!\n\n**I have given you the role `{verified_role_name}`**"
 
+        guild_total_members, guild_humans = await self.bot.member_counter.get(guild)
+
         formatted_verification_message = format_placeholders(
             verification_message,
             {
                 "guild_name": guild.name,
                 "guild_id": guild.id,
-                "guild_total_members": len(guild.members),
-                "guild_humans": len(
-                    [member for member in guild.members if not member.bot]
-                ),
+                "guild_total_members": guild_total_members,
+                "guild_humans": guild_humans,
                 "member_name": member.name,
                 "member_id": member.id,
                 "member_mention": member.mention,
@@ -219,52 +318,101 @@ class Verify(commands.Cog):
         self,
         member_or_user: typing.Union[discord.Member, discord.User],
         guild: discord.Guild,
+        settings: GuildSettings,
     ):
         """Starts verification using DM method"""
 
-        captcha = await Captcha.new(self.bot.CAPTCHA_API_URL, self.bot.aio_session)
+        # to make sure, its a member object
+        if not (member := await resolve_member(guild, member_or_user.id)):
+            logger.info(f"{member_or_user} left {guild} before getting a captcha")
+            return
+
+        dm_channel = await member_or_user.create_dm()
 
-        captcha.decode()
-        captcha_file = captcha.get_discord_file("captcha.png")
+        # comes decoded already, usually without waiting on the captcha API
+        try:
+            captcha = await self.bot.captcha_pool.get()
+        except CAPTCHA_ERRORS:
+            await self.on_unavailable(dm_channel)
+            return
+
+        captcha_file = captcha.get_discord_file()
 
         await self.display_captcha(
             captcha_file,
-            (await member_or_user.create_dm()),
+            dm_channel,
             guild,
-            (guild.get_member(member_or_user.id)),  # to make sure, its a member object
+            member,
+            settings,
+        )
+        self.log_event(
+            guild, member_or_user, VerificationEventType.CAPTCHA_SENT, settings
         )
+        displayed_at = time.monotonic()
 
         try:
             user_input = await self.get_text_input(
                 member_or_user.dm_channel, member_or_user, timeout=60
             )
         except asyncio.TimeoutError:
-            await self.on_timeout(member_or_user, guild)
+            await self.on_timeout(
+                member_or_user, member_or_user.dm_channel, guild, settings
+            )
             return
 
-        result = await self.verify_text_input(captcha, user_input)
+        solve_time = time.monotonic() - displayed_at
+
+        try:
+            result = await self.verify_text_input(captcha, user_input)
+        except CAPTCHA_ERRORS:
+            await self.on_unavailable(member_or_user.dm_channel)
+            return
 
         if result is False:
-            return await self.on_fail(member_or_user, member_or_user.dm_channel, guild)
+            return await self.on_fail(
+                member_or_user,
+                member_or_user.dm_channel,
+                guild,
+                settings,
+                solve_time=solve_time,
+            )
 
-        await self.on_success(member_or_user, member_or_user.dm_channel, guild)
+        await self.on_success(
+            member_or_user,
+            member_or_user.dm_channel,
+            guild,
+            settings,
+            solve_time=solve_time,
+        )
 
     async def start_channel_verification(
         self,
         member: discord.Member,
         verification_channel: discord.TextChannel,
         guild: discord.Guild,
+        settings: GuildSettings,
     ):
         """Starts verification using channel method"""
 
-        captcha = await Captcha.new(self.bot.CAPTCHA_API_URL, self.bot.aio_session)
+        # comes decoded already, usually without waiting on the captcha API
+        try:
+            captcha = await self.bot.captcha_pool.get()
+        except CAPTCHA_ERRORS:
+            await self.on_unavailable(verification_channel, mention=member.mention)
+            return
 
-        captcha.decode()
-        captcha_file = captcha.get_discord_file("captcha.png")
+        captcha_file = captcha.get_discord_file()
 
         await self.display_captcha(
-            captcha_file, verification_channel, guild, member, mention=member.mention
+            captcha_file,
+            verification_channel,
+            guild,
+            member,
+            settings,
+            mention=member.mention,
         )
+        self.log_event(guild, member, VerificationEventType.CAPTCHA_SENT, settings)
+        displayed_at = time.monotonic()
 
         try:
             user_input = await self.get_text_input(
@@ -272,27 +420,39 @@ class Verify(commands.Cog):
             )
         except asyncio.TimeoutError:
             await self.on_timeout(
+                member,
                 verification_channel,
                 verification_channel.guild,
+                settings,
                 mention=member.mention,
             )
             return
 
-        result = await self.verify_text_input(captcha, user_input)
+        solve_time = time.monotonic() - displayed_at
+
+        try:
+            result = await self.verify_text_input(captcha, user_input)
+        except CAPTCHA_ERRORS:
+            await self.on_unavailable(verification_channel, mention=member.mention)
+            return
 
         if result is False:
             return await self.on_fail(
                 member,
                 verification_channel,
                 verification_channel.guild,
+                settings,
                 mention=member.mention,
+                solve_time=solve_time,
             )
 
         await self.on_success(
             member,
             verification_channel,
             verification_channel.guild,
+            settings,
             mention=member.mention,
+            solve_time=solve_time,
         )
 
     async def handle_text_verification_methods(
@@ -300,13 +460,20 @@ class Verify(commands.Cog):
         member_or_user: typing.Union[discord.Member, discord.User],
         guild: discord.Guild,
         invocation_channel: discord.TextChannel = None,
+        settings: GuildSettings = None,
     ):
-        """Resolves the verification method setting for the guild and verifies accordingly"""
+        """Resolves the verification method setting for the guild and verifies accordingly
 
-        verification_method = (await Guild.get(id=guild.id)).get_verification_method()
+        `settings` is loaded here, unless the caller already has a snapshot.
+        """
+
+        if not settings and not (settings := await GuildSettings.load(guild.id)):
+            return
+
+        verification_method = settings.verification_method
 
         # If verified role is not set; ignore
-        if not (await self.is_verified_role_set(guild)):
+        if not self.is_verified_role_set(settings):
             return
 
         if verification_method == VerificationMethod.DM:
@@ -317,19 +484,17 @@ class Verify(commands.Cog):
                     "Starting verification process in DM's..."
                 )
 
-            return await self.start_dm_verification(member_or_user, guild)
+            return await self.start_dm_verification(member_or_user, guild, settings)
 
         if verification_method == VerificationMethod.CHANNEL:
-
-            guild_obj = await Guild.get(id=guild.id)
-            verification_channel_id = await Config.get_value_int(
-                guild_obj, ConfigType.VERIFICATION_CHANNEL
+            verification_channel_id = settings.get_value_int(
+                ConfigType.VERIFICATION_CHANNEL
             )
 
             verification_channel = guild.get_channel(verification_channel_id)
 
             return await self.start_channel_verification(
-                member_or_user, verification_channel, guild
+                member_or_user, verification_channel, guild, settings
             )
 
         # if somehow, method is set to reaction and verify command was used
@@ -342,57 +507,27 @@ class Verify(commands.Cog):
         self,
         member: discord.Member,
         guild: discord.Guild,
-        channel_id: int,
-        message_id: int,
-        reaction_emoji: discord.PartialEmoji,
+        panel: ReactionPanel,
     ):
         """Starts verification using reaction method"""
 
-        guild_obj = await Guild.get_or_none(id=guild.id)
-        if not guild_obj:
-            return
-
         if (
-            not guild_obj.verification_method == VerificationMethod.REACTION
-        ):  # if verification method is not REACTION; return
+            not panel.guild_id == guild.id
+        ):  # check if the panel belongs to the guild reacted in
             return
 
-        reaction_channel_id = await Config.get_value_int(
-            guild_obj, ConfigType.REACTION_CHANNEL
-        )
-        if not reaction_channel_id:
+        settings = await GuildSettings.load(guild.id)
+        if not settings:
             return
 
-        if (
-            not channel_id == reaction_channel_id
-        ):  # check if channel is the same as reaction channel in db
-            return
-
-        reaction_message = await Config.get_value_int(
-            guild_obj, ConfigType.REACTION_MESSAGE
-        )
-        if (
-            not message_id == reaction_message
-        ):  # check if message is the same as reaction message in db
-            return
-
-        is_unicode = await Config.get_value_bool(guild_obj, ConfigType.REACTION_EMOJI)
-        if is_unicode:
-            emoji = await Config.get_value_str(guild_obj, ConfigType.REACTION_EMOJI)
-        else:
-            emoji = self.bot.get_emoji(
-                await Config.get_value_int(guild_obj, ConfigType.REACTION_EMOJI)
-            )
-
-        if str(reaction_emoji) == str(
-            emoji
-        ):  # check if emoji is the same as reaction emoji in db
-            await self.on_success(member, (await member.create_dm()), guild)
+        await self.on_success(member, (await member.create_dm()), guild, settings)
 
     @commands.Cog.listener(name="on_member_join")
     async def handle_joins(self, member: discord.Member):
         """Starts automatic verification for new members"""
 
+        self.log_event(member.guild, member, VerificationEventType.JOIN)
+
         await self.handle_text_verification_methods(member, member.guild)
 
     @commands.Cog.listener(name="on_raw_reaction_add")
@@ -401,20 +536,24 @@ class Verify(commands.Cog):
         if not payload:
             return
 
+        # reject reactions on other messages or with other emojis, without awaiting anything
+        panel = self.bot.reaction_panels.get(payload.channel_id, payload.message_id)
+        if not panel or not panel.matches(payload.emoji):
+            return
+
         guild = self.bot.get_guild(payload.guild_id)
         if not guild:
             return
 
-        member = guild.get_member(payload.user_id)
+        # the payload carries the member for guild reactions, so no cache is needed
+        member = payload.member or await resolve_member(guild, payload.user_id)
         if not member:
             return
 
         if member == guild.me:  # ignore if reaction by bot itself
             return
 
-        await self.start_reaction_verification(
-            member, guild, payload.channel_id, payload.message_id, payload.emoji
-        )
+        await self.start_reaction_verification(member, guild, panel)
 
     @commands.command()
     @commands.max_concurrency(
@@ -448,9 +587,9 @@ class Verify(commands.Cog):
 
         guild = ctx.guild or guild
 
-        guild_obj = await Guild.get(id=guild.id)
-        verified_role_id = await Config.get_value_int(
-            guild_obj, ConfigType.VERIFIED_ROLE
+        settings = await GuildSettings.load(guild.id)
+        verified_role_id = (
+            settings.get_value_int(ConfigType.VERIFIED_ROLE) if settings else None
         )
 
         if not verified_role_id:  # ignore if not set
@@ -459,14 +598,18 @@ class Verify(commands.Cog):
             )
 
         verified_role = guild.get_role(verified_role_id)
-        member = guild.get_member(ctx.author.id)  # ensure it's a member object
+        member = await resolve_member(
+            guild, ctx.author.id
+        )  # ensure it's a member object
+        if not member:
+            return await ctx.send("You are not a member of that server.")
 
         if verified_role in member.roles:
             await ctx.send("You are already verified!")
             return
 
         await self.handle_text_verification_methods(
-            ctx.author, guild, invocation_channel=ctx.channel
+            ctx.author, guild, invocation_channel=ctx.channel, settings=settings
         )
 
     @verify.error
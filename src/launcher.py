@@ -0,0 +1,455 @@
+"""Cluster launcher for Soteria
+
+Spreads shards over N worker processes (clusters), each running its own
+`Soteria` instance over a subset of shards, so that gateway event decoding
+can use more than one CPU core.
+
+The launcher supervises workers: crashed or unresponsive ones get restarted
+with an exponential backoff, and health reports from all of them are
+aggregated and logged periodically.
+
+Usage:
+    python src/launcher.py --clusters 4 --shards 16
+    python src/launcher.py --clusters 4 --shards 16 --fake-workers
+
+`--fake-workers` don't create a `Soteria`, they only emit synthetic health
+reports. It tests the supervisor, not the bot's health reporting.
+
+Discord delivers every DM on shard 0, so the cluster holding it forwards DMs to
+all other clusters, over one queue per cluster (see `utils.clusters`). DM
+verification works for guilds served by any cluster.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import sys
+import time
+import typing
+
+import coloredlogs
+
+from dotenv import load_dotenv
+
+from utils.logging import get_launcher_logger
+
+DISCORD_GATEWAY_BOT_URL = "https://discord.com/api/v8/gateway/bot"
+
+logger = get_launcher_logger()
+
+
+def split_shards(shard_count: int, cluster_count: int) -> typing.List[typing.List[int]]:
+    """Splits shard IDs into contiguous, evenly sized chunks, one per cluster"""
+
+    cluster_count = max(1, min(cluster_count, shard_count))
+    per_cluster, remainder = divmod(shard_count, cluster_count)
+
+    clusters = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = per_cluster + (1 if cluster_id < remainder else 0)
+        clusters.append(list(range(start, start + size)))
+        start += size
+
+    return clusters
+
+
+async def fetch_recommended_shard_count(token: str) -> int:
+    """Asks discord for the recommended shard count"""
+
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            DISCORD_GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+
+async def report_health(
+    bot, cluster_id: int, health_queue: multiprocessing.Queue, interval: float
+):
+    """Periodically puts a health report of a running bot on the queue"""
+
+    while not bot.is_closed():
+        health_queue.put(
+            {
+                "cluster_id": cluster_id,
+                "pid": os.getpid(),
+                "ready": bot.is_ready(),
+                "guilds": len(bot.guilds),
+                "shards": bot.get_shard_summaries(),
+                "timestamp": time.time(),
+            }
+        )
+
+        await asyncio.sleep(interval)
+
+
+async def run_fake_worker(
+    cluster_id: int,
+    shard_ids: typing.List[int],
+    health_queue: multiprocessing.Queue,
+    interval: float,
+    crash_rate: float,
+):
+    """Stands in for a real bot: fake shards connect, report health and may crash
+
+    Lets the supervisor be exercised locally without a discord token. No
+    `Soteria` is created, so this only covers the launcher's side: spawning,
+    health aggregation and restarts. The bot's own health reporting isn't run.
+    """
+
+    connected = {}
+
+    while True:
+        for shard_id in shard_ids:
+            if shard_id not in connected and random.random() < 0.5:
+                connected[shard_id] = random.randint(10, 400)  # fake guild count
+
+        health_queue.put(
+            {
+                "cluster_id": cluster_id,
+                "pid": os.getpid(),
+                "ready": len(connected) == len(shard_ids),
+                "guilds": sum(connected.values()),
+                "shards": [
+                    {
+                        "id": shard_id,
+                        "latency": random.uniform(0.03, 0.2),
+                        "guilds": guilds,
+                        "event_rate": random.uniform(5, 50),
+                    }
+                    for shard_id, guilds in connected.items()
+                ],
+                "timestamp": time.time(),
+            }
+        )
+
+        if random.random() < crash_rate:
+            raise RuntimeError(f"Fake worker crash in cluster {cluster_id}")
+
+        await asyncio.sleep(interval)
+
+
+def run_worker(
+    cluster_id: int,
+    shard_ids: typing.List[int],
+    shard_count: int,
+    health_queue: multiprocessing.Queue,
+    dm_queues: typing.List[multiprocessing.Queue],
+    health_interval: float,
+    fake_workers: bool,
+    fake_crash_rate: float,
+):
+    """Entry point of a worker process"""
+
+    # Soteria reads its shard settings at import time
+    os.environ["SOTERIA_SHARD_COUNT"] = str(shard_count)
+    os.environ["SOTERIA_SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+
+    if fake_workers:
+        asyncio.run(
+            run_fake_worker(
+                cluster_id, shard_ids, health_queue, health_interval, fake_crash_rate
+            )
+        )
+        return
+
+    from soteria import Soteria
+    from utils.clusters import DMForwarder
+
+    bot = Soteria()
+
+    if len(dm_queues) > 1:
+        bot.dm_forwarder = DMForwarder(bot, cluster_id, dm_queues, 0 in shard_ids)
+        bot.dm_forwarder.start(bot.loop)
+
+    bot.loop.create_task(report_health(bot, cluster_id, health_queue, health_interval))
+
+    bot.run(bot._DISCORD_TOKEN)
+
+
+class Cluster:
+    """Book-keeping for a single worker process"""
+
+    def __init__(self, cluster_id: int, shard_ids: typing.List[int]):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+
+        self.process = None
+        self.started_at = None
+        self.restart_at = None
+        self.restarts = 0
+        self.backoff = 1.0
+        self.health = None
+
+
+class ClusterSupervisor:
+    """Starts, watches and restarts worker processes
+
+    Parameters
+    ----------
+    shard_count: int
+        Total shards across all clusters
+    cluster_count: int
+        Number of worker processes to spread the shards over
+    fake_workers: bool
+        Run fake workers instead of bots connecting to discord
+    """
+
+    def __init__(
+        self,
+        shard_count: int,
+        cluster_count: int,
+        fake_workers: bool = False,
+        fake_crash_rate: float = 0.0,
+        health_interval: float = 5.0,
+        heartbeat_timeout: float = 60.0,
+        report_interval: float = 30.0,
+        max_backoff: float = 60.0,
+    ):
+        self.shard_count = shard_count
+        self.fake_workers = fake_workers
+        self.fake_crash_rate = fake_crash_rate
+        self.health_interval = health_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.report_interval = report_interval
+        self.max_backoff = max_backoff
+
+        # Fresh interpreters, so each worker imports soteria with its own env
+        self._context = multiprocessing.get_context("spawn")
+        self.health_queue = self._context.Queue()
+
+        self.clusters = [
+            Cluster(cluster_id, shard_ids)
+            for cluster_id, shard_ids in enumerate(
+                split_shards(shard_count, cluster_count)
+            )
+        ]
+
+        # DMs only arrive on shard 0, its cluster forwards them over these
+        self.dm_queues = [self._context.Queue() for _ in self.clusters]
+
+        self._stopping = False
+
+    def start_cluster(self, cluster: Cluster):
+        """Spawns the worker process for a cluster"""
+
+        cluster.process = self._context.Process(
+            target=run_worker,
+            name=f"soteria-cluster-{cluster.cluster_id}",
+            args=(
+                cluster.cluster_id,
+                cluster.shard_ids,
+                self.shard_count,
+                self.health_queue,
+                self.dm_queues,
+                self.health_interval,
+                self.fake_workers,
+                self.fake_crash_rate,
+            ),
+        )
+        cluster.process.start()
+
+        cluster.started_at = time.monotonic()
+        cluster.restart_at = None
+        cluster.health = None
+
+        logger.info(
+            f"Started cluster {cluster.cluster_id} (pid: {cluster.process.pid}, shards: {cluster.shard_ids[0]}-{cluster.shard_ids[-1]})"
+        )
+
+    def _drain_health_queue(self):
+        """Stores the latest health report of every cluster"""
+
+        while True:
+            try:
+                report = self.health_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            cluster = self.clusters[report["cluster_id"]]
+            if cluster.process and report["pid"] == cluster.process.pid:
+                cluster.health = report
+
+    def _schedule_restart(self, cluster: Cluster, reason: str):
+        """Schedules a restart for a cluster using exponential backoff"""
+
+        # Reset the backoff if the worker was stable for a while
+        if time.monotonic() - cluster.started_at > self.max_backoff * 2:
+            cluster.backoff = 1.0
+
+        cluster.restart_at = time.monotonic() + cluster.backoff
+        cluster.restarts += 1
+        cluster.health = None  # don't aggregate a dead worker's last report
+
+        logger.warning(
+            f"Cluster {cluster.cluster_id} {reason}, restarting in {cluster.backoff:.0f}s"
+        )
+
+        cluster.backoff = min(cluster.backoff * 2, self.max_backoff)
+
+    def _check_clusters(self):
+        """Restarts crashed or hung workers"""
+
+        now = time.monotonic()
+
+        for cluster in self.clusters:
+            if cluster.restart_at is not None:
+                if now >= cluster.restart_at:
+                    self.start_cluster(cluster)
+                continue
+
+            if not cluster.process.is_alive():
+                self._schedule_restart(
+                    cluster, f"exited with code {cluster.process.exitcode}"
+                )
+                continue
+
+            if cluster.health:
+                silent_for = time.time() - cluster.health["timestamp"]
+            else:
+                silent_for = now - cluster.started_at
+
+            if silent_for > self.heartbeat_timeout:
+                cluster.process.kill()
+                cluster.process.join()
+                self._schedule_restart(cluster, "stopped reporting health")
+
+    def aggregate_health(self) -> dict:
+        """Returns health aggregated across all clusters"""
+
+        reports = [cluster.health for cluster in self.clusters if cluster.health]
+        shards = [shard for report in reports for shard in report["shards"]]
+
+        return {
+            "clusters": len(self.clusters),
+            "clusters_alive": sum(
+                1
+                for cluster in self.clusters
+                if cluster.process and cluster.process.is_alive()
+            ),
+            "clusters_ready": sum(1 for report in reports if report["ready"]),
+            "shards_connected": len(shards),
+            "guilds": sum(report["guilds"] for report in reports),
+            "events_per_second": sum(shard["event_rate"] for shard in shards),
+            "restarts": sum(cluster.restarts for cluster in self.clusters),
+        }
+
+    def stop(self, *_):
+        """Terminates every worker"""
+
+        self._stopping = True
+
+    def run(self):
+        """Starts every cluster and supervises them until stopped"""
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for cluster in self.clusters:
+            self.start_cluster(cluster)
+
+        last_report = time.monotonic()
+
+        while not self._stopping:
+            time.sleep(1)
+
+            self._drain_health_queue()
+            self._check_clusters()
+
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+
+                health = self.aggregate_health()
+                logger.info(
+                    ", ".join(
+                        (
+                            f"{key}: {value:.1f}"
+                            if isinstance(value, float)
+                            else f"{key}: {value}"
+                        )
+                        for key, value in health.items()
+                    )
+                )
+
+        logger.warning("Stopping clusters...")
+
+        for cluster in self.clusters:
+            if cluster.process and cluster.process.is_alive():
+                cluster.process.terminate()
+
+        for cluster in self.clusters:
+            if cluster.process:
+                cluster.process.join(timeout=30)
+
+        logger.critical("Bye!")
+
+
+def main():
+    load_dotenv()
+
+    coloredlogs.install(logger=logger)
+
+    parser = argparse.ArgumentParser(description="Runs Soteria over multiple processes")
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=int(os.getenv("SOTERIA_CLUSTER_COUNT", default=os.cpu_count() or 1)),
+        help="number of worker processes (defaults to CPU count)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=os.getenv("SOTERIA_SHARD_COUNT"),
+        help="total shard count (defaults to discord's recommendation)",
+    )
+    parser.add_argument(
+        "--fake-workers",
+        action="store_true",
+        help="run fake workers instead of bots connecting to discord",
+    )
+    parser.add_argument(
+        "--fake-crash-rate",
+        type=float,
+        default=0.0,
+        help="probability of a fake worker crashing per health report",
+    )
+    parser.add_argument("--health-interval", type=float, default=5.0)
+    parser.add_argument("--report-interval", type=float, default=30.0)
+    args = parser.parse_args()
+
+    shard_count = args.shards and int(args.shards)
+
+    if not shard_count:
+        if args.fake_workers:
+            shard_count = args.clusters
+        else:
+            if not "SOTERIA_DISCORD_TOKEN" in os.environ:
+                logger.critical("SOTERIA_DISCORD_TOKEN not set!")
+                sys.exit(1)
+
+            shard_count = asyncio.run(
+                fetch_recommended_shard_count(os.getenv("SOTERIA_DISCORD_TOKEN"))
+            )
+            logger.info(f"Using recommended shard count: {shard_count}")
+
+    supervisor = ClusterSupervisor(
+        shard_count,
+        args.clusters,
+        fake_workers=args.fake_workers,
+        fake_crash_rate=args.fake_crash_rate,
+        health_interval=args.health_interval,
+        report_interval=args.report_interval,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
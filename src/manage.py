@@ -0,0 +1,106 @@
+"""Management commands for Soteria, run outside of the bot process
+
+Usage:
+    python src/manage.py migrate
+    python src/manage.py migrate --status
+    python src/manage.py migrate-settings
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from tortoise import Tortoise, run_async
+
+import migrations
+from models import migrate_configs_to_settings
+from utils.db import get_tortoise_config
+
+
+async def init_db():
+    """Initializes database ORM, without generating schemas"""
+
+    if not (db_uri := os.getenv("SOTERIA_DB_URI")):
+        print("SOTERIA_DB_URI not set!", file=sys.stderr)
+        sys.exit(1)
+
+    await Tortoise.init(config=get_tortoise_config(db_uri))
+
+
+async def migrate(args: argparse.Namespace):
+    """Applies pending schema migrations"""
+
+    await init_db()
+
+    current_version = await migrations.get_schema_version()
+    pending = migrations.get_pending_migrations(current_version, args.target)
+
+    if args.status:
+        print(
+            f"Schema is at version {current_version}, latest is {migrations.LATEST_VERSION}"
+        )
+        for migration in pending:
+            print(f"  pending {migration.version}: {migration.description}")
+        return
+
+    if not pending:
+        print(f"Schema is up to date (version {current_version})")
+        return
+
+    started_at = time.perf_counter()
+    await migrations.migrate(
+        target_version=args.target,
+        on_applied=lambda migration: print(
+            f"Applied {migration.version}: {migration.description}"
+        ),
+    )
+
+    print(
+        f"Migrated schema to version {pending[-1].version} in {(time.perf_counter() - started_at) * 1000:.0f}ms"
+    )
+
+
+async def migrate_settings(args: argparse.Namespace):
+    """Copies `Config` rows into the JSONB `Guild.settings` documents"""
+
+    await init_db()
+
+    started_at = time.perf_counter()
+    migrated = await migrate_configs_to_settings(batch_size=args.batch_size)
+
+    print(
+        f"Migrated settings of {migrated} guilds in {(time.perf_counter() - started_at) * 1000:.0f}ms"
+    )
+    print("Set SOTERIA_SETTINGS_LAYOUT=JSONB to start using them.")
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Soteria management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help=migrate.__doc__)
+    migrate_parser.add_argument(
+        "--target", type=int, help="Version to migrate to, defaults to the latest"
+    )
+    migrate_parser.add_argument(
+        "--status", action="store_true", help="Only show pending migrations"
+    )
+    migrate_parser.set_defaults(handler=migrate)
+
+    migrate_settings_parser = subparsers.add_parser(
+        "migrate-settings", help=migrate_settings.__doc__
+    )
+    migrate_settings_parser.add_argument("--batch-size", type=int, default=500)
+    migrate_settings_parser.set_defaults(handler=migrate_settings)
+
+    args = parser.parse_args()
+
+    run_async(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Versioned schema migrations
+
+Every migration is applied in a transaction together with a row recording its
+version in the `schema_version` table. Startup only compares the stored version
+against `LATEST_VERSION`, instead of introspecting the whole schema.
+
+Migrations are run with:
+    python src/manage.py migrate
+
+Migrations have to be idempotent, databases created before versioning was
+introduced start at version 0 and replay all of them. Concurrent runs (e.g.
+every cluster with `SOTERIA_AUTO_MIGRATE=1`) are serialized by a lock taken in
+each migration's transaction, so only one of them applies it.
+"""
+
+import typing
+
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+from models import Config, Guild
+from utils.db import execute_script, get_placeholders
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+# Key of the postgres advisory lock serializing migrations
+MIGRATION_LOCK_KEY = 0x50745249
+
+
+class SchemaOutdatedError(Exception):
+    """Raised when the database schema is behind the code"""
+
+    def __init__(self, current_version: int, latest_version: int):
+        super().__init__(
+            f"Database schema is at version {current_version}, latest is {latest_version}. "
+            "Run `python src/manage.py migrate` to upgrade it."
+        )
+        self.current_version = current_version
+        self.latest_version = latest_version
+
+
+class Migration(typing.NamedTuple):
+    """A single schema change
+
+    Fields
+    ------
+    version : int
+        Version the schema is at, after this migration
+    description : str
+        What the migration changes
+    apply : Callable
+        Coroutine function taking the (transaction) client to run on
+    """
+
+    version: int
+    description: str
+    apply: typing.Callable[[typing.Any], typing.Awaitable[None]]
+
+
+def _run_sql(sqlite: str, postgres: str):
+    """Returns a migration running the DDL written for the client's dialect
+
+    DDL is spelled out per version instead of generated from the models, so
+    every migration keeps creating the schema of its time as the models change.
+    """
+
+    async def apply(client):
+        script = postgres if client.capabilities.dialect == "postgres" else sqlite
+        await execute_script(client, script)
+
+    return apply
+
+
+_create_initial_tables = _run_sql(
+    sqlite="""
+CREATE TABLE IF NOT EXISTS "guild" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(120) NOT NULL,
+    "owner_id" BIGINT NOT NULL,
+    "bot_prefix" VARCHAR(10) NOT NULL,
+    "verification_method" VARCHAR(8) NOT NULL DEFAULT 'DM'
+);
+CREATE TABLE IF NOT EXISTS "config" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "type" VARCHAR(28) NOT NULL,
+    "value_int" BIGINT,
+    "value_str" VARCHAR(2000),
+    "value_json" JSON,
+    "value_bool" INT,
+    "guild_id" BIGINT NOT NULL REFERENCES "guild" ("id") ON DELETE CASCADE
+);
+""",
+    postgres="""
+CREATE TABLE IF NOT EXISTS "guild" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "name" VARCHAR(120) NOT NULL,
+    "owner_id" BIGINT NOT NULL,
+    "bot_prefix" VARCHAR(10) NOT NULL,
+    "verification_method" VARCHAR(8) NOT NULL DEFAULT 'DM'
+);
+CREATE TABLE IF NOT EXISTS "config" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "type" VARCHAR(28) NOT NULL,
+    "value_int" BIGINT,
+    "value_str" VARCHAR(2000),
+    "value_json" JSONB,
+    "value_bool" BOOL,
+    "guild_id" BIGINT NOT NULL REFERENCES "guild" ("id") ON DELETE CASCADE
+);
+""",
+)
+
+_create_verification_event_table = _run_sql(
+    sqlite="""
+CREATE TABLE IF NOT EXISTS "verificationevent" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "guild_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "type" VARCHAR(12) NOT NULL,
+    "method" VARCHAR(8),
+    "created_at" TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "idx_verificatio_guild_i_b49532" ON "verificationevent" ("guild_id");
+CREATE INDEX IF NOT EXISTS "idx_verificatio_created_80172d" ON "verificationevent" ("created_at");
+""",
+    postgres="""
+CREATE TABLE IF NOT EXISTS "verificationevent" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "guild_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "type" VARCHAR(12) NOT NULL,
+    "method" VARCHAR(8),
+    "created_at" TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "idx_verificatio_guild_i_b49532" ON "verificationevent" ("guild_id");
+CREATE INDEX IF NOT EXISTS "idx_verificatio_created_80172d" ON "verificationevent" ("created_at");
+""",
+)
+
+_create_verification_stats_tables = _run_sql(
+    sqlite="""
+CREATE TABLE IF NOT EXISTS "verificationrollup" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "guild_id" BIGINT NOT NULL,
+    "period" VARCHAR(4) NOT NULL,
+    "started_at" TIMESTAMP NOT NULL,
+    "passed" INT NOT NULL DEFAULT 0,
+    "failed" INT NOT NULL DEFAULT 0,
+    "timed_out" INT NOT NULL DEFAULT 0,
+    "solve_time_total_ms" BIGINT NOT NULL DEFAULT 0,
+    "solve_time_count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_verificatio_guild_i_c5dc55" UNIQUE ("guild_id", "period", "started_at")
+);
+CREATE TABLE IF NOT EXISTS "verificationsolvetimebin" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "guild_id" BIGINT NOT NULL,
+    "period" VARCHAR(4) NOT NULL,
+    "started_at" TIMESTAMP NOT NULL,
+    "bin" SMALLINT NOT NULL,
+    "count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_verificatio_guild_i_f49317" UNIQUE ("guild_id", "period", "started_at", "bin")
+);
+""",
+    postgres="""
+CREATE TABLE IF NOT EXISTS "verificationrollup" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "guild_id" BIGINT NOT NULL,
+    "period" VARCHAR(4) NOT NULL,
+    "started_at" TIMESTAMPTZ NOT NULL,
+    "passed" INT NOT NULL DEFAULT 0,
+    "failed" INT NOT NULL DEFAULT 0,
+    "timed_out" INT NOT NULL DEFAULT 0,
+    "solve_time_total_ms" BIGINT NOT NULL DEFAULT 0,
+    "solve_time_count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_verificatio_guild_i_c5dc55" UNIQUE ("guild_id", "period", "started_at")
+);
+CREATE TABLE IF NOT EXISTS "verificationsolvetimebin" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "guild_id" BIGINT NOT NULL,
+    "period" VARCHAR(4) NOT NULL,
+    "started_at" TIMESTAMPTZ NOT NULL,
+    "bin" SMALLINT NOT NULL,
+    "count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_verificatio_guild_i_f49317" UNIQUE ("guild_id", "period", "started_at", "bin")
+);
+""",
+)
+
+
+async def _add_config_unique_index(client):
+    await Config.ensure_unique_index(client)
+
+
+async def _add_guild_settings_column(client):
+    await Guild.ensure_settings_column(client)
+
+
+MIGRATIONS: typing.List[Migration] = [
+    Migration(1, "Create initial tables", _create_initial_tables),
+    Migration(2, "Add unique (guild, type) index on config", _add_config_unique_index),
+    Migration(3, "Add guild settings column", _add_guild_settings_column),
+    Migration(4, "Create verification event table", _create_verification_event_table),
+    Migration(5, "Create verification stats tables", _create_verification_stats_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_client():
+    return Tortoise.get_connection("default")
+
+
+async def get_schema_version(client=None) -> int:
+    """Returns the stored schema version, 0 if nothing was ever migrated
+
+    This is the only query done on startup.
+    """
+
+    client = client or get_client()
+
+    try:
+        _, rows = await client.execute_query(
+            f'SELECT MAX("version") AS "version" FROM "{SCHEMA_VERSION_TABLE}"'
+        )
+    except OperationalError:
+        # Table doesn't exist yet
+        return 0
+
+    return (rows[0]["version"] if rows else None) or 0
+
+
+async def ensure_schema_version_table(client=None):
+    client = client or get_client()
+
+    await execute_script(
+        client,
+        f'CREATE TABLE IF NOT EXISTS "{SCHEMA_VERSION_TABLE}" ('
+        '"version" INT NOT NULL PRIMARY KEY, '
+        '"description" TEXT NOT NULL, '
+        '"applied_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)',
+    )
+
+
+async def lock_migrations(connection):
+    """Blocks until no other process is migrating, until the transaction ends"""
+
+    if connection.capabilities.dialect == "postgres":
+        await connection.execute_query(
+            "SELECT pg_advisory_xact_lock($1)", [MIGRATION_LOCK_KEY]
+        )
+        return
+
+    # sqlite has no advisory locks, a write takes the database's write lock
+    await connection.execute_query(
+        f'UPDATE "{SCHEMA_VERSION_TABLE}" SET "version" = "version" WHERE 0 = 1'
+    )
+
+
+def get_pending_migrations(
+    current_version: int, target_version: typing.Optional[int] = None
+) -> typing.List[Migration]:
+    target_version = LATEST_VERSION if target_version is None else target_version
+
+    return [
+        migration
+        for migration in MIGRATIONS
+        if current_version < migration.version <= target_version
+    ]
+
+
+async def migrate(
+    target_version: typing.Optional[int] = None,
+    on_applied: typing.Optional[typing.Callable[[Migration], None]] = None,
+) -> typing.List[Migration]:
+    """Applies every pending migration up to `target_version` (latest by default)
+
+    Parameters
+    ----------
+    target_version : Optional[int]
+        Version to stop at
+    on_applied : Optional[Callable]
+        Called with each migration, after it got committed
+
+    Returns the migrations applied by this call, ones applied meanwhile by
+    another process are skipped.
+    """
+
+    client = get_client()
+
+    await ensure_schema_version_table(client)
+    pending = get_pending_migrations(await get_schema_version(client), target_version)
+    applied = []
+
+    for migration in pending:
+        async with in_transaction() as connection:
+            await lock_migrations(connection)
+
+            if await get_schema_version(connection) >= migration.version:
+                continue
+
+            await migration.apply(connection)
+
+            placeholders = ", ".join(get_placeholders(connection, 2))
+            await connection.execute_query(
+                f'INSERT INTO "{SCHEMA_VERSION_TABLE}" ("version", "description") '
+                f"VALUES ({placeholders})",
+                [migration.version, migration.description],
+            )
+
+        applied.append(migration)
+        if on_applied:
+            on_applied(migration)
+
+    return applied
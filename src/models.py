@@ -1,8 +1,16 @@
+import json
+import os
 import typing
+from dataclasses import dataclass
 from enum import Enum
+from types import MappingProxyType
 
 from tortoise import fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from utils.cache import MISSING, config_cache, prefix_cache, settings_cache
+from utils.db import bulk_update, execute_script, get_placeholders
 
 
 class VerificationMethod(str, Enum):
@@ -30,6 +38,7 @@ class ConfigType(str, Enum):
     REACTION_CHANNEL: Stores the channel ID for reaction method
     REACTION_MESSAGE: Stores the message ID for reaction method
     REACTION_EMOJI: Stores the emoji for reaction method
+    REACTION_PANELS: Stores extra reaction messages (channel and message IDs) for reaction method
     """
 
     VERIFICATION_CHANNEL = "VERIFICATION_CHANNEL"
@@ -39,6 +48,62 @@ class ConfigType(str, Enum):
     REACTION_CHANNEL = "REACTION_CHANNEL"
     REACTION_MESSAGE = "REACTION_MESSAGE"
     REACTION_EMOJI = "REACTION_EMOJI"
+    REACTION_PANELS = "REACTION_PANELS"
+
+
+class SettingsLayout(str, Enum):
+    """An `Enum` storing the layouts guild settings can be stored in
+
+    EAV: One `Config` row per setting
+    JSONB: One JSON document per guild, in `Guild.settings`
+    """
+
+    EAV = "EAV"
+    JSONB = "JSONB"
+
+
+class VerificationEventType(str, Enum):
+    """An `Enum` storing the kinds of verification events logged
+
+    JOIN: Member joined a guild
+    CAPTCHA_SENT: Captcha was displayed to the member
+    PASSED: Member passed verification
+    FAILED: Member answered the captcha wrong
+    TIMED_OUT: Member didn't respond in time
+    """
+
+    JOIN = "JOIN"
+    CAPTCHA_SENT = "CAPTCHA_SENT"
+    PASSED = "PASSED"
+    FAILED = "FAILED"
+    TIMED_OUT = "TIMED_OUT"
+
+
+class StatsPeriod(str, Enum):
+    """An `Enum` storing the periods verification stats are rolled up by
+
+    HOUR: One row per guild per hour
+    DAY: One row per guild per day
+    """
+
+    HOUR = "HOUR"
+    DAY = "DAY"
+
+
+def get_settings_layout() -> SettingsLayout:
+    """Returns the layout the `Config` accessors read from and write to
+
+    Read from `SOTERIA_SETTINGS_LAYOUT` on every call rather than at import,
+    which can be before `.env` got loaded.
+    """
+
+    return SettingsLayout(
+        os.getenv("SOTERIA_SETTINGS_LAYOUT", default=SettingsLayout.EAV).upper()
+    )
+
+
+# Value columns of a `Config`, also used as keys in the `Guild.settings` document
+VALUE_COLUMNS = ("value_int", "value_str", "value_json", "value_bool")
 
 
 class Guild(Model):
@@ -56,6 +121,9 @@ class Guild(Model):
         Bot prefix setting in the guild
     verification_method: VerificationMethod
         Verification Method setting in the guild
+    settings: json
+        Every config of the guild, as `{config type: {value column: value}}`
+        (used with the JSONB settings layout)
     """
 
     id = fields.BigIntField(pk=True)
@@ -65,6 +133,7 @@ class Guild(Model):
     verification_method = fields.CharEnumField(
         VerificationMethod, default=VerificationMethod.DM
     )
+    settings = fields.JSONField(default=dict)
 
     def __int_(self):
         return self.id
@@ -82,6 +151,9 @@ class Guild(Model):
 
         await self.save(update_fields=["bot_prefix"])
 
+        prefix_cache.set(self.id, new_prefix)
+        settings_cache.invalidate(self.id)
+
     def get_verification_method(self):
         """Returns the verification method"""
         return self.verification_method
@@ -94,6 +166,71 @@ class Guild(Model):
 
         await self.save(update_fields=["verification_method"])
 
+        settings_cache.invalidate(self.id)
+
+    @staticmethod
+    async def get_settings(guild_id: int) -> dict:
+        """Returns the settings document of a guild"""
+
+        rows = await Guild.filter(id=guild_id).values_list("settings", flat=True)
+
+        return (rows[0] if rows else None) or {}
+
+    @staticmethod
+    async def merge_settings(guild_id: int, type_: ConfigType, values: dict):
+        """Merges value columns into one config of the settings document
+
+        This is a single statement on postgres, elsewhere it falls back to a
+        read-modify-write inside a transaction.
+        """
+
+        client = Guild._meta.db
+        table = Guild._meta.db_table
+
+        if client.capabilities.dialect == "postgres":
+            await client.execute_query(
+                f'UPDATE "{table}" SET "settings" = COALESCE("settings", \'{{}}\'::jsonb) '
+                f"|| jsonb_build_object($1::text, COALESCE(\"settings\"->$1, '{{}}'::jsonb) || $2::jsonb) "
+                f'WHERE "id" = $3',
+                [type_.value, json.dumps(values), guild_id],
+            )
+            return
+
+        async with in_transaction():
+            guild_obj = await Guild.select_for_update().get_or_none(id=guild_id)
+            if not guild_obj:
+                return
+
+            settings = dict(guild_obj.settings or {})
+            settings[type_.value] = {**settings.get(type_.value, {}), **values}
+
+            guild_obj.settings = settings
+            await guild_obj.save(update_fields=["settings"])
+
+    @staticmethod
+    async def ensure_settings_column(client=None):
+        """Adds the settings column to tables created before it existed
+
+        Runs on `client` if given, e.g. the transaction of a migration.
+        """
+
+        client = client or Guild._meta.db
+        table = Guild._meta.db_table
+
+        if client.capabilities.dialect == "postgres":
+            await execute_script(
+                client,
+                f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "settings" JSONB NOT NULL DEFAULT \'{{}}\';',
+            )
+            return
+
+        _, columns = await client.execute_query(f'PRAGMA table_info("{table}")')
+        if not any(column["name"] == "settings" for column in columns):
+            await execute_script(
+                client,
+                f'ALTER TABLE "{table}" ADD COLUMN "settings" JSON NOT NULL DEFAULT \'{{}}\';',
+            )
+
 
 class Config(Model):
     """Database Model for storing guild specific config values
@@ -121,86 +258,452 @@ class Config(Model):
     value_json = fields.JSONField(null=True)
     value_bool = fields.BooleanField(null=True)
 
+    class Meta:
+        unique_together = (("guild", "type_"),)
+
     def __str__(self):
         return self.value_str
 
     def __int__(self):
         return self.value_int
 
+    @staticmethod
+    async def _get_values(guild: Guild, type_: ConfigType) -> typing.Optional[dict]:
+        """Returns the value columns of a config, served from cache when possible
+
+        Missing configs are cached as `None` too, so "not configured" is cheap as well.
+        """
+
+        key = (guild.pk, type_)
+
+        values = config_cache.get(key, MISSING)
+        if values is MISSING:
+            if get_settings_layout() == SettingsLayout.JSONB:
+                document = (await Guild.get_settings(guild.pk)).get(type_.value)
+                values = document and {
+                    column: document.get(column) for column in VALUE_COLUMNS
+                }
+            else:
+                config = await Config.get_or_none(guild=guild, type_=type_)
+                values = config and {
+                    "value_int": config.value_int,
+                    "value_str": config.value_str,
+                    "value_json": config.value_json,
+                    "value_bool": config.value_bool,
+                }
+
+            config_cache.set(key, values)
+
+        return values
+
+    @staticmethod
+    def invalidate_cache(guild_id: int):
+        """Drops every cached config of a guild, and its settings snapshot"""
+
+        for type_ in ConfigType:
+            config_cache.invalidate((guild_id, type_))
+
+        settings_cache.invalidate(guild_id)
+
     @staticmethod
     async def get_value_str(guild: Guild, type_: ConfigType):
         """Gets the value string for a specific guild with a type"""
-        if not (config := await Config.get_or_none(guild=guild, type_=type_)):
+        if not (values := await Config._get_values(guild, type_)):
             return
-        return config.value_str
+        return values["value_str"]
 
     @staticmethod
     async def get_value_int(guild: Guild, type_: ConfigType):
         """Gets the value int for a specific guild with a type"""
-        if not (config := await Config.get_or_none(guild=guild, type_=type_)):
+        if not (values := await Config._get_values(guild, type_)):
             return
-        return config.value_int
+        return values["value_int"]
 
     @staticmethod
     async def get_value_json(guild: Guild, type_: ConfigType):
         """Gets the value json for a specific guild with a type"""
-        if not (config := await Config.get_or_none(guild=guild, type_=type_)):
+        if not (values := await Config._get_values(guild, type_)):
             return
-        return config.value_json
+        return values["value_json"]
 
     @staticmethod
     async def get_value_bool(guild: Guild, type_: ConfigType):
         """Gets the value bool for a specific guild with a type"""
-        if not (config := await Config.get_or_none(guild=guild, type_=type_)):
+        if not (values := await Config._get_values(guild, type_)):
             return
-        return config.value_bool
+        return values["value_bool"]
 
     @staticmethod
-    async def set_value_str(guild: Guild, type_: ConfigType, value: str):
-        """Sets or creates a config object with the specified value str for a guild"""
-        config = await Config.get_or_create(
-            {"value_str": value}, guild=guild, type_=type_
+    async def set_values(guild: Guild, type_: ConfigType, **values):
+        """Sets one or more value columns of a config for a guild in a single statement
+
+        Uses `INSERT ... ON CONFLICT DO UPDATE` on the unique (guild, type) constraint,
+        so concurrent writers can't race each other into duplicate rows.
+        With the JSONB layout, the values are merged into `Guild.settings` instead.
+
+        Parameters
+        ----------
+        values:
+            Value columns to set, any of `value_int`, `value_str`, `value_json`, `value_bool`
+        """
+
+        if not values or not set(values) <= set(VALUE_COLUMNS):
+            raise ValueError(f"values must be a subset of {VALUE_COLUMNS}")
+
+        if get_settings_layout() == SettingsLayout.JSONB:
+            await Guild.merge_settings(guild.pk, type_, values)
+            config_cache.invalidate((guild.pk, type_))
+            settings_cache.invalidate(guild.pk)
+            return
+
+        if "value_json" in values and values["value_json"] is not None:
+            values["value_json"] = json.dumps(values["value_json"])
+
+        client = Config._meta.db
+        columns = ["guild_id", "type", *values.keys()]
+
+        placeholders = get_placeholders(client, len(columns))
+
+        query = (
+            f'INSERT INTO "{Config._meta.db_table}" ('
+            + ", ".join(f'"{column}"' for column in columns)
+            + ") VALUES ("
+            + ", ".join(placeholders)
+            + ') ON CONFLICT ("guild_id", "type") DO UPDATE SET '
+            + ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in values)
         )
-        if not config[1]:
-            config[0].value_str = value
-            await config[0].save(update_fields=["value_str"])
 
-        return config
+        await client.execute_query(query, [guild.pk, type_.value, *values.values()])
+
+        config_cache.invalidate((guild.pk, type_))
+        settings_cache.invalidate(guild.pk)
+
+    @staticmethod
+    async def set_value_str(guild: Guild, type_: ConfigType, value: str):
+        """Sets or creates a config object with the specified value str for a guild"""
+        await Config.set_values(guild, type_, value_str=value)
 
     @staticmethod
     async def set_value_int(guild: Guild, type_: ConfigType, value: int):
         """Sets or creates a config object with the specified value int for a guild"""
-        config = await Config.get_or_create(
-            {"value_int": value}, guild=guild, type_=type_
-        )
-        if not config[1]:
-            config[0].value_int = value
-            await config[0].save(update_fields=["value_int"])
-
-        return config
+        await Config.set_values(guild, type_, value_int=value)
 
     @staticmethod
     async def set_value_json(
         guild: Guild, type_: ConfigType, value: typing.Union[dict, list]
     ):
         """Sets or creates a config object with the specified value json for a guild"""
-        config = await Config.get_or_create(
-            {"value_json": value}, guild=guild, type_=type_
-        )
-        if not config[1]:
-            config[0].value_json = value
-            await config[0].save(update_fields=["value_json"])
-
-        return config
+        await Config.set_values(guild, type_, value_json=value)
 
     @staticmethod
     async def set_value_bool(guild: Guild, type_: ConfigType, value: bool):
         """Sets or creates a config object with the specified value bool for a guild"""
-        config = await Config.get_or_create(
-            {"value_bool": value}, guild=guild, type_=type_
+        await Config.set_values(guild, type_, value_bool=value)
+
+    @staticmethod
+    async def ensure_unique_index(client=None):
+        """Adds the unique (guild, type) index to tables created before it existed
+
+        Duplicate rows left behind by earlier racing writes are dropped first,
+        keeping the newest one. Runs on `client` if given.
+        """
+
+        client = client or Config._meta.db
+        table = Config._meta.db_table
+
+        await execute_script(
+            client,
+            f'DELETE FROM "{table}" WHERE "id" NOT IN '
+            f'(SELECT MAX("id") FROM "{table}" GROUP BY "guild_id", "type");'
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_guild_id_type_uniq" '
+            f'ON "{table}" ("guild_id", "type");',
+        )
+
+
+class VerificationEvent(Model):
+    """Database Model for the verification event log
+
+    Written in bulk by `utils.events.EventBuffer`, never one at a time.
+    Guild and user are plain IDs, so the log outlives removed guilds.
+
+    Fields
+    ------
+    id : int
+        Event's ID
+    guild_id : int
+        ID of the guild the event happened in
+    user_id : int
+        ID of the member being verified
+    type_ : `VerificationEventType`
+        What happened
+    method : `VerificationMethod`
+        Verification method in use, if known
+    created_at : datetime
+        When it happened
+    """
+
+    id = fields.BigIntField(pk=True)
+    guild_id = fields.BigIntField(index=True)
+    user_id = fields.BigIntField()
+    type_ = fields.CharEnumField(VerificationEventType, source_field="type")
+    method = fields.CharEnumField(VerificationMethod, null=True)
+    created_at = fields.DatetimeField(index=True)
+
+
+class VerificationRollup(Model):
+    """Database Model for verification outcome counts of a guild in a period
+
+    Incremented in bulk by `utils.stats.StatsRecorder`, so reading stats never
+    has to scan the event log.
+
+    Fields
+    ------
+    guild_id : int
+        ID of the guild
+    period : `StatsPeriod`
+        Length of the period
+    started_at : datetime
+        Start of the period
+    passed : int
+        Verifications passed
+    failed : int
+        Captchas answered wrong
+    timed_out : int
+        Verifications timed out
+    solve_time_total_ms : int
+        Sum of solve times, of passed and failed captchas
+    solve_time_count : int
+        Amount of solve times summed
+    """
+
+    id = fields.BigIntField(pk=True)
+    guild_id = fields.BigIntField()
+    period = fields.CharEnumField(StatsPeriod)
+    started_at = fields.DatetimeField()
+    passed = fields.IntField(default=0)
+    failed = fields.IntField(default=0)
+    timed_out = fields.IntField(default=0)
+    solve_time_total_ms = fields.BigIntField(default=0)
+    solve_time_count = fields.IntField(default=0)
+
+    class Meta:
+        unique_together = (("guild_id", "period", "started_at"),)
+
+
+class VerificationSolveTimeBin(Model):
+    """Database Model for a solve time histogram bin of a `VerificationRollup`
+
+    Fields
+    ------
+    guild_id : int
+        ID of the guild
+    period : `StatsPeriod`
+        Length of the period
+    started_at : datetime
+        Start of the period
+    bin : int
+        Index into `utils.stats.SOLVE_TIME_BINS`
+    count : int
+        Solve times falling into the bin
+    """
+
+    id = fields.BigIntField(pk=True)
+    guild_id = fields.BigIntField()
+    period = fields.CharEnumField(StatsPeriod)
+    started_at = fields.DatetimeField()
+    bin = fields.SmallIntField()
+    count = fields.IntField(default=0)
+
+    class Meta:
+        unique_together = (("guild_id", "period", "started_at", "bin"),)
+
+
+@dataclass(frozen=True)
+class GuildSettings:
+    """Immutable snapshot of a guild's row and all of its config values
+
+    Loaded with a single query at the start of a verification and passed along
+    every step of it, instead of each step querying on its own.
+
+    Fields
+    ------
+    guild_id : int
+        Guild's ID
+    name : str
+        Guild's name
+    owner_id : int
+        Guild owner's ID
+    bot_prefix : str
+        Bot prefix setting in the guild
+    verification_method: VerificationMethod
+        Verification Method setting in the guild
+    configs: Mapping[ConfigType, dict]
+        Value columns (value_int, value_str, value_json, value_bool) per config type
+    """
+
+    guild_id: int
+    name: str
+    owner_id: int
+    bot_prefix: str
+    verification_method: VerificationMethod
+    configs: typing.Mapping[ConfigType, dict]
+
+    @classmethod
+    async def load(cls, guild_id: int) -> typing.Optional["GuildSettings"]:
+        """Loads the snapshot for a guild, returns `None` if the guild isn't stored
+
+        Snapshots are immutable, so a cached one is shared by every caller until
+        a setting of the guild changes.
+        """
+
+        if settings := settings_cache.get(guild_id):
+            return settings
+
+        if get_settings_layout() == SettingsLayout.JSONB:
+            settings = await cls._load_from_document(guild_id)
+        else:
+            settings = await cls._load_from_configs(guild_id)
+
+        # guilds which aren't stored yet are left out, they're about to be
+        if settings:
+            settings_cache.set(guild_id, settings)
+
+        return settings
+
+    @classmethod
+    async def _load_from_configs(
+        cls, guild_id: int
+    ) -> typing.Optional["GuildSettings"]:
+        """Loads the snapshot from the guild row and its `Config` rows (EAV layout)"""
+
+        # LEFT JOINs the configs, so this is one row per config (or one without any)
+        rows = await Guild.filter(id=guild_id).values(
+            "id",
+            "name",
+            "owner_id",
+            "bot_prefix",
+            "verification_method",
+            "configs__type_",
+            "configs__value_int",
+            "configs__value_str",
+            "configs__value_json",
+            "configs__value_bool",
         )
-        if not config[1]:
-            config[0].value_bool = value
-            await config[0].save(update_fields=["value_bool"])
+        if not rows:
+            return
+
+        configs = {}
+        for row in rows:
+            if row["configs__type_"] is None:
+                continue
+
+            configs[ConfigType(row["configs__type_"])] = {
+                "value_int": row["configs__value_int"],
+                "value_str": row["configs__value_str"],
+                "value_json": row["configs__value_json"],
+                "value_bool": row["configs__value_bool"],
+            }
+
+        row = rows[0]
+
+        return cls(
+            guild_id=row["id"],
+            name=row["name"],
+            owner_id=row["owner_id"],
+            bot_prefix=row["bot_prefix"],
+            verification_method=VerificationMethod(row["verification_method"]),
+            configs=MappingProxyType(configs),
+        )
+
+    @classmethod
+    async def _load_from_document(
+        cls, guild_id: int
+    ) -> typing.Optional["GuildSettings"]:
+        """Loads the snapshot from the guild row alone (JSONB layout)"""
+
+        rows = await Guild.filter(id=guild_id).values(
+            "id", "name", "owner_id", "bot_prefix", "verification_method", "settings"
+        )
+        if not rows:
+            return
+
+        row = rows[0]
+
+        return cls(
+            guild_id=row["id"],
+            name=row["name"],
+            owner_id=row["owner_id"],
+            bot_prefix=row["bot_prefix"],
+            verification_method=VerificationMethod(row["verification_method"]),
+            configs=MappingProxyType(configs_from_document(row["settings"])),
+        )
+
+    def is_set(self, type_: ConfigType) -> bool:
+        """Returns a boolean signifying if a config exists for the type"""
+        return type_ in self.configs
+
+    def get_value_str(self, type_: ConfigType):
+        """Gets the value string for a type"""
+        if not (config := self.configs.get(type_)):
+            return
+        return config["value_str"]
+
+    def get_value_int(self, type_: ConfigType):
+        """Gets the value int for a type"""
+        if not (config := self.configs.get(type_)):
+            return
+        return config["value_int"]
+
+    def get_value_json(self, type_: ConfigType):
+        """Gets the value json for a type"""
+        if not (config := self.configs.get(type_)):
+            return
+        return config["value_json"]
+
+    def get_value_bool(self, type_: ConfigType):
+        """Gets the value bool for a type"""
+        if not (config := self.configs.get(type_)):
+            return
+        return config["value_bool"]
+
+
+def configs_from_document(document: typing.Optional[dict]) -> dict:
+    """Converts a `Guild.settings` document into `{ConfigType: value columns}`"""
+
+    return {
+        ConfigType(type_): {column: values.get(column) for column in VALUE_COLUMNS}
+        for type_, values in (document or {}).items()
+    }
+
+
+async def migrate_configs_to_settings(batch_size: int = 500) -> int:
+    """Copies every `Config` row into the `Guild.settings` documents
+
+    Existing `Config` rows are left untouched, so switching back to the EAV
+    layout stays possible. Running it again simply rewrites the documents.
+    Returns the number of guilds migrated.
+    """
+
+    await Guild.ensure_settings_column()
+
+    rows = await Config.all().values("guild_id", "type_", *VALUE_COLUMNS)
+
+    documents = {}
+    for row in rows:
+        documents.setdefault(row["guild_id"], {})[ConfigType(row["type_"]).value] = {
+            column: row[column] for column in VALUE_COLUMNS
+        }
+
+    guilds = [
+        Guild(id=guild_id, settings=document)
+        for guild_id, document in documents.items()
+    ]
+
+    async with in_transaction():
+        for i in range(0, len(guilds), batch_size):
+            await bulk_update(Guild, guilds[i : i + batch_size], ["settings"])
+
+    for guild_id in documents:
+        Config.invalidate_cache(guild_id)
 
-        return config
+    return len(guilds)
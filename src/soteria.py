@@ -1,5 +1,7 @@
+import asyncio
 import os
 import sys
+import time
 
 from pathlib import Path
 
@@ -10,24 +12,93 @@ import coloredlogs
 from discord.ext import commands
 from dotenv import load_dotenv
 from tortoise import Tortoise
-
-from models import Guild
+from tortoise.transactions import in_transaction
+
+from captcha import (
+    Captcha,
+    CaptchaBackendType,
+    get_captcha_api_urls,
+    get_captcha_backend,
+    get_captcha_backend_type,
+    get_captcha_optimizer,
+)
+from migrations import (
+    LATEST_VERSION,
+    SchemaOutdatedError,
+    get_schema_version,
+    migrate,
+)
+from models import Config, Guild, VerificationEvent
+from utils.cache import configure_caches, prefix_cache, settings_cache
+from utils.captcha_pool import CaptchaPool
+from utils.db import (
+    PoolMetrics,
+    bulk_update,
+    get_acquire_timeout,
+    get_tortoise_config,
+    instrument_pool,
+)
 from utils.embeds import EmbedGen
+from utils.events import EventBuffer
 from utils.logging import get_bot_logger, setup_discord_logging
-
-# Logs from discord library itself
-setup_discord_logging()
+from utils.members import (
+    MemberCounter,
+    get_member_cache_policy,
+    get_member_cache_settings,
+)
+from utils.prefix import PrefixMatcher
+from utils.reactions import ReactionPanelIndex
+from utils.shards import ShardStats
+from utils.stats import StatsRecorder
 
 # Define Intents
 intents = discord.Intents.default()
 intents.members = True
 
-# Load environment variables from `.env` file
+# Load environment variables from `.env` file, before anything below reads them
 load_dotenv()
 
+# Logs from discord library itself, into `SOTERIA_LOG_DIR`
+setup_discord_logging()
+
+# Member cache policy, see `utils.members.MemberCachePolicy`
+MEMBER_CACHE_POLICY = get_member_cache_policy()
+
+
+def get_shard_settings():
+    """Returns the shard kwargs from environment, or `None` if sharding is disabled
+
+    Sharding is enabled by `SOTERIA_SHARDED=1` or by setting any of
+    `SOTERIA_SHARD_COUNT` / `SOTERIA_SHARD_IDS` (comma separated).
+    """
+
+    shard_count = os.getenv("SOTERIA_SHARD_COUNT")
+    shard_ids = os.getenv("SOTERIA_SHARD_IDS")
+
+    if not (os.getenv("SOTERIA_SHARDED") == "1" or shard_count or shard_ids):
+        return
+
+    shard_settings = {}
+
+    if shard_count:
+        shard_settings["shard_count"] = int(shard_count)
+
+    if shard_ids:
+        shard_settings["shard_ids"] = [
+            int(shard_id) for shard_id in shard_ids.split(",") if shard_id.strip()
+        ]
+
+    return shard_settings
+
+
+SHARD_SETTINGS = get_shard_settings()
+
+# Opt-in sharded mode; every shard still lives in this one process
+BotBase = commands.AutoShardedBot if SHARD_SETTINGS is not None else commands.Bot
 
-class Soteria(commands.Bot):
-    """Subclass of `commands.Bot` for more control"""
+
+class Soteria(BotBase):
+    """Subclass of `commands.Bot` (or `commands.AutoShardedBot`) for more control"""
 
     def __init__(self, *args, **kwargs):
         super().__init__(
@@ -36,6 +107,8 @@ class Soteria(commands.Bot):
             case_insensitive=True,
             intents=intents,
             owner_id=342545053169877006,
+            **get_member_cache_settings(MEMBER_CACHE_POLICY, intents),
+            **(SHARD_SETTINGS or {}),
             **kwargs,
         )
 
@@ -47,11 +120,24 @@ class Soteria(commands.Bot):
 
         self.logger.info("Starting up Soteria...")
 
+        # Cache sizes from the environment, `.env` included
+        configure_caches()
+
         # Check if discord token is set, if not exit process
         if not "SOTERIA_DISCORD_TOKEN" in os.environ:
             self.logger.critical("SOTERIA_DISCORD_TOKEN not set!")
             sys.exit(1)
 
+        # The HTTP captcha backend can't do anything without the API's URL
+        if (
+            get_captcha_backend_type() == CaptchaBackendType.HTTP
+            and not get_captcha_api_urls()
+        ):
+            self.logger.critical(
+                "SOTERIA_CAPTCHA_API_URL not set! Set it, or set SOTERIA_CAPTCHA_BACKEND=LOCAL"
+            )
+            sys.exit(1)
+
         # Internal bot-level constants
         self._DISCORD_TOKEN = os.getenv("SOTERIA_DISCORD_TOKEN")
         self._DB_URI = os.getenv("SOTERIA_DB_URI")
@@ -59,15 +145,77 @@ class Soteria(commands.Bot):
         # Global bot-level constants
         self.DEFAULT_PREFIX = os.getenv("SOTERIA_DEFAULT_PREFIX", "s!")
         self.PRESENCE_TEXT = os.getenv("SOTERIA_PRESENCE_TEXT", "humans")
-        self.CAPTCHA_API_URL = os.getenv("SOTERIA_CAPTCHA_API_URL")
+        self.CAPTCHA_TTL = float(os.getenv("SOTERIA_CAPTCHA_TTL", default="300"))
+        self.MEMBER_CACHE_POLICY = MEMBER_CACHE_POLICY
         self.IGNORED_COGS = ()
 
         # Embed generator
         self.embed_gen = EmbedGen()
 
+        # Rejects messages which can't be commands before anything gets awaited
+        self.prefix_matcher = PrefixMatcher(self.DEFAULT_PREFIX)
+
         # Load Jishaku
         self.load_extension("jishaku")
 
+        # Per-shard gateway event rates
+        self.shard_stats = ShardStats()
+        self.shard_stats.set_shard_count(self.shard_count)
+
+        # Per-guild human counts, used for placeholders
+        self.member_counter = MemberCounter(self.MEMBER_CACHE_POLICY)
+
+        # Passes DMs between clusters, set by `launcher.py` when clustered
+        self.dm_forwarder = None
+
+        # Reaction verification messages, so unrelated reactions are dropped early
+        self.reaction_panels = ReactionPanelIndex()
+
+        # DB connection pool saturation, filled in once the pool exists
+        self.pool_metrics = PoolMetrics()
+
+        # Verification event log, written in bulk in the background
+        self.verification_events = EventBuffer(
+            VerificationEvent,
+            ["guild_id", "user_id", "type_", "method", "created_at"],
+            maxsize=int(os.getenv("SOTERIA_EVENT_BUFFER_SIZE", default="10000")),
+            flush_size=int(os.getenv("SOTERIA_EVENT_FLUSH_SIZE", default="500")),
+            flush_interval=float(
+                os.getenv("SOTERIA_EVENT_FLUSH_INTERVAL", default="5")
+            ),
+        )
+
+        # Re-encodes captchas smaller before upload, if `SOTERIA_CAPTCHA_OPTIMIZE` is set
+        self.captcha_optimizer = get_captcha_optimizer()
+
+        # Captchas fetched ahead of time, so joins don't wait on the captcha API
+        self.captcha_pool = CaptchaPool(
+            self._new_captcha,
+            low_watermark=int(os.getenv("SOTERIA_CAPTCHA_POOL_LOW", default="20")),
+            high_watermark=int(os.getenv("SOTERIA_CAPTCHA_POOL_HIGH", default="100")),
+            # leave the 60 second answer window (and some slack) to the UUID
+            max_age=max(self.CAPTCHA_TTL - 90, 0),
+        )
+
+        # Hourly and daily verification rollups, also prunes old history
+        self.verification_stats = StatsRecorder(
+            flush_interval=float(
+                os.getenv("SOTERIA_STATS_FLUSH_INTERVAL", default="10")
+            ),
+            event_retention_days=int(
+                os.getenv("SOTERIA_EVENT_RETENTION_DAYS", default="30")
+            ),
+            hourly_retention_days=int(
+                os.getenv("SOTERIA_HOURLY_STATS_RETENTION_DAYS", default="7")
+            ),
+            daily_retention_days=int(
+                os.getenv("SOTERIA_DAILY_STATS_RETENTION_DAYS", default="365")
+            ),
+        )
+
+        # Set once `prepare` finished, buffered writes are only flushed after it
+        self.prepared = False
+
         # Start the startup task
         self.startup_task = self.loop.create_task(self.startup())
 
@@ -80,6 +228,45 @@ class Soteria(commands.Bot):
 
         return False
 
+    @property
+    def is_sharded(self):
+        """Returns a boolean signifying if bot is running in sharded mode"""
+        return isinstance(self, commands.AutoShardedBot)
+
+    def get_shard_summaries(self):
+        """Returns a list of dicts holding latency, guild count and event rate per shard"""
+
+        if self.is_sharded:
+            latencies = dict(self.latencies)
+        else:
+            latencies = {0: self.latency}
+
+        guild_counts = {}
+        for guild in self.guilds:
+            guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+
+        return [
+            {
+                "id": shard_id,
+                "latency": latency,
+                "guilds": guild_counts.get(shard_id, 0),
+                "event_rate": self.shard_stats.per_second(shard_id),
+            }
+            for shard_id, latency in sorted(latencies.items())
+        ]
+
+    def dispatch(self, event_name, *args, **kwargs):
+        """Records raw gateway payloads for shard stats, member counts and DM forwarding before dispatching as usual"""
+
+        if event_name == "socket_response":
+            self.shard_stats.record(args[0])
+            self.member_counter.record(args[0])
+
+            if self.dm_forwarder:
+                self.dm_forwarder.record(args[0])
+
+        super().dispatch(event_name, *args, **kwargs)
+
     def _load_cogs(self, directory: os.PathLike):
         """Loads cogs from specified directory
 
@@ -113,13 +300,124 @@ class Soteria(commands.Bot):
     async def _init_db(self, db_uri: str):
         """Initializes database ORM"""
 
-        await Tortoise.init(db_url=db_uri, modules={"models": ["models"]})
+        await Tortoise.init(config=get_tortoise_config(db_uri))
+
+        if instrument_pool(
+            Tortoise.get_connection("default"), self.pool_metrics, get_acquire_timeout()
+        ):
+            pool_stats = self.pool_metrics.stats()
+            self.logger.info(
+                f"DB pool sized {pool_stats['min_size']}-{pool_stats['max_size']} connections"
+            )
+
+        # One cheap query, instead of introspecting the schema on every boot
+        schema_version = await get_schema_version()
 
-        self.logger.info("Generating schemas...")
-        await Tortoise.generate_schemas(safe=True)
+        if schema_version < LATEST_VERSION:
+            if os.getenv("SOTERIA_AUTO_MIGRATE") != "1":
+                error = SchemaOutdatedError(schema_version, LATEST_VERSION)
+                self.logger.critical(str(error))
+                raise error
+
+            self.logger.info(
+                f"Migrating schema from version {schema_version} to {LATEST_VERSION}..."
+            )
+            await migrate(
+                on_applied=lambda migration: self.logger.info(
+                    f"Applied migration {migration.version}: {migration.description}"
+                )
+            )
+        elif schema_version > LATEST_VERSION:
+            self.logger.warning(
+                f"Database schema is at version {schema_version}, newer than this code ({LATEST_VERSION})"
+            )
 
         self.logger.info("Initialized DB")
 
+    async def _reconcile_guilds(self, batch_size: int = 1000):
+        """Brings the `Guild` table in sync with the guilds the bot is in
+
+        Missing rows are inserted, renamed or transferred guilds are updated and
+        rows of guilds removed while offline are deleted, all in bulk statements.
+        The prefix cache is warmed from the same fetch.
+
+        When running a subset of shards, only rows belonging to those shards are
+        touched; the rest are owned by other processes.
+        """
+
+        started_at = time.perf_counter()
+
+        shard_ids = getattr(self, "shard_ids", None)
+        shard_ids = set(shard_ids) if shard_ids is not None else None
+
+        stored = {
+            guild_id: (name, owner_id, bot_prefix)
+            for guild_id, name, owner_id, bot_prefix in await Guild.all().values_list(
+                "id", "name", "owner_id", "bot_prefix"
+            )
+            if shard_ids is None or self.shard_stats.shard_for(guild_id) in shard_ids
+        }
+
+        to_create = []
+        to_update = []
+
+        for guild in self.guilds:
+            row = stored.pop(guild.id, None)
+
+            # guilds in an outage have no name or owner, their rows stay as they are
+            if guild.unavailable:
+                if row is not None:
+                    prefix_cache.set(guild.id, row[2])
+
+                continue
+
+            if row is None:
+                to_create.append(
+                    Guild(
+                        id=guild.id,
+                        name=guild.name,
+                        owner_id=guild.owner_id,
+                        bot_prefix=self.DEFAULT_PREFIX,
+                    )
+                )
+                prefix_cache.set(guild.id, self.DEFAULT_PREFIX)
+                continue
+
+            name, owner_id, bot_prefix = row
+            if name != guild.name or owner_id != guild.owner_id:
+                to_update.append(
+                    Guild(id=guild.id, name=guild.name, owner_id=guild.owner_id)
+                )
+
+            prefix_cache.set(guild.id, bot_prefix)
+
+        to_delete = list(stored.keys())  # whatever is left, isn't a guild anymore
+
+        async with in_transaction():
+            for i in range(0, len(to_create), batch_size):
+                await Guild.bulk_create(to_create[i : i + batch_size])
+
+            for i in range(0, len(to_update), batch_size):
+                await bulk_update(
+                    Guild, to_update[i : i + batch_size], ["name", "owner_id"]
+                )
+
+            for i in range(0, len(to_delete), batch_size):
+                await Guild.filter(id__in=to_delete[i : i + batch_size]).delete()
+
+        for guild_id in to_delete:
+            Config.invalidate_cache(guild_id)
+            self.reaction_panels.remove_guild(guild_id)
+
+        # snapshots carry the name and owner too
+        for guild_obj in to_update:
+            settings_cache.invalidate(guild_obj.pk)
+
+        self.logger.info(
+            f"Reconciled guilds in {(time.perf_counter() - started_at) * 1000:.0f}ms "
+            f"(created: {len(to_create)}, updated: {len(to_update)}, deleted: {len(to_delete)})"
+        )
+
     async def _set_presence(self, presence_text: str):
         """Sets the bot presence on startup"""
 
@@ -143,17 +441,22 @@ class Soteria(commands.Bot):
         if not message.guild:
             return commands.when_mentioned_or(self.DEFAULT_PREFIX)(self, message)
 
-        # Else fetch the custom prefix for that guild
-        custom_prefix = (
-            await Guild.get_or_create(
-                {
-                    "name": message.guild.name,
-                    "owner_id": message.guild.owner_id,
-                    "bot_prefix": self.DEFAULT_PREFIX,
-                },
-                id=message.guild.id,
-            )
-        )[0].get_bot_prefix()
+        # Serve the custom prefix from cache, hitting the DB only on a miss
+        custom_prefix = prefix_cache.get(message.guild.id)
+
+        if custom_prefix is None:
+            custom_prefix = (
+                await Guild.get_or_create(
+                    {
+                        "name": message.guild.name,
+                        "owner_id": message.guild.owner_id,
+                        "bot_prefix": self.DEFAULT_PREFIX,
+                    },
+                    id=message.guild.id,
+                )
+            )[0].get_bot_prefix()
+
+            prefix_cache.set(message.guild.id, custom_prefix)
 
         return commands.when_mentioned_or(custom_prefix)(self, message)
 
@@ -161,43 +464,52 @@ class Soteria(commands.Bot):
         """Event emitted on guild joins"""
         self.logger.info(f"I got added to a new server: {guild}")
 
-        # Creates a new `Guild` object
-        await Guild.create(
+        # Creates a new `Guild` object, unless startup reconciliation got to it first
+        guild_obj, _ = await Guild.get_or_create(
+            {
+                "name": guild.name,
+                "owner_id": guild.owner_id,
+                "bot_prefix": self.DEFAULT_PREFIX,
+            },
             id=guild.id,
-            name=guild.name,
-            owner_id=guild.owner_id,
-            bot_prefix=self.DEFAULT_PREFIX,
         )
 
+        prefix_cache.set(guild.id, guild_obj.get_bot_prefix())
+
     async def on_guild_remove(self, guild: discord.Guild):
         """Event emitted on guild removes"""
         self.logger.info(f"I got removed from this server: {guild}")
 
         # Deletes the `Guild` object
-        await (await Guild.get(id=guild.id)).delete()
+        await Guild.filter(id=guild.id).delete()
+
+        prefix_cache.invalidate(guild.id)
+        self.member_counter.forget(guild.id)
+        Config.invalidate_cache(guild.id)
+        self.reaction_panels.remove_guild(guild.id)
 
     async def on_message(self, message: discord.Message):
         """Event emmited on every message create
 
         This is responsible for the following:
+            - Drop messages which can't be commands, without awaiting anything
             - Reply back with prefix, when mentioned
         """
 
-        if message.author == self.user:  # ignore, if the message by the bot itself
+        if message.author.bot:  # ignore if message author is a bot (or the bot itself)
             return
 
-        if message.author.bot:  # ignore if message author is a bot
+        # DMs from the cluster holding shard 0 only resolve `wait_for` calls here,
+        # commands in them were already processed there
+        if self.dm_forwarder and self.dm_forwarder.is_forwarded(message):
             return
 
-        if len(message.mentions) > 1:  # ignore, if more than 1 mentions
-            await self.process_commands(message)
+        if not self.prefix_matcher.match(message):  # can't be a command, drop it
             return
 
-        if len(message.content.split()) > 1:  # ignore, if more than 1 words
-            await self.process_commands(message)
-            return
-
-        if self.user.id in message.raw_mentions:  # if bot user was mentioned
+        if self.prefix_matcher.is_bare_mention(
+            message.content
+        ):  # if only the bot user was mentioned
             prefixes = (await self.get_prefix(message))[1:]
 
             await message.channel.send(f"My prefixes are: {', '.join(prefixes)}")
@@ -206,44 +518,149 @@ class Soteria(commands.Bot):
             message
         )  # make sure other commands are processed after this event
 
+    async def _timed(self, timings: dict, phase: str, coro):
+        """Awaits a coroutine and records how long it took under `phase`"""
+
+        started_at = time.perf_counter()
+        result = await coro
+        timings[phase] = (time.perf_counter() - started_at) * 1000
+
+        return result
+
+    async def _create_aio_session(self):
+        """Creates the shared `aiohttp.ClientSession`"""
+
+        # This can only be set inside an async function
+        self.aio_session = aiohttp.ClientSession()
+
+        # Generates and verifies captchas, picked by `SOTERIA_CAPTCHA_BACKEND`
+        self.captcha_backend = get_captcha_backend(self.CAPTCHA_TTL)
+
+    async def _new_captcha(self) -> Captcha:
+        """Fetches a new captcha and decodes (and optimizes) it, ready to be sent"""
+
+        captcha = await self.captcha_backend.new()
+        captcha.decode()
+
+        # shrink the upload while the captcha waits in the pool
+        if self.captcha_optimizer:
+            await self.captcha_optimizer.optimize(captcha)
+
+        return captcha
+
+    async def prepare(self):
+        """Runs everything which doesn't need a gateway connection, before login
+
+        This is responsible for the following:
+            - Initializes database connections
+            - Create the aiohttp session
+            - Load cogs
+            - Build the reaction panel index
+            - Start writing the verification event log and stats
+            - Start filling the captcha pool
+
+        It's awaited by `start` before logging in, so listeners exist and the
+        ORM is usable before the first gateway event arrives. DB init and the
+        session are started first, their connection attempts are in flight
+        while the cogs get loaded (which blocks the loop).
+        """
+
+        started_at = time.perf_counter()
+        timings = {}
+
+        db_task = self.loop.create_task(
+            self._timed(timings, "db", self._init_db(self._DB_URI))
+        )
+        session_task = self.loop.create_task(
+            self._timed(timings, "session", self._create_aio_session())
+        )
+
+        # let both tasks send their connection attempts before blocking the loop
+        await asyncio.sleep(0)
+
+        # Load cogs, while the DB handshake is in flight
+        cogs_started_at = time.perf_counter()
+        self._load_cogs(Path(os.path.join(Path(__file__).parent, "cogs")))
+        timings["cogs"] = (time.perf_counter() - cogs_started_at) * 1000
+
+        await asyncio.gather(db_task, session_task)
+
+        # Needs the DB, but not the gateway
+        await self._timed(timings, "reaction_panels", self.reaction_panels.load())
+
+        self.verification_events.start(self.loop)
+        self.verification_stats.start(self.loop)
+        self.captcha_pool.start(self.loop)
+
+        self.prepared = True
+
+        self.logger.info(
+            f"Prepared in {(time.perf_counter() - started_at) * 1000:.0f}ms ("
+            + ", ".join(f"{phase}: {ms:.0f}ms" for phase, ms in timings.items())
+            + ")"
+        )
+
+    async def start(self, *args, **kwargs):
+        """Prepares the bot and then logs in and connects to the gateway"""
+
+        await self.prepare()
+        await super().start(*args, **kwargs)
+
     async def startup(self):
         """A custom `asyncio.Task` which runs on bot's initial bootup (startup)
 
+        Everything not depending on the gateway is done beforehand in `prepare`.
+
         This is responsible for the following:
-            - Load cogs
-            - Initializes database connections
+            - Reconcile stored guilds and warm the prefix cache
             - Set a discord presence
         """
 
         await self.wait_until_ready()  # waits until the bot's internal cache is ready
 
+        started_at = time.perf_counter()
+
         self.logger.info(f"Connected to discord as {self.user}")
 
-        # Load cogs
-        self._load_cogs(Path(os.path.join(Path(__file__).parent, "cogs")))
+        self.prefix_matcher.set_bot_user(self.user.id)
+
+        # Shard count is only known for sure once connected
+        self.shard_stats.set_shard_count(self.shard_count)
 
-        # Init DB
-        await self._init_db(self._DB_URI)
+        # Sync stored guilds with the ones we're in
+        await self._reconcile_guilds()
 
         # Set Presence
         await self._set_presence(self.PRESENCE_TEXT)
 
-        # This can only be set inside an async function
-        self.aio_session = aiohttp.ClientSession()
-
-        self.logger.info("Bot is ready for use!")
+        self.logger.info(
+            f"Bot is ready for use! (post-ready startup took {(time.perf_counter() - started_at) * 1000:.0f}ms)"
+        )
 
     async def close(self):
         """Closes the underlying connections for a clean exit"""
 
         self.logger.warning("Closing connections...")
 
+        # write buffered events, while the DB is still connected
+        if self.prepared:
+            await self.verification_events.close()
+            await self.verification_stats.close()
+
         await Tortoise.close_connections()
 
+        await self.captcha_pool.close()
+
+        if hasattr(self, "captcha_backend"):
+            await self.captcha_backend.close()
+
+        if self.dm_forwarder:
+            self.dm_forwarder.close()
+
         if not self.startup_task.cancelled():
             self.startup_task.cancel()
 
-        if not self.aio_session.closed:
+        if hasattr(self, "aio_session") and not self.aio_session.closed:
             await self.aio_session.close()
 
         self.logger.critical("Bye!")
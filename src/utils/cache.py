@@ -0,0 +1,153 @@
+import os
+import time
+import typing
+
+from collections import OrderedDict
+
+# Returned by `LRUCache.get` by default on a miss, so `None` can be cached as a value
+MISSING = object()
+
+
+class LRUCache:
+    """A bounded, process-local cache with least-recently-used eviction
+
+    Keeps hit/miss/eviction counters around so we can tell how effective it is.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of entries held before the oldest one gets evicted
+    ttl: Optional[float]
+        Seconds after which an entry expires, entries never expire if `None`
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: typing.Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._data = OrderedDict()
+        self._expires_at = {}
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key` and marks it as recently used"""
+
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if self.ttl is not None and self._expires_at[key] <= time.monotonic():
+            self.invalidate(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def peek(self, key, default=None):
+        """Returns the cached value for `key` without touching recency or counters"""
+
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        """Inserts or replaces `key`, evicting the least recently used entry if full"""
+
+        self._data[key] = value
+        self._data.move_to_end(key)
+
+        if self.ttl is not None:
+            self._expires_at[key] = time.monotonic() + self.ttl
+
+        while len(self._data) > self.maxsize:
+            evicted_key, _ = self._data.popitem(last=False)
+            self._expires_at.pop(evicted_key, None)
+            self.evictions += 1
+
+    def resize(self, maxsize: int):
+        """Changes `maxsize`, evicting the least recently used entries if over it"""
+
+        self.maxsize = maxsize
+
+        while len(self._data) > self.maxsize:
+            evicted_key, _ = self._data.popitem(last=False)
+            self._expires_at.pop(evicted_key, None)
+            self.evictions += 1
+
+    def update(self, items):
+        """Bulk inserts an iterable of (key, value) pairs"""
+
+        for key, value in items:
+            self.set(key, value)
+
+    def invalidate(self, key):
+        """Removes `key` from the cache, if present"""
+
+        self._data.pop(key, None)
+        self._expires_at.pop(key, None)
+
+    def clear(self):
+        """Removes every entry from the cache"""
+
+        self._data.clear()
+        self._expires_at.clear()
+
+    def stats(self) -> dict:
+        """Returns a dict of cache counters"""
+
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+# Guild ID -> bot prefix, kept in sync by `Guild.set_bot_prefix` and guild join/remove events
+# sized by `configure_caches`, once the environment is loaded
+prefix_cache = LRUCache(maxsize=100000)
+
+# (Guild ID, ConfigType) -> value columns (or `None` if not configured), used by `Config`
+config_cache = LRUCache(maxsize=100000)
+
+# Guild ID -> `GuildSettings` snapshot, used by `GuildSettings.load`
+settings_cache = LRUCache(maxsize=100000)
+
+
+def configure_caches():
+    """Applies the cache settings from the environment
+
+    The caches get created at import time, which can be before `load_dotenv`
+    ran, so this is called once the environment is complete.
+    """
+
+    prefix_cache.resize(int(os.getenv("SOTERIA_PREFIX_CACHE_SIZE", default="100000")))
+
+    # snapshots hold the same values as the configs, so they share the settings
+    ttl = os.getenv("SOTERIA_CONFIG_CACHE_TTL")
+    for cache in (config_cache, settings_cache):
+        # entries cached so far have no expiry, drop them instead of mixing
+        cache.clear()
+        cache.ttl = float(ttl) if ttl else None
+        cache.resize(int(os.getenv("SOTERIA_CONFIG_CACHE_SIZE", default="100000")))
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import logging
+import time
+import typing
+
+from captcha import Captcha
+
+logger = logging.getLogger("bot.captcha")
+
+
+class CaptchaPool:
+    """Keeps captchas fetched and decoded ahead of time, off the join path
+
+    A background task tops the pool up to `high_watermark` whenever it drops
+    below `low_watermark`. Captchas older than `max_age` are thrown away, so a
+    handed out captcha's UUID stays valid for the whole answer window. When the
+    pool is empty `get` falls back to fetching directly.
+
+    Parameters
+    ----------
+    factory : Callable[[], Awaitable[Captcha]]
+        Fetches and decodes a new captcha
+    low_watermark : int
+        Depth at which refilling starts
+    high_watermark : int
+        Depth refilling stops at, 0 disables the pool
+    max_age : float
+        Seconds a captcha may wait in the pool
+    concurrency : int
+        Captchas fetched in parallel while refilling
+    """
+
+    def __init__(
+        self,
+        factory: typing.Callable[[], typing.Awaitable[Captcha]],
+        low_watermark: int = 20,
+        high_watermark: int = 100,
+        max_age: float = 240.0,
+        concurrency: int = 5,
+    ):
+        self.factory = factory
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.high_watermark = high_watermark
+        self.max_age = max_age
+        self.concurrency = concurrency
+
+        # (monotonic time fetched at, captcha), oldest first
+        self._captchas: typing.Deque[typing.Tuple[float, Captcha]] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.fetched = 0
+        self.fetch_errors = 0
+        self.last_refill_ms = 0.0
+
+    def __len__(self):
+        return len(self._captchas)
+
+    def _discard_expired(self):
+        oldest_allowed = time.monotonic() - self.max_age
+
+        while self._captchas and self._captchas[0][0] < oldest_allowed:
+            self._captchas.popleft()
+            self.expired += 1
+
+    async def get(self) -> Captcha:
+        """Returns a ready captcha, fetching one directly if the pool is dry"""
+
+        self._discard_expired()
+
+        if len(self._captchas) < self.low_watermark:
+            self._wakeup.set()
+
+        if self._captchas:
+            self.hits += 1
+            return self._captchas.popleft()[1]
+
+        self.misses += 1
+        return await self.factory()
+
+    async def _fetch(self):
+        try:
+            captcha = await self.factory()
+        except Exception:
+            self.fetch_errors += 1
+            logger.exception("Failed to fetch a captcha for the pool")
+            return False
+
+        self._captchas.append((time.monotonic(), captcha))
+        self.fetched += 1
+
+        return True
+
+    async def refill(self):
+        """Fetches captchas until the pool is at the high watermark
+
+        Stops early if a whole round of fetches failed.
+        """
+
+        started_at = time.perf_counter()
+
+        while (missing := self.high_watermark - len(self._captchas)) > 0:
+            results = await asyncio.gather(
+                *(self._fetch() for _ in range(min(missing, self.concurrency)))
+            )
+
+            if not any(results):
+                break
+
+        self.last_refill_ms = (time.perf_counter() - started_at) * 1000
+
+    async def _run(self):
+        # wake up in time to notice captchas expiring, even without any demand
+        check_interval = max(self.max_age / 4, 1)
+        retry_delay = 1
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            self._discard_expired()
+
+            if len(self._captchas) >= self.low_watermark:
+                continue
+
+            errors_before = self.fetch_errors
+            await self.refill()
+
+            # back off while the API keeps failing, instead of hammering it
+            if (
+                self.fetch_errors > errors_before
+                and len(self._captchas) < self.low_watermark
+            ):
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+                self._wakeup.set()
+            else:
+                retry_delay = 1
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Starts refilling in the background, unless the pool is disabled"""
+
+        if not self.high_watermark or (self._task and not self._task.done()):
+            return
+
+        # fill right away, instead of waiting for the first check
+        self._wakeup.set()
+        self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    async def close(self):
+        """Stops refilling and drops the pooled captchas"""
+
+        if self._task:
+            self._task.cancel()
+
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+            self._task = None
+
+        self._captchas.clear()
+
+    def stats(self) -> dict:
+        """Returns a dict of pool counters"""
+
+        requests = self.hits + self.misses
+
+        return {
+            "depth": len(self._captchas),
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / requests) if requests else 0.0,
+            "expired": self.expired,
+            "fetched": self.fetched,
+            "fetch_errors": self.fetch_errors,
+            "last_refill_ms": self.last_refill_ms,
+        }
@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import queue
+import typing
+
+import discord
+
+from utils.cache import LRUCache
+
+
+class DMForwarder:
+    """Forwards DMs between the clusters started by `launcher.py`
+
+    Discord delivers every DM on shard 0, so the cluster holding it passes each
+    DM on to all other clusters, where it's dispatched as a regular `message`
+    event. Waits on a member's DM reply, like DM verification, then work in
+    whichever cluster serves the guild.
+
+    Forwarded messages are remembered, so they resolve `wait_for` calls but
+    aren't processed as commands a second time.
+
+    Parameters
+    ----------
+    bot : discord.Client
+        Bot of this cluster
+    cluster_id : int
+        ID of this cluster, the index of its queue in `queues`
+    queues : List[multiprocessing.Queue]
+        One DM queue per cluster
+    has_shard_zero : bool
+        Whether this cluster receives the DMs
+    """
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        cluster_id: int,
+        queues: typing.List[multiprocessing.Queue],
+        has_shard_zero: bool,
+    ):
+        self.bot = bot
+        self.cluster_id = cluster_id
+        self.queues = queues
+        self.has_shard_zero = has_shard_zero
+
+        self._forwarded_ids = LRUCache(maxsize=10000)
+        self._task = None
+
+        self.sent = 0
+        self.received = 0
+
+    def record(self, msg: dict):
+        """Passes a raw gateway payload on to the other clusters, if it's a DM"""
+
+        if not self.has_shard_zero or msg.get("t") != "MESSAGE_CREATE":
+            return
+
+        data = msg["d"]
+        if "guild_id" in data or data["author"].get("bot"):
+            return
+
+        for cluster_id, dm_queue in enumerate(self.queues):
+            if cluster_id != self.cluster_id:
+                dm_queue.put(data)
+
+        self.sent += 1
+
+    def is_forwarded(self, message: discord.Message) -> bool:
+        """Returns a boolean signifying if the message came from another cluster"""
+        return message.id in self._forwarded_ids
+
+    def _get(self) -> typing.Optional[dict]:
+        try:
+            return self.queues[self.cluster_id].get(timeout=1)
+        except queue.Empty:
+            return
+
+    def dispatch(self, data: dict):
+        """Builds the message of a forwarded payload and dispatches it"""
+
+        state = self.bot._connection
+
+        channel_id = int(data["channel_id"])
+        channel = state._get_private_channel(channel_id) or discord.DMChannel(
+            me=self.bot.user,
+            state=state,
+            data={"id": channel_id, "recipients": [data["author"]]},
+        )
+        message = discord.Message(state=state, channel=channel, data=data)
+
+        self._forwarded_ids.set(message.id, True)
+        self.received += 1
+
+        self.bot.dispatch("message", message)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+
+        while not self.bot.is_closed():
+            # a blocking get, in a thread, so the loop isn't polling
+            if data := await loop.run_in_executor(None, self._get):
+                self.dispatch(data)
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Starts receiving DMs forwarded by the cluster holding shard 0"""
+
+        if self.has_shard_zero or (self._task and not self._task.done()):
+            return
+
+        self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        """Returns a dict of forwarding counters"""
+
+        return {
+            "has_shard_zero": self.has_shard_zero,
+            "sent": self.sent,
+            "received": self.received,
+        }
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import sqlite3
+import time
+import typing
+
+from tortoise.backends.base.config_generator import generate_config
+from tortoise.models import Model
+
+from utils.metrics import LatencySamples
+
+
+def get_pool_settings() -> dict:
+    """Returns asyncpg pool settings from environment, only those that are set
+
+    Keys are named the way tortoise's asyncpg client expects them in the
+    connection credentials.
+    """
+
+    env_settings = {
+        "minsize": ("SOTERIA_DB_POOL_MIN", int),
+        "maxsize": ("SOTERIA_DB_POOL_MAX", int),
+        "max_inactive_connection_lifetime": ("SOTERIA_DB_POOL_LIFETIME", float),
+        "statement_cache_size": ("SOTERIA_DB_STATEMENT_CACHE", int),
+    }
+
+    return {
+        key: cast(value)
+        for key, (env_name, cast) in env_settings.items()
+        if (value := os.getenv(env_name))
+    }
+
+
+def get_acquire_timeout() -> typing.Optional[float]:
+    """Returns the pool acquire timeout in seconds from environment, if set"""
+
+    if not (timeout := os.getenv("SOTERIA_DB_POOL_ACQUIRE_TIMEOUT")):
+        return
+
+    return float(timeout)
+
+
+def get_tortoise_config(db_uri: str) -> dict:
+    """Builds the tortoise config for a DB URI, applying pool settings on postgres
+
+    Pool settings from environment take precedence over ones in the URI query.
+    """
+
+    config = generate_config(db_uri, app_modules={"models": ["models"]})
+
+    connection = config["connections"]["default"]
+    if connection["engine"] == "tortoise.backends.asyncpg":
+        connection["credentials"].update(get_pool_settings())
+
+    return config
+
+
+class PoolMetrics:
+    """Counters of a connection pool's saturation"""
+
+    def __init__(self):
+        self.pool = None
+
+        self.in_use = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.timeouts = 0
+        self.acquire_latency = LatencySamples()
+
+    def stats(self) -> dict:
+        """Returns a dict of pool counters"""
+
+        if not self.pool:
+            return {"pooled": False}
+
+        size = self.pool.get_size()
+
+        return {
+            "size": size,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "in_use": self.in_use,
+            "idle": max(size - self.in_use, 0),
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "timeouts": self.timeouts,
+            **self.acquire_latency.stats(prefix="acquire"),
+        }
+
+
+class InstrumentedPool:
+    """Wraps an asyncpg pool, recording acquires into `PoolMetrics`
+
+    Every other attribute is forwarded to the wrapped pool.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        Pool to wrap
+    metrics : PoolMetrics
+        Metrics to record into
+    acquire_timeout : Optional[float]
+        Seconds to wait for a connection before raising `asyncio.TimeoutError`
+    """
+
+    def __init__(
+        self, pool, metrics: PoolMetrics, acquire_timeout: typing.Optional[float] = None
+    ):
+        self._pool = pool
+        self._metrics = metrics
+        self._acquire_timeout = acquire_timeout
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+    async def acquire(self):
+        metrics = self._metrics
+
+        metrics.waiting += 1
+        metrics.max_waiting = max(metrics.max_waiting, metrics.waiting)
+        started_at = time.perf_counter()
+
+        try:
+            connection = await self._pool.acquire(timeout=self._acquire_timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        finally:
+            metrics.waiting -= 1
+
+        metrics.acquire_latency.record((time.perf_counter() - started_at) * 1000)
+        metrics.in_use += 1
+
+        return connection
+
+    async def release(self, connection, *args, **kwargs):
+        try:
+            await self._pool.release(connection, *args, **kwargs)
+        finally:
+            self._metrics.in_use -= 1
+
+
+def instrument_pool(
+    client, metrics: PoolMetrics, acquire_timeout: typing.Optional[float] = None
+) -> bool:
+    """Wraps a tortoise client's connection pool, returns `False` if it has none"""
+
+    if not getattr(client, "_pool", None):
+        return False
+
+    client._pool = InstrumentedPool(client._pool, metrics, acquire_timeout)
+    metrics.pool = client._pool
+
+    return True
+
+
+def get_placeholders(client, count: int, start: int = 1) -> typing.List[str]:
+    """Returns query parameter placeholders in the client's dialect"""
+
+    if client.capabilities.dialect == "postgres":
+        return [f"${i}" for i in range(start, start + count)]
+
+    return ["?"] * count
+
+
+def split_sql_script(script: str) -> typing.List[str]:
+    """Splits a script into its statements, keeping `;` in strings and comments"""
+
+    statements = []
+    statement = ""
+
+    for part in script.split(";"):
+        statement += part + ";"
+
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n\t;"):
+                statements.append(statement.strip())
+            statement = ""
+
+    if statement.strip(" \n\t;"):
+        statements.append(statement.strip().rstrip(";"))
+
+    return statements
+
+
+async def execute_script(client, script: str):
+    """Runs a multi statement script, inside the client's transaction if it has one
+
+    sqlite's `executescript` commits any open transaction first, so on sqlite
+    every statement is run on its own instead, which keeps DDL transactional.
+    """
+
+    if client.capabilities.dialect != "sqlite":
+        await client.execute_script(script)
+        return
+
+    for statement in split_sql_script(script):
+        await client.execute_query(statement)
+
+
+async def bulk_update(
+    model: typing.Type[Model], instances: typing.List[Model], fields: typing.List[str]
+):
+    """Updates `fields` of many instances with one prepared statement
+
+    The ORM version we're on has no `bulk_update`, so this batches a single
+    `UPDATE ... WHERE pk = ?` statement through `executemany`.
+    """
+
+    if not instances:
+        return
+
+    meta = model._meta
+    client = meta.db
+
+    field_objects = [meta.fields_map[field] for field in fields]
+    columns = [
+        field_object.source_field or field
+        for field, field_object in zip(fields, field_objects)
+    ]
+    placeholders = get_placeholders(client, len(columns) + 1)
+
+    query = (
+        f'UPDATE "{meta.db_table}" SET '
+        + ", ".join(
+            f'"{column}" = {placeholder}'
+            for column, placeholder in zip(columns, placeholders)
+        )
+        + f' WHERE "{meta.db_pk_column}" = {placeholders[-1]}'
+    )
+
+    await client.execute_many(
+        query,
+        [
+            [
+                field_object.to_db_value(getattr(instance, field), instance)
+                for field, field_object in zip(fields, field_objects)
+            ]
+            + [instance.pk]
+            for instance in instances
+        ],
+    )
+
+
+async def bulk_insert(
+    model: typing.Type[Model],
+    fields: typing.List[str],
+    rows: typing.List[typing.Sequence],
+):
+    """Inserts many rows of `fields` values with as few round trips as possible
+
+    Uses `COPY` on postgres, elsewhere multi-row `INSERT ... VALUES` statements
+    (batched to stay under sqlite's bound parameter limit).
+    """
+
+    if not rows:
+        return
+
+    meta = model._meta
+    client = meta.db
+
+    field_objects = [meta.fields_map[field] for field in fields]
+    columns = [
+        field_object.source_field or field
+        for field, field_object in zip(fields, field_objects)
+    ]
+    values = [
+        [
+            field_object.to_db_value(value, None)
+            for field_object, value in zip(field_objects, row)
+        ]
+        for row in rows
+    ]
+
+    if client.capabilities.dialect == "postgres":
+        async with client.acquire_connection() as connection:
+            await connection.copy_records_to_table(
+                meta.db_table, records=values, columns=columns
+            )
+        return
+
+    batch_size = max(1, 999 // len(columns))
+    quoted_columns = ", ".join(f'"{column}"' for column in columns)
+
+    for i in range(0, len(values), batch_size):
+        batch = values[i : i + batch_size]
+        placeholders = get_placeholders(client, len(columns) * len(batch))
+
+        rows_sql = ", ".join(
+            "(" + ", ".join(placeholders[j : j + len(columns)]) + ")"
+            for j in range(0, len(placeholders), len(columns))
+        )
+
+        await client.execute_query(
+            f'INSERT INTO "{meta.db_table}" ({quoted_columns}) VALUES {rows_sql}',
+            [value for row in batch for value in row],
+        )
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+import typing
+
+from tortoise.models import Model
+
+from utils.db import bulk_insert
+
+logger = logging.getLogger("bot.events")
+
+
+class EventBuffer:
+    """Write-behind buffer, inserting rows of a model in bulk
+
+    `record` only appends to memory, a background task writes the buffered
+    rows once `flush_size` of them piled up or every `flush_interval` seconds.
+    Memory is bounded by `maxsize`, rows recorded beyond it are dropped and
+    counted.
+
+    Parameters
+    ----------
+    model : Type[Model]
+        Model to insert rows of
+    fields : List[str]
+        Fields `record` takes values for, in order
+    maxsize : int
+        Most rows kept in memory
+    flush_size : int
+        Rows buffered before a flush is started early
+    flush_interval : float
+        Seconds between periodic flushes
+    """
+
+    def __init__(
+        self,
+        model: typing.Type[Model],
+        fields: typing.List[str],
+        maxsize: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 5.0,
+    ):
+        self.model = model
+        self.fields = fields
+        self.maxsize = maxsize
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._rows: typing.List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: typing.Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def record(self, *values):
+        """Buffers a row, without awaiting anything"""
+
+        if len(self._rows) >= self.maxsize:
+            self.dropped += 1
+            return
+
+        self._rows.append(values)
+        self.recorded += 1
+
+        if len(self._rows) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Writes every buffered row, returns how many were written
+
+        Rows of a failed write are put back, as far as `maxsize` allows.
+        """
+
+        async with self._flush_lock:
+            if not self._rows:
+                return 0
+
+            rows, self._rows = self._rows, []
+            started_at = time.perf_counter()
+
+            try:
+                await bulk_insert(self.model, self.fields, rows)
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception(
+                    f"Failed to write {len(rows)} {self.model.__name__} rows"
+                )
+
+                # keep the oldest rows, newer ones recorded meanwhile go first
+                self._rows = rows + self._rows
+                if (overflow := len(self._rows) - self.maxsize) > 0:
+                    del self._rows[self.maxsize :]
+                    self.dropped += overflow
+
+                return 0
+
+            self.last_flush_ms = (time.perf_counter() - started_at) * 1000
+            self.flushes += 1
+            self.flushed += len(rows)
+
+            return len(rows)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Starts the background flushing task"""
+
+        if self._task and not self._task.done():
+            return
+
+        self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    async def close(self):
+        """Stops the background task and writes whatever is left"""
+
+        self._closing = True
+        self._wakeup.set()
+
+        # let an in-flight write finish, instead of cancelling it halfway
+        if self._task:
+            await self._task
+            self._task = None
+
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Returns a dict of buffer counters"""
+
+        return {
+            "buffered": len(self._rows),
+            "maxsize": self.maxsize,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -18,12 +18,29 @@ def get_bot_logger(logging_level=logging.INFO):
     return bot_logger
 
 
+def get_log_dir() -> str:
+    """Returns the directory log files are written to, creating it if needed
+
+    Set by `SOTERIA_LOG_DIR`, the repository root by default.
+    """
+
+    log_dir = os.getenv("SOTERIA_LOG_DIR") or str(Path(__file__).parent.parent.parent)
+    os.makedirs(log_dir, exist_ok=True)
+
+    return log_dir
+
+
 def setup_discord_logging(logging_level=logging.DEBUG):
     discord_logger = logging.getLogger("discord")
     discord_logger.setLevel(logging_level)
 
-    handler = logging.FileHandler(
-        filename=os.path.join(Path(__file__).parent.parent.parent, "discord.log")
-    )
+    handler = logging.FileHandler(filename=os.path.join(get_log_dir(), "discord.log"))
 
     discord_logger.addHandler(handler)
+
+
+def get_launcher_logger(logging_level=logging.INFO):
+    launcher_logger = logging.getLogger("launcher")
+    launcher_logger.setLevel(logging_level)
+
+    return launcher_logger
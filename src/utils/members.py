@@ -0,0 +1,176 @@
+import asyncio
+import os
+import typing
+from enum import Enum
+
+import discord
+
+
+class MemberCachePolicy(str, Enum):
+    """An `Enum` storing member cache policies
+
+    FULL: Cache every member, chunking every guild at startup
+    LAZY: Cache every member, but chunk guilds only when first needed
+    MINIMAL: Cache no members at all, fetching them when needed
+    """
+
+    FULL = "FULL"
+    LAZY = "LAZY"
+    MINIMAL = "MINIMAL"
+
+
+def get_member_cache_policy() -> MemberCachePolicy:
+    """Returns the member cache policy set by `SOTERIA_MEMBER_CACHE`"""
+    return MemberCachePolicy(
+        os.getenv("SOTERIA_MEMBER_CACHE", default=MemberCachePolicy.FULL).upper()
+    )
+
+
+def get_member_cache_settings(
+    policy: MemberCachePolicy, intents: discord.Intents
+) -> dict:
+    """Returns the bot kwargs implementing a member cache policy"""
+
+    if policy == MemberCachePolicy.MINIMAL:
+        return {
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False,
+        }
+
+    return {
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        "chunk_guilds_at_startup": policy == MemberCachePolicy.FULL,
+    }
+
+
+# Guild ID -> lock, so concurrent callers share a single chunk request
+_chunk_locks: typing.Dict[int, asyncio.Lock] = {}
+
+
+async def ensure_chunked(guild: discord.Guild):
+    """Chunks a guild, unless it's already chunked"""
+
+    if guild.chunked:
+        return
+
+    lock = _chunk_locks.setdefault(guild.id, asyncio.Lock())
+
+    async with lock:
+        if not guild.chunked:  # someone else might have finished it meanwhile
+            await guild.chunk()
+
+    _chunk_locks.pop(guild.id, None)
+
+
+async def resolve_member(
+    guild: discord.Guild, user_id: int
+) -> typing.Optional[discord.Member]:
+    """Returns a member from cache, fetching it from discord if it isn't cached"""
+
+    if member := guild.get_member(user_id):
+        return member
+
+    try:
+        return await guild.fetch_member(user_id)
+    except discord.NotFound:
+        return
+
+
+async def get_member_counts(
+    guild: discord.Guild, policy: MemberCachePolicy
+) -> typing.Tuple[int, int]:
+    """Returns a tuple of form (total members, humans) for a guild
+
+    The total comes from discord itself, humans are counted from the member list
+    which gets chunked on demand if the cache policy doesn't keep it around.
+    """
+
+    if policy == MemberCachePolicy.MINIMAL:
+        members = await guild.chunk(cache=False)
+    else:
+        if policy == MemberCachePolicy.LAZY:
+            await ensure_chunked(guild)
+
+        members = guild.members
+
+    humans = len([member for member in members if not member.bot])
+
+    return guild.member_count, humans
+
+
+class MemberCounter:
+    """Keeps per-guild human counts, updated in O(1) from gateway events
+
+    A guild gets seeded once, on first use, by counting its member list. After
+    that joins and removes adjust the count directly. Raw gateway payloads are
+    used so that removes of uncached members are seen too. Joins and removes
+    arriving while a guild is being seeded are held back and applied after.
+
+    Parameters
+    ----------
+    policy: MemberCachePolicy
+        The member cache policy, used when seeding a guild
+    """
+
+    def __init__(self, policy: MemberCachePolicy):
+        self.policy = policy
+
+        self._humans: typing.Dict[int, int] = {}
+        self._seed_locks: typing.Dict[int, asyncio.Lock] = {}
+        # guild ID -> human count change seen while seeding it
+        self._seed_deltas: typing.Dict[int, int] = {}
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self._humans
+
+    async def get(self, guild: discord.Guild) -> typing.Tuple[int, int]:
+        """Returns a tuple of form (total members, humans) for a guild"""
+
+        if (humans := self._humans.get(guild.id)) is None:
+            lock = self._seed_locks.setdefault(guild.id, asyncio.Lock())
+
+            try:
+                async with lock:
+                    if (humans := self._humans.get(guild.id)) is None:
+                        _, humans = await get_member_counts(guild, self.policy)
+                        humans = max(0, humans + self._seed_deltas.pop(guild.id, 0))
+                        self._humans[guild.id] = humans
+            finally:
+                self._seed_locks.pop(guild.id, None)
+                self._seed_deltas.pop(guild.id, None)
+
+        return guild.member_count, humans
+
+    def record(self, payload: dict):
+        """Adjusts counts from a raw gateway payload
+
+        Member updates can't flip the bot flag, so only adds and removes matter.
+        """
+
+        event = payload.get("t")
+        if event == "GUILD_MEMBER_ADD":
+            delta = 1
+        elif event == "GUILD_MEMBER_REMOVE":
+            delta = -1
+        else:
+            return
+
+        data = payload["d"]
+        guild_id = int(data["guild_id"])
+
+        if data["user"].get("bot"):
+            return
+
+        if guild_id not in self._humans:
+            # being seeded, the member list may be fetched before this change
+            if guild_id in self._seed_locks:
+                self._seed_deltas[guild_id] = self._seed_deltas.get(guild_id, 0) + delta
+
+            return  # otherwise not seeded yet, nothing to adjust
+
+        self._humans[guild_id] = max(0, self._humans[guild_id] + delta)
+
+    def forget(self, guild_id: int):
+        """Drops the counts of a guild"""
+        self._humans.pop(guild_id, None)
+        self._seed_deltas.pop(guild_id, None)
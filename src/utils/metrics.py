@@ -0,0 +1,43 @@
+import collections
+import typing
+
+
+class LatencySamples:
+    """Keeps the most recent latency samples (in ms) for percentile reporting
+
+    Parameters
+    ----------
+    maxlen : int
+        Amount of samples to keep, older ones are dropped
+    """
+
+    def __init__(self, maxlen: int = 1000):
+        self._samples: typing.Deque[float] = collections.deque(maxlen=maxlen)
+        self.count = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, latency_ms: float):
+        self._samples.append(latency_ms)
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        """Returns the latency at a percentile (0-100) of the kept samples"""
+
+        if not self._samples:
+            return 0.0
+
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+
+        return samples[index]
+
+    def stats(self, prefix: str = "latency") -> dict:
+        """Returns a dict of the sample count and p50/p99 latencies"""
+
+        return {
+            f"{prefix}_count": self.count,
+            f"{prefix}_p50_ms": self.percentile(50),
+            f"{prefix}_p99_ms": self.percentile(99),
+        }
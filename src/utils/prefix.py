@@ -0,0 +1,76 @@
+import typing
+
+import discord
+
+from utils.cache import prefix_cache
+
+
+class PrefixMatcher:
+    """Synchronously decides if a message could possibly be a command
+
+    Candidate prefixes (guild prefix + bot mentions) are precomputed into tuples,
+    so a check is a single `str.startswith` call without any awaits or allocations.
+
+    Parameters
+    ----------
+    default_prefix: str
+        The prefix used in DMs and guilds without a custom one
+    """
+
+    def __init__(self, default_prefix: str):
+        self.default_prefix = default_prefix
+
+        self._mentions = ()
+        self._candidates = {}
+
+        # Counters
+        self.short_circuited = 0
+        self.dispatched = 0
+
+    def set_bot_user(self, user_id: int):
+        """Sets the bot user, used to build the mention prefixes"""
+
+        self._mentions = (f"<@{user_id}>", f"<@!{user_id}>")
+        self._candidates.clear()
+
+    def _get_candidates(self, prefix: str) -> typing.Tuple[str, ...]:
+        """Returns the precomputed tuple of candidates for a prefix"""
+
+        try:
+            return self._candidates[prefix]
+        except KeyError:
+            candidates = self._candidates[prefix] = (prefix, *self._mentions)
+            return candidates
+
+    def match(self, message: discord.Message) -> bool:
+        """Returns a boolean signifying if the message should be dispatched"""
+
+        if message.guild:
+            prefix = prefix_cache.peek(message.guild.id)
+
+            if prefix is None:  # unknown guild, let `get_prefix` decide
+                self.dispatched += 1
+                return True
+        else:
+            prefix = self.default_prefix
+
+        if message.content.startswith(self._get_candidates(prefix)):
+            self.dispatched += 1
+            return True
+
+        self.short_circuited += 1
+        return False
+
+    def is_bare_mention(self, content: str) -> bool:
+        """Returns a boolean signifying if the content only mentions the bot"""
+
+        return content.strip() in self._mentions
+
+    def stats(self) -> dict:
+        """Returns a dict of matcher counters"""
+
+        return {
+            "short_circuited": self.short_circuited,
+            "dispatched": self.dispatched,
+            "prefixes_compiled": len(self._candidates),
+        }
@@ -0,0 +1,157 @@
+import typing
+
+import discord
+
+from models import (
+    Config,
+    ConfigType,
+    Guild,
+    GuildSettings,
+    SettingsLayout,
+    VerificationMethod,
+    configs_from_document,
+    get_settings_layout,
+)
+
+
+class ReactionPanel(typing.NamedTuple):
+    """A message members react to, in order to get verified
+
+    `emoji` is a string for unicode emojis and an ID for custom ones.
+    """
+
+    guild_id: int
+    channel_id: int
+    message_id: int
+    emoji: typing.Union[str, int]
+
+    def matches(self, emoji: discord.PartialEmoji) -> bool:
+        """Returns a boolean signifying if the reaction emoji is the panel's emoji"""
+
+        if isinstance(self.emoji, int):
+            return emoji.id == self.emoji
+
+        return emoji.id is None and emoji.name == self.emoji
+
+
+def panels_from_configs(
+    guild_id: int, configs: typing.Mapping[ConfigType, dict]
+) -> typing.List[ReactionPanel]:
+    """Builds the reaction panels of a guild from its config values
+
+    The primary panel comes from `REACTION_CHANNEL` / `REACTION_MESSAGE`, extra
+    ones from the `REACTION_PANELS` list. All of them share `REACTION_EMOJI`.
+    """
+
+    if not (emoji_values := configs.get(ConfigType.REACTION_EMOJI)):
+        return []
+
+    if emoji_values["value_bool"]:
+        emoji = emoji_values["value_str"]
+    else:
+        emoji = emoji_values["value_int"]
+
+    if emoji is None:
+        return []
+
+    message_refs = []
+
+    channel_values = configs.get(ConfigType.REACTION_CHANNEL)
+    message_values = configs.get(ConfigType.REACTION_MESSAGE)
+    if channel_values and message_values:
+        message_refs.append((channel_values["value_int"], message_values["value_int"]))
+
+    if panels_values := configs.get(ConfigType.REACTION_PANELS):
+        message_refs.extend(
+            (panel["channel_id"], panel["message_id"])
+            for panel in panels_values["value_json"] or []
+        )
+
+    return [
+        ReactionPanel(guild_id, channel_id, message_id, emoji)
+        for channel_id, message_id in message_refs
+        if channel_id and message_id
+    ]
+
+
+class ReactionPanelIndex:
+    """In-memory index of reaction panels keyed by (channel ID, message ID)
+
+    Lets reactions on unrelated messages be rejected without awaiting anything.
+    Only guilds using the reaction verification method are indexed.
+    """
+
+    def __init__(self):
+        self._panels: typing.Dict[typing.Tuple[int, int], ReactionPanel] = {}
+        self._guild_keys: typing.Dict[int, typing.Set[typing.Tuple[int, int]]] = {}
+
+    def __len__(self):
+        return len(self._panels)
+
+    def get(self, channel_id: int, message_id: int) -> typing.Optional[ReactionPanel]:
+        """Returns the panel for a message, if it is one"""
+        return self._panels.get((channel_id, message_id))
+
+    def set_guild_panels(self, guild_id: int, panels: typing.List[ReactionPanel]):
+        """Replaces every panel of a guild"""
+
+        self.remove_guild(guild_id)
+
+        if not panels:
+            return
+
+        keys = self._guild_keys[guild_id] = set()
+        for panel in panels:
+            key = (panel.channel_id, panel.message_id)
+
+            self._panels[key] = panel
+            keys.add(key)
+
+    def remove_guild(self, guild_id: int):
+        """Removes every panel of a guild"""
+
+        for key in self._guild_keys.pop(guild_id, ()):
+            self._panels.pop(key, None)
+
+    async def load(self):
+        """Builds the whole index, in one query"""
+
+        if get_settings_layout() == SettingsLayout.JSONB:
+            rows = await Guild.filter(
+                verification_method=VerificationMethod.REACTION
+            ).values("id", "settings")
+
+            for row in rows:
+                self.set_guild_panels(
+                    row["id"],
+                    panels_from_configs(
+                        row["id"], configs_from_document(row["settings"])
+                    ),
+                )
+            return
+
+        rows = await Config.filter(
+            guild__verification_method=VerificationMethod.REACTION
+        ).values(
+            "guild_id", "type_", "value_int", "value_str", "value_json", "value_bool"
+        )
+
+        configs_by_guild = {}
+        for row in rows:
+            configs_by_guild.setdefault(row["guild_id"], {})[
+                ConfigType(row["type_"])
+            ] = row
+
+        for guild_id, configs in configs_by_guild.items():
+            self.set_guild_panels(guild_id, panels_from_configs(guild_id, configs))
+
+    async def refresh_guild(self, guild_id: int):
+        """Rebuilds the panels of a single guild, after its settings changed"""
+
+        settings = await GuildSettings.load(guild_id)
+
+        if not settings or settings.verification_method != VerificationMethod.REACTION:
+            self.remove_guild(guild_id)
+            return
+
+        self.set_guild_panels(guild_id, panels_from_configs(guild_id, settings.configs))
@@ -0,0 +1,94 @@
+import time
+import typing
+
+
+class EventRate:
+    """Counts events over a sliding window of one second buckets
+
+    Parameters
+    ----------
+    window: int
+        Window size in seconds
+    """
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.total = 0
+
+        self._buckets = [0] * window
+        self._stamps = [0] * window
+
+    def record(self):
+        """Records a single event"""
+
+        now = int(time.monotonic())
+        index = now % self.window
+
+        if self._stamps[index] != now:  # stale bucket, from a previous lap
+            self._stamps[index] = now
+            self._buckets[index] = 0
+
+        self._buckets[index] += 1
+        self.total += 1
+
+    def per_second(self) -> float:
+        """Returns the average events per second over the window"""
+
+        oldest = int(time.monotonic()) - self.window
+
+        return (
+            sum(
+                count
+                for count, stamp in zip(self._buckets, self._stamps)
+                if stamp > oldest
+            )
+            / self.window
+        )
+
+
+class ShardStats:
+    """Keeps per-shard gateway event rates
+
+    Discord routes guild events to shard `(guild_id >> 22) % shard_count` and
+    everything else (DMs included) to shard 0, so we can attribute raw gateway
+    payloads to shards without any help from the library.
+    """
+
+    def __init__(self):
+        self.shard_count = 1
+        self.rates: typing.Dict[int, EventRate] = {}
+
+    def set_shard_count(self, shard_count: typing.Optional[int]):
+        """Sets the total shard count, used for routing payloads to shards"""
+        self.shard_count = shard_count or 1
+
+    def shard_for(self, guild_id: typing.Optional[int]) -> int:
+        """Returns the shard ID responsible for a guild"""
+
+        if not guild_id:
+            return 0
+
+        return (int(guild_id) >> 22) % self.shard_count
+
+    def record(self, payload: dict):
+        """Records a raw gateway payload"""
+
+        data = payload.get("d")
+        guild_id = data.get("guild_id") if isinstance(data, dict) else None
+
+        shard_id = self.shard_for(guild_id)
+
+        try:
+            rate = self.rates[shard_id]
+        except KeyError:
+            rate = self.rates[shard_id] = EventRate()
+
+        rate.record()
+
+    def per_second(self, shard_id: int) -> float:
+        """Returns the event rate for a shard"""
+
+        if not (rate := self.rates.get(shard_id)):
+            return 0.0
+
+        return rate.per_second()
@@ -0,0 +1,369 @@
+import asyncio
+import bisect
+import logging
+import math
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+
+from tortoise.transactions import in_transaction
+
+from models import (
+    StatsPeriod,
+    VerificationEvent,
+    VerificationEventType,
+    VerificationRollup,
+    VerificationSolveTimeBin,
+)
+from utils.db import get_placeholders
+
+logger = logging.getLogger("bot.stats")
+
+# Upper bounds (in seconds) of the solve time histogram bins, captchas time out at 60
+SOLVE_TIME_BINS = (2, 4, 6, 8, 10, 15, 20, 30, 45, 60, math.inf)
+
+# Outcome -> index of its counter in a pending rollup
+OUTCOME_COUNTERS = {
+    VerificationEventType.PASSED: 0,
+    VerificationEventType.FAILED: 1,
+    VerificationEventType.TIMED_OUT: 2,
+}
+
+ROLLUP_COLUMNS = (
+    "passed",
+    "failed",
+    "timed_out",
+    "solve_time_total_ms",
+    "solve_time_count",
+)
+
+
+def get_solve_time_bin(solve_time: float) -> int:
+    """Returns the histogram bin index of a solve time in seconds"""
+    return bisect.bisect_left(SOLVE_TIME_BINS, solve_time)
+
+
+def get_period_start(moment: datetime, period: StatsPeriod) -> datetime:
+    """Truncates a moment to the start of its hour or day"""
+
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+
+    if period == StatsPeriod.DAY:
+        moment = moment.replace(hour=0)
+
+    return moment
+
+
+def estimate_median(bin_counts: typing.Mapping[int, int]) -> typing.Optional[float]:
+    """Estimates the median solve time in seconds from histogram bin counts
+
+    Interpolates linearly inside the bin holding the median, the open ended
+    last bin is treated as ending at the timeout.
+    """
+
+    total = sum(bin_counts.values())
+    if not total:
+        return
+
+    half = total / 2
+    seen = 0
+    for bin_, upper in enumerate(SOLVE_TIME_BINS):
+        count = bin_counts.get(bin_, 0)
+
+        if count and seen + count >= half:
+            lower = SOLVE_TIME_BINS[bin_ - 1] if bin_ else 0
+            upper = upper if math.isfinite(upper) else lower
+
+            return lower + (upper - lower) * (half - seen) / count
+
+        seen += count
+
+
+class StatsRecorder:
+    """Maintains the hourly and daily verification rollups incrementally
+
+    `record` only bumps in-memory counters, a background task adds them onto
+    the stored rollups with upserts every `flush_interval` seconds. Pending
+    memory is bounded by the amount of guilds verifying within an interval.
+
+    The same task prunes the raw event log and old rollups, based on the
+    retention settings.
+
+    Parameters
+    ----------
+    flush_interval : float
+        Seconds between writes
+    event_retention_days : int
+        Days raw `VerificationEvent` rows are kept
+    hourly_retention_days : int
+        Days hourly rollups are kept
+    daily_retention_days : int
+        Days daily rollups are kept
+    prune_interval : float
+        Seconds between prunes
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 10.0,
+        event_retention_days: int = 30,
+        hourly_retention_days: int = 7,
+        daily_retention_days: int = 365,
+        prune_interval: float = 3600.0,
+    ):
+        self.flush_interval = flush_interval
+        self.event_retention_days = event_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.daily_retention_days = daily_retention_days
+        self.prune_interval = prune_interval
+
+        # (guild ID, period, period start) -> [passed, failed, timed_out, total ms, count]
+        self._rollups: typing.Dict[tuple, typing.List[int]] = {}
+        # (guild ID, period, period start, bin) -> count
+        self._bins: typing.Dict[tuple, int] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_pruned_at = time.monotonic()
+
+        self.recorded = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.pruned = 0
+        self.last_flush_ms = 0.0
+
+    def record(
+        self,
+        guild_id: int,
+        outcome: VerificationEventType,
+        solve_time: typing.Optional[float] = None,
+    ):
+        """Counts a verification outcome, without awaiting anything
+
+        Parameters
+        ----------
+        guild_id : int
+            ID of the guild verified in
+        outcome : VerificationEventType
+            One of PASSED, FAILED or TIMED_OUT
+        solve_time : Optional[float]
+            Seconds the member took to answer the captcha, if they did
+        """
+
+        now = datetime.now(timezone.utc)
+
+        for period in StatsPeriod:
+            key = (guild_id, period, get_period_start(now, period))
+
+            counters = self._rollups.setdefault(key, [0] * len(ROLLUP_COLUMNS))
+            counters[OUTCOME_COUNTERS[outcome]] += 1
+
+            if solve_time is not None:
+                counters[3] += round(solve_time * 1000)
+                counters[4] += 1
+
+                bin_key = key + (get_solve_time_bin(solve_time),)
+                self._bins[bin_key] = self._bins.get(bin_key, 0) + 1
+
+        self.recorded += 1
+
+    async def flush(self):
+        """Adds the pending counters onto the stored rollups
+
+        Counters of a failed write are merged back, to be retried.
+        """
+
+        async with self._flush_lock:
+            if not self._rollups:
+                return
+
+            rollups, self._rollups = self._rollups, {}
+            bins, self._bins = self._bins, {}
+            started_at = time.perf_counter()
+
+            try:
+                async with in_transaction() as connection:
+                    await self._upsert_rollups(connection, rollups)
+                    await self._upsert_bins(connection, bins)
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception(f"Failed to write {len(rollups)} verification rollups")
+
+                for key, counters in rollups.items():
+                    pending = self._rollups.setdefault(key, [0] * len(ROLLUP_COLUMNS))
+                    for i, value in enumerate(counters):
+                        pending[i] += value
+
+                for key, count in bins.items():
+                    self._bins[key] = self._bins.get(key, 0) + count
+
+                return
+
+            self.last_flush_ms = (time.perf_counter() - started_at) * 1000
+            self.flushes += 1
+
+    @staticmethod
+    async def _upsert_rollups(connection, rollups: dict):
+        meta = VerificationRollup._meta
+        started_at_field = meta.fields_map["started_at"]
+
+        columns = ("guild_id", "period", "started_at") + ROLLUP_COLUMNS
+        placeholders = get_placeholders(connection, len(columns))
+
+        await connection.execute_many(
+            f'INSERT INTO "{meta.db_table}" ('
+            + ", ".join(f'"{column}"' for column in columns)
+            + ") VALUES ("
+            + ", ".join(placeholders)
+            + ') ON CONFLICT ("guild_id", "period", "started_at") DO UPDATE SET '
+            + ", ".join(
+                f'"{column}" = "{meta.db_table}"."{column}" + EXCLUDED."{column}"'
+                for column in ROLLUP_COLUMNS
+            ),
+            [
+                [
+                    guild_id,
+                    period.value,
+                    started_at_field.to_db_value(period_start, None),
+                    *counters,
+                ]
+                for (guild_id, period, period_start), counters in rollups.items()
+            ],
+        )
+
+    @staticmethod
+    async def _upsert_bins(connection, bins: dict):
+        if not bins:
+            return
+
+        meta = VerificationSolveTimeBin._meta
+        started_at_field = meta.fields_map["started_at"]
+        placeholders = get_placeholders(connection, 5)
+
+        await connection.execute_many(
+            f'INSERT INTO "{meta.db_table}" ("guild_id", "period", "started_at", "bin", "count") '
+            f"VALUES ({', '.join(placeholders)}) "
+            'ON CONFLICT ("guild_id", "period", "started_at", "bin") DO UPDATE SET '
+            f'"count" = "{meta.db_table}"."count" + EXCLUDED."count"',
+            [
+                [
+                    guild_id,
+                    period.value,
+                    started_at_field.to_db_value(period_start, None),
+                    bin_,
+                    count,
+                ]
+                for (guild_id, period, period_start, bin_), count in bins.items()
+            ],
+        )
+
+    async def prune(self) -> int:
+        """Deletes raw events and rollups past their retention, returns the amount"""
+
+        now = datetime.now(timezone.utc)
+        deleted = await VerificationEvent.filter(
+            created_at__lt=now - timedelta(days=self.event_retention_days)
+        ).delete()
+
+        for period, retention_days in (
+            (StatsPeriod.HOUR, self.hourly_retention_days),
+            (StatsPeriod.DAY, self.daily_retention_days),
+        ):
+            cutoff = now - timedelta(days=retention_days)
+
+            deleted += await VerificationRollup.filter(
+                period=period, started_at__lt=cutoff
+            ).delete()
+            await VerificationSolveTimeBin.filter(
+                period=period, started_at__lt=cutoff
+            ).delete()
+
+        self.pruned += deleted
+        self._last_pruned_at = time.monotonic()
+
+        return deleted
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            await self.flush()
+
+            if time.monotonic() - self._last_pruned_at >= self.prune_interval:
+                try:
+                    await self.prune()
+                except Exception:
+                    logger.exception("Failed to prune verification history")
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Starts the background flushing and pruning task"""
+
+        if self._task and not self._task.done():
+            return
+
+        self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    async def close(self):
+        """Stops the background task and writes whatever is pending"""
+
+        self._closing = True
+        self._wakeup.set()
+
+        if self._task:
+            await self._task
+            self._task = None
+
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Returns a dict of recorder counters"""
+
+        return {
+            "pending_rollups": len(self._rollups),
+            "pending_bins": len(self._bins),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "pruned": self.pruned,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+async def get_guild_stats(
+    guild_id: int, period: StatsPeriod, periods: int
+) -> typing.Dict[str, typing.Any]:
+    """Sums a guild's rollups of the last `periods` hours or days
+
+    Reads at most `periods` rollup rows (and their bins), however much history
+    there is.
+    """
+
+    since = get_period_start(datetime.now(timezone.utc), period) - (
+        timedelta(hours=periods - 1)
+        if period == StatsPeriod.HOUR
+        else timedelta(days=periods - 1)
+    )
+
+    rollups = await VerificationRollup.filter(
+        guild_id=guild_id, period=period, started_at__gte=since
+    ).values(*ROLLUP_COLUMNS)
+    bins = await VerificationSolveTimeBin.filter(
+        guild_id=guild_id, period=period, started_at__gte=since
+    ).values_list("bin", "count")
+
+    totals = {
+        column: sum(rollup[column] for rollup in rollups) for column in ROLLUP_COLUMNS
+    }
+
+    bin_counts = {}
+    for bin_, count in bins:
+        bin_counts[bin_] = bin_counts.get(bin_, 0) + count
+
+    totals["median_solve_time"] = estimate_median(bin_counts)
+
+    return totals
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The bot's modules are imported from `src/`, the way it's run
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
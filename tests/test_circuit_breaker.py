@@ -0,0 +1,71 @@
+"""Checks that a half-open circuit can't get stuck on a trial without an answer"""
+
+import asyncio
+import time
+import typing
+
+from captcha import CaptchaApiClient, CircuitBreaker, client
+
+
+class FakeClock:
+    """Stands in for the `time` module of `captcha.client`, moved by hand"""
+
+    perf_counter = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def open_breaker(monkeypatch) -> typing.Tuple[CircuitBreaker, FakeClock]:
+    clock = FakeClock()
+    monkeypatch.setattr(client, "time", clock)
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    return breaker, clock
+
+
+def test_cancelled_trial_reopens_the_circuit(monkeypatch):
+    async def run():
+        breaker, clock = open_breaker(monkeypatch)
+        api_client = CaptchaApiClient("http://captcha/", breaker=breaker)
+
+        async def hang(*args, **kwargs):
+            await asyncio.Event().wait()
+
+        api_client._request = hang
+
+        clock.now += 30
+        trial = asyncio.ensure_future(api_client.generate())
+        await asyncio.sleep(0)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now += 30
+        assert breaker.allow()
+
+    asyncio.run(run())
+
+
+def test_pending_trial_times_out(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # the first trial never answered
+    clock.now += 30
+    assert breaker.is_trial_due()
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
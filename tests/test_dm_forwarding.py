@@ -0,0 +1,96 @@
+"""Checks that DMs received by the cluster holding shard 0 reach the others"""
+
+import asyncio
+import queue
+
+import discord
+from discord.state import ConnectionState
+
+from utils.clusters import DMForwarder
+
+USER = {"id": "300", "username": "member", "discriminator": "0001", "avatar": None}
+
+
+class FakeBot:
+    """The parts of a bot `DMForwarder` touches, recording dispatched events"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._connection = ConnectionState(
+            dispatch=lambda *args, **kwargs: None,
+            handlers={},
+            hooks={},
+            syncer=None,
+            http=None,
+            loop=self.loop,
+            intents=discord.Intents.default(),
+        )
+        self.user = None
+        self.events = []
+
+    def dispatch(self, event, *args):
+        self.events.append((event, *args))
+
+    def is_closed(self):
+        return False
+
+
+def message_create(message_id: int, **data) -> dict:
+    return {
+        "op": 0,
+        "t": "MESSAGE_CREATE",
+        "d": {
+            "id": str(message_id),
+            "channel_id": "200",
+            "author": USER,
+            "content": "soteria",
+            "timestamp": "2021-01-01T00:00:00.000000+00:00",
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+            **data,
+        },
+    }
+
+
+def test_only_dms_are_forwarded_to_the_other_clusters():
+    queues = [queue.Queue() for _ in range(3)]
+    forwarder = DMForwarder(FakeBot(), 0, queues, has_shard_zero=True)
+
+    forwarder.record(message_create(1))
+    forwarder.record(message_create(2, guild_id="100"))
+    forwarder.record(message_create(3, author={**USER, "bot": True}))
+    forwarder.record({"op": 0, "t": "TYPING_START", "d": {}})
+
+    assert queues[0].empty()
+    for dm_queue in queues[1:]:
+        assert dm_queue.get_nowait()["id"] == "1"
+        assert dm_queue.empty()
+
+
+def test_forwarded_dms_are_dispatched_as_messages():
+    queues = [queue.Queue() for _ in range(2)]
+    bot = FakeBot()
+    forwarder = DMForwarder(bot, 1, queues, has_shard_zero=False)
+
+    # nothing is forwarded from a cluster without shard 0
+    forwarder.record(message_create(1))
+    assert all(dm_queue.empty() for dm_queue in queues)
+
+    forwarder.dispatch(message_create(1)["d"])
+
+    [(event, message)] = bot.events
+    assert event == "message"
+    assert message.content == "soteria"
+    assert message.author.id == 300
+    # what `Verify.get_text_input` compares against, a DM channel of its own
+    assert message.channel == discord.DMChannel(
+        me=None, state=bot._connection, data={"id": 200, "recipients": [USER]}
+    )
+    assert forwarder.is_forwarded(message)
@@ -0,0 +1,55 @@
+"""Checks that member joins and removes aren't lost while a guild is seeded"""
+
+import asyncio
+import types
+
+from utils import members
+from utils.members import MemberCachePolicy, MemberCounter
+
+
+def member_event(event: str, user_id: int, bot: bool = False) -> dict:
+    return {
+        "t": event,
+        "d": {"guild_id": "1", "user": {"id": str(user_id), "bot": bot}},
+    }
+
+
+def test_changes_while_seeding_are_applied(monkeypatch):
+    async def run():
+        seeding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def get_member_counts(guild, policy):
+            seeding.set()
+            await release.wait()
+            return 12, 10
+
+        monkeypatch.setattr(members, "get_member_counts", get_member_counts)
+
+        counter = MemberCounter(MemberCachePolicy.FULL)
+        guild = types.SimpleNamespace(id=1, member_count=12)
+
+        task = asyncio.ensure_future(counter.get(guild))
+        await seeding.wait()
+
+        counter.record(member_event("GUILD_MEMBER_ADD", 2))
+        counter.record(member_event("GUILD_MEMBER_ADD", 3))
+        counter.record(member_event("GUILD_MEMBER_ADD", 4, bot=True))
+        counter.record(member_event("GUILD_MEMBER_REMOVE", 5))
+
+        release.set()
+        assert await task == (12, 11)
+
+        # seeded now, changes apply directly
+        counter.record(member_event("GUILD_MEMBER_REMOVE", 2))
+        assert await counter.get(guild) == (12, 10)
+
+    asyncio.run(run())
+
+
+def test_changes_before_seeding_are_ignored():
+    counter = MemberCounter(MemberCachePolicy.FULL)
+
+    counter.record(member_event("GUILD_MEMBER_ADD", 2))
+
+    assert 1 not in counter
@@ -0,0 +1,121 @@
+"""Checks that migrations are atomic and safe to run from several processes"""
+
+import asyncio
+
+from tortoise import Tortoise
+from tortoise.utils import get_schema_sql
+
+import migrations
+from migrations import LATEST_VERSION, Migration, get_schema_version, migrate
+from utils.db import get_tortoise_config
+
+
+async def _fail(client):
+    raise RuntimeError("Migration failed")
+
+
+async def _table_names() -> set:
+    _, rows = await migrations.get_client().execute_query(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )
+    return {row["name"] for row in rows}
+
+
+async def _table_columns(client) -> dict:
+    _, rows = await client.execute_query(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'table' AND name != 'sqlite_sequence'"
+    )
+
+    columns = {}
+    for row in rows:
+        _, table_info = await client.execute_query(
+            f'PRAGMA table_info("{row["name"]}")'
+        )
+        columns[row["name"]] = {column["name"] for column in table_info}
+
+    return columns
+
+
+def test_failed_migration_leaves_no_ddl_behind(monkeypatch):
+    async def run():
+        await Tortoise.init(config=get_tortoise_config("sqlite://:memory:"))
+
+        async def create_then_fail(client):
+            await migrations._create_initial_tables(client)
+            await _fail(client)
+
+        monkeypatch.setattr(
+            migrations,
+            "MIGRATIONS",
+            [Migration(1, "Create initial tables", create_then_fail)],
+        )
+
+        try:
+            await migrate()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("migrate() didn't raise")
+
+        try:
+            assert await get_schema_version() == 0
+            assert await _table_names() == {migrations.SCHEMA_VERSION_TABLE}
+        finally:
+            await Tortoise.close_connections()
+
+    asyncio.run(run())
+
+
+def test_migrations_applied_meanwhile_are_skipped(monkeypatch):
+    async def run():
+        await Tortoise.init(config=get_tortoise_config("sqlite://:memory:"))
+
+        # like a second cluster, which read the version before the first one
+        # migrated: only the check under the lock sees the applied versions
+        monkeypatch.setattr(
+            migrations,
+            "get_pending_migrations",
+            lambda current_version, target_version=None: migrations.MIGRATIONS,
+        )
+
+        try:
+            first = await migrate()
+            second = await migrate()
+
+            _, rows = await migrations.get_client().execute_query(
+                f'SELECT "version" FROM "{migrations.SCHEMA_VERSION_TABLE}"'
+            )
+        finally:
+            await Tortoise.close_connections()
+
+        assert [migration.version for migration in first] == list(
+            range(1, LATEST_VERSION + 1)
+        )
+        assert second == []
+        assert len(rows) == LATEST_VERSION
+
+    asyncio.run(run())
+
+
+def test_migrated_schema_matches_the_models():
+    async def get_columns(create_schema) -> dict:
+        await Tortoise.init(config=get_tortoise_config("sqlite://:memory:"))
+
+        try:
+            await create_schema(migrations.get_client())
+            return await _table_columns(migrations.get_client())
+        finally:
+            await Tortoise.close_connections()
+
+    async def run():
+        migrated = await get_columns(lambda client: migrate())
+        # what the models would create on a database of their own
+        expected = await get_columns(
+            lambda client: client.execute_script(get_schema_sql(client, safe=False))
+        )
+
+        migrated.pop(migrations.SCHEMA_VERSION_TABLE)
+        assert migrated == expected
+
+    asyncio.run(run())
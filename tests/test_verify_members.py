@@ -0,0 +1,75 @@
+"""Checks that a member leaving mid-verification ends it quietly
+
+Uses the load harness' fake discord objects, like `test_verify_queries`.
+"""
+
+import argparse
+import asyncio
+import types
+
+import discord
+from tortoise import Tortoise
+
+from benchmarks import mock_captcha_api
+from benchmarks.verification_load import FakeBot, FakeGuild, FakeMember, LoadHarness
+from captcha import CaptchaApiClient, HttpCaptchaBackend
+from migrations import migrate
+from models import VerificationEvent, VerificationEventType
+from utils.cache import settings_cache
+from utils.db import get_tortoise_config
+
+
+class LeavingMember(FakeMember):
+    """Leaves the guild right after receiving the captcha, then answers it"""
+
+    def on_bot_message(self, channel, embed, file):
+        if file is not None:
+            self.guild._members.pop(self.id, None)
+
+        super().on_bot_message(channel, embed, file)
+
+
+async def fetch_missing_member(user_id: int):
+    raise discord.NotFound(
+        types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Member"
+    )
+
+
+def test_member_leaving_before_answering():
+    async def run():
+        settings_cache.clear()
+        await Tortoise.init(config=get_tortoise_config("sqlite://:memory:"))
+
+        api = mock_captcha_api.MockCaptchaApi()
+        runner, api_url = await mock_captcha_api.start_server(api)
+
+        bot = FakeBot(HttpCaptchaBackend(CaptchaApiClient(api_url)), pool_size=0)
+        harness = LoadHarness(
+            argparse.Namespace(guilds=1, think_time=0.0, answer=api.answer), bot
+        )
+
+        try:
+            await migrate()
+            await harness.create_guilds()
+
+            guild: FakeGuild = harness.guilds[0]
+            guild.fetch_member = fetch_missing_member
+
+            member = LeavingMember(harness, guild, api.answer)
+            guild.add_member(member)
+
+            await harness.cog.handle_joins(member)
+
+            await bot.verification_events.flush()
+            passed = await VerificationEvent.filter(
+                user_id=member.id, type_=VerificationEventType.PASSED
+            ).count()
+        finally:
+            await bot.captcha_backend.close()
+            await runner.cleanup()
+            await Tortoise.close_connections()
+
+        assert passed == 1
+        assert guild.verified_role not in member.roles
+
+    asyncio.run(run())
@@ -0,0 +1,95 @@
+"""Checks how many settings queries a verification costs
+
+Runs a DM verification through the `Verify` cog, with the load harness' fake
+discord objects, against the mock captcha API and an in-memory sqlite database
+set up by the migrations.
+"""
+
+import argparse
+import asyncio
+
+from tortoise import Tortoise
+
+from benchmarks import mock_captcha_api
+from benchmarks.verification_load import FakeBot, FakeMember, LoadHarness
+from captcha import CaptchaApiClient, HttpCaptchaBackend
+from migrations import migrate
+from models import Guild, VerificationEvent, VerificationEventType
+from utils.cache import settings_cache
+from utils.db import get_tortoise_config
+
+
+class QueryCounter:
+    """Counts the queries made through a connection touching the settings tables"""
+
+    def __init__(self, client):
+        self.queries = []
+
+        for name in ("execute_query", "execute_query_dict"):
+            setattr(client, name, self._wrap(getattr(client, name)))
+
+    def _wrap(self, execute):
+        async def wrapper(query, *args, **kwargs):
+            self.queries.append(query)
+            return await execute(query, *args, **kwargs)
+
+        return wrapper
+
+    @property
+    def settings_queries(self):
+        return [
+            query
+            for query in self.queries
+            if 'FROM "guild"' in query or 'FROM "config"' in query
+        ]
+
+
+async def run_verifications(count: int) -> QueryCounter:
+    settings_cache.clear()
+    await Tortoise.init(config=get_tortoise_config("sqlite://:memory:"))
+
+    api = mock_captcha_api.MockCaptchaApi()
+    runner, api_url = await mock_captcha_api.start_server(api)
+
+    bot = FakeBot(HttpCaptchaBackend(CaptchaApiClient(api_url)), pool_size=0)
+    harness = LoadHarness(
+        argparse.Namespace(guilds=1, think_time=0.0, answer=api.answer), bot
+    )
+
+    try:
+        await migrate()
+        await harness.create_guilds()
+
+        guild = harness.guilds[0]
+        counter = QueryCounter(Guild._meta.db)
+
+        for _ in range(count):
+            member = FakeMember(harness, guild, api.answer)
+            guild.add_member(member)
+
+            await harness.cog.handle_joins(member)
+
+            await bot.verification_events.flush()
+            passed = await VerificationEvent.filter(
+                user_id=member.id, type_=VerificationEventType.PASSED
+            ).count()
+            assert passed == 1
+            assert guild.verified_role in member.roles
+    finally:
+        await bot.captcha_backend.close()
+        await runner.cleanup()
+        await Tortoise.close_connections()
+
+    return counter
+
+
+def test_verification_loads_settings_once():
+    counter = asyncio.run(run_verifications(1))
+
+    assert len(counter.settings_queries) == 1, counter.settings_queries
+
+
+def test_later_verifications_use_cached_settings():
+    counter = asyncio.run(run_verifications(3))
+
+    assert len(counter.settings_queries) == 1, counter.settings_queries